@@ -0,0 +1,264 @@
+"""Admission control for outbound Waves requests: concurrency and rate limits with per-tenant fair queuing."""
+import logging
+from mcp.server.lowlevel.server import request_ctx
+import asyncio
+import contextlib
+import time
+import heapq
+import itertools
+import contextvars
+
+from config import (
+    WAVES_MAX_CONCURRENCY, WAVES_MAX_QUEUE, WAVES_RATE_BURST, WAVES_RATE_LIMIT, WAVES_TENANT_WEIGHTS
+)
+from errors import WavesApiError
+from diskio import run_io
+
+logger = logging.getLogger(__name__)
+
+# --- Admission control: concurrency, rate limiting and fair queuing ---
+# Tenant and priority of the current tool call; tools (e.g. ttsBatch) may override them.
+waves_tenant = contextvars.ContextVar("waves_tenant", default=None)
+waves_priority = contextvars.ContextVar("waves_priority", default="interactive")
+# Per-call timing accumulator; ttsToWav installs a dict to report queue wait vs upstream time.
+waves_timings = contextvars.ContextVar("waves_timings", default=None)
+
+class AdmissionRejected(WavesApiError):
+    """Raised when the outbound request queue is full; the request never reached the upstream."""
+
+def current_tenant():
+    """Tenant for fair queuing: an explicit override, the MCP client_id, or the MCP session."""
+    tenant = waves_tenant.get()
+    if tenant:
+        return tenant
+    try:
+        ctx = request_ctx.get()
+    except LookupError:
+        return "default"
+    client_id = getattr(ctx.meta, "client_id", None) if ctx.meta else None
+    return client_id or f"session-{id(ctx.session):x}"
+
+def parse_tenant_weights(value):
+    """Parse "tenantA=3,tenantB=1" into a weight mapping."""
+    weights = {}
+    for item in (value or "").split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() and weight.strip():
+            try:
+                weights[name.strip()] = max(float(weight), 0.01)
+            except ValueError:
+                logger.warning(f"Ignoring invalid tenant weight: {item}")
+    return weights
+
+class WavesScheduler:
+    """
+    Admission control in front of every outbound Waves request.
+
+    At most `max_concurrency` requests are in flight and, when `rate` > 0, requests start
+    no faster than a token bucket of `rate` per second with `burst` capacity. Waiting requests
+    are served by strict priority class ("interactive" before "batch") and, within a class, by
+    weighted fair queuing across tenants (start-time virtual finish tags, unit cost per
+    request), so one busy tenant cannot starve others. At most `max_queue` requests may wait;
+    beyond that acquire() raises AdmissionRejected immediately.
+    """
+    PRIORITIES = ("interactive", "batch")
+
+    def __init__(self, max_concurrency, max_queue, rate, burst, tenant_weights=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tenant_weights = tenant_weights or {}
+        self.active = 0
+        self.queued = 0
+        self.tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._queues = {p: [] for p in self.PRIORITIES}  # heaps of (finish_tag, seq, tenant, future)
+        self._virtual_time = {p: 0.0 for p in self.PRIORITIES}
+        self._finish_tags = {}  # (priority, tenant) -> last finish tag
+        self._seq = itertools.count()
+        self._timer = None
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = {p: 0.0 for p in self.PRIORITIES}
+        self.wait_max = {p: 0.0 for p in self.PRIORITIES}
+        self.wait_count = {p: 0 for p in self.PRIORITIES}
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _has_token(self):
+        if self.rate <= 0:
+            return True
+        self._refill()
+        return self.tokens >= 1.0
+
+    def _take(self):
+        self.active += 1
+        self.admitted += 1
+        if self.rate > 0:
+            self.tokens -= 1.0
+
+    def _record_wait(self, priority, wait):
+        self.wait_count[priority] += 1
+        self.wait_total[priority] += wait
+        self.wait_max[priority] = max(self.wait_max[priority], wait)
+
+    async def acquire(self, tenant, priority="interactive"):
+        """Wait for an admission slot. Returns the time spent queued, in seconds."""
+        if priority not in self._queues:
+            priority = "interactive"
+        if self.queued == 0 and self.active < self.max_concurrency and self._has_token():
+            self._take()
+            self._record_wait(priority, 0.0)
+            return 0.0
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(
+                "Outbound Waves request queue is full",
+                status_code=429,
+                reason="Queue Full",
+                text=f"{self.queued} requests already waiting; try again later."
+            )
+        start = time.monotonic()
+        weight = self.tenant_weights.get(tenant, 1.0)
+        key = (priority, tenant)
+        tag = max(self._virtual_time[priority], self._finish_tags.get(key, 0.0)) + 1.0 / weight
+        self._finish_tags[key] = tag
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority], (tag, next(self._seq), tenant, future))
+        self.queued += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the waiter was cancelled: hand the slot back
+                self.release()
+            else:
+                future.cancel()
+                self.queued -= 1
+            raise
+        wait = time.monotonic() - start
+        self._record_wait(priority, wait)
+        return wait
+
+    def try_acquire(self):
+        """Take a slot only if one and a rate token are free right now and nobody is waiting."""
+        if self.queued == 0 and self.active < self.max_concurrency and self._has_token():
+            self._take()
+            return True
+        return False
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _next_queue(self):
+        for priority in self.PRIORITIES:
+            queue = self._queues[priority]
+            while queue and queue[0][3].done():
+                heapq.heappop(queue)  # cancelled waiter
+            if queue:
+                return priority, queue
+        return None, None
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency:
+            priority, queue = self._next_queue()
+            if queue is None:
+                return
+            if not self._has_token():
+                self._schedule_refill()
+                return
+            tag, _, _, future = heapq.heappop(queue)
+            self.queued -= 1
+            self._virtual_time[priority] = tag
+            self._take()
+            future.set_result(None)
+
+    def _schedule_refill(self):
+        if self._timer is not None:
+            return
+        delay = (1.0 - self.tokens) / self.rate
+
+        def wake():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = asyncio.get_running_loop().call_later(delay, wake)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant, priority="interactive"):
+        wait = await self.acquire(tenant, priority)
+        try:
+            yield wait
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rate_limit": self.rate,
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queue_wait": {
+                p: {
+                    "count": self.wait_count[p],
+                    "mean_seconds": (self.wait_total[p] / self.wait_count[p]) if self.wait_count[p] else 0.0,
+                    "max_seconds": self.wait_max[p],
+                }
+                for p in self.PRIORITIES
+            },
+        }
+
+class SharedRateScheduler(WavesScheduler):
+    """
+    WavesScheduler whose token bucket lives in the SharedState database, so the combined
+    request rate of all workers stays within WAVES_RATE_LIMIT. Queued requests claim tokens
+    from the shared bucket on the disk I/O pool, one claim in flight at a time; concurrency
+    limits and fair queuing stay per worker.
+    """
+
+    def __init__(self, state, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state = state
+        self.tokens = 0.0
+        self._claim_task = None
+
+    def _refill(self):
+        pass  # tokens only come from the shared bucket
+
+    def _schedule_refill(self):
+        if self._timer is not None or self._claim_task is not None:
+            return
+        self._claim_task = asyncio.get_running_loop().create_task(self._claim())
+
+    async def _claim(self):
+        want = max(1, min(self.queued, int(self.burst)))
+        try:
+            granted, wait = await run_io(self.state.take_tokens, "waves", want, self.rate, self.burst)
+        except Exception as e:
+            logger.warning(f"Failed to claim rate limit tokens from shared state: {e}")
+            granted, wait = 0, 1.0 / self.rate
+        self._claim_task = None
+        self.tokens += granted
+        if granted:
+            self._dispatch()
+        elif self.queued:
+            def wake():
+                self._timer = None
+                self._dispatch()
+            self._timer = asyncio.get_running_loop().call_later(wait, wake)
+
+scheduler_args = (
+    WAVES_MAX_CONCURRENCY, WAVES_MAX_QUEUE, WAVES_RATE_LIMIT, WAVES_RATE_BURST,
+    parse_tenant_weights(WAVES_TENANT_WEIGHTS)
+)
+waves_scheduler = WavesScheduler(*scheduler_args)  # replaced by a SharedRateScheduler in init_resources() with shared state
@@ -0,0 +1,888 @@
+"""Audio handling: WAV parsing and streaming to disk, clone samples, long-form stitching, encoding and post-processing."""
+import logging
+import os
+import base64
+from starlette.responses import StreamingResponse
+import httpx
+import wave
+import hashlib
+import struct
+import re
+import io
+import asyncio
+import contextlib
+import concurrent.futures
+import importlib.util
+import time
+
+from config import (
+    AUDIO_MAX_SAMPLE_RATE, AUDIO_MIN_SAMPLE_RATE, AUDIO_PROCESS_WORKERS, AUDIO_TRIM_PAD_MS,
+    AUDIO_TRIM_THRESHOLD_DB, CLONE_MAX_UPLOAD_BYTES, METRICS_ENABLED, TTS_STREAM_CHUNK_SIZE
+)
+from errors import WavesApiError
+from metrics import endpoint_label, tts_stage_duration, waves_bytes
+from diskio import AsyncFileWriter, finish_file, run_io, temp_path_for, unlink_quietly
+from waves import waves_api
+
+logger = logging.getLogger(__name__)
+
+class LazyModule:
+    """
+    Placeholder for a heavy dependency that is only needed on some request paths. The first
+    attribute access imports the module (under the regular import lock, so threads are safe)
+    and rebinds the global name to it, so later calls pay nothing.
+    """
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+np = LazyModule("numpy", "np")  # audio processing only; preloaded in the background on startup
+
+# --- Streaming WAV download ---
+class AudioValidationError(Exception):
+    """Raised when synthesized audio is empty or not a valid WAV stream."""
+
+class WavHeaderParser:
+    """
+    Incremental RIFF/WAVE header parser fed with the first bytes of a stream.
+
+    Once the 'fmt ' and 'data' chunk headers have been seen, `done` is True and the
+    format fields are available, so validation and duration need no read-back of the file.
+    """
+    MAX_HEADER_BYTES = 64 * 1024
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.done = False
+        self.audio_format = None
+        self.channels = None
+        self.sample_rate = None
+        self.sample_width = None
+        self.data_offset = None
+        self.data_size = None
+
+    def feed(self, chunk):
+        """Consume the next bytes of the stream. Raises AudioValidationError on a non-RIFF stream."""
+        if self.done:
+            return
+        self._buf.extend(chunk)
+        if len(self._buf) >= 12 and (self._buf[:4] != b'RIFF' or self._buf[8:12] != b'WAVE'):
+            raise AudioValidationError("missing RIFF header")
+        if len(self._buf) < 4 and bytes(self._buf) != b'RIFF'[:len(self._buf)]:
+            raise AudioValidationError("missing RIFF header")
+        self._parse()
+        if not self.done and len(self._buf) > self.MAX_HEADER_BYTES:
+            # Give up on metadata but keep the (RIFF-valid) stream
+            logger.warning("WAV data chunk not found in the first bytes of the stream")
+            self.done = True
+        if self.done:
+            self._buf = bytearray()
+
+    def _parse(self):
+        offset = 12
+        while offset + 8 <= len(self._buf):
+            chunk_id = bytes(self._buf[offset:offset + 4])
+            chunk_size = struct.unpack_from('<I', self._buf, offset + 4)[0]
+            body = offset + 8
+            if chunk_id == b'fmt ':
+                if body + 16 > len(self._buf):
+                    return
+                audio_format, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', self._buf, body)
+                self.audio_format = audio_format
+                self.channels = channels
+                self.sample_rate = rate
+                self.sample_width = (bits + 7) // 8
+            elif chunk_id == b'data':
+                self.data_offset = body
+                self.data_size = chunk_size
+                self.done = True
+                return
+            offset = body + chunk_size + (chunk_size & 1)
+
+    def duration(self, total_bytes):
+        """Duration in seconds given the total stream length, or None if the format is unknown."""
+        if not (self.sample_rate and self.channels and self.sample_width) or self.data_offset is None:
+            return None
+        available = max(total_bytes - self.data_offset, 0)
+        # Streamed WAVs may carry a placeholder (0 or 0xFFFFFFFF) data size
+        data_size = self.data_size if 0 < self.data_size <= available else available
+        return data_size / float(self.sample_rate * self.channels * self.sample_width)
+
+async def stream_wav_to_file(resp, file_path):
+    """
+    Stream a streaming-mode Waves response into file_path.
+
+    Chunks are written through an AsyncFileWriter (disk I/O pool) to a temporary file in the
+    same directory as they arrive and atomically renamed into place once the stream completes,
+    so peak memory stays at a few chunks regardless of audio length. The RIFF check and duration come from the header bytes
+    seen while streaming. The response is always closed.
+
+    Returns:
+        A tuple (size_in_bytes, duration_seconds_or_None).
+
+    Raises:
+        AudioValidationError: If the stream is empty or not a WAV.
+        OSError: If the file cannot be written.
+    """
+    writer = AsyncFileWriter(file_path)
+    header = WavHeaderParser()
+    total = 0
+    validate_time = write_time = 0.0
+    started = time.perf_counter()
+    try:
+        await writer.open()
+        try:
+            async for chunk in resp.aiter_bytes(TTS_STREAM_CHUNK_SIZE):
+                t0 = time.perf_counter()
+                header.feed(chunk)
+                t1 = time.perf_counter()
+                await writer.write(chunk)
+                validate_time += t1 - t0
+                write_time += time.perf_counter() - t1
+                total += len(chunk)
+        except httpx.RequestError as exc:
+            logger.error(f"HTTPX RequestError while streaming {resp.url}: {exc}")
+            raise WavesApiError(f"Network error while streaming audio from {resp.url}: {exc}") from exc
+        if total == 0:
+            raise AudioValidationError("empty audio response")
+        if total < 12:
+            raise AudioValidationError("missing RIFF header")
+        await writer.commit()
+    except BaseException:
+        await writer.discard()
+        raise
+    finally:
+        await resp.aclose()
+        if METRICS_ENABLED:
+            waves_bytes.inc(total, endpoint=endpoint_label(resp.url), direction="received")
+            tts_stage_duration.observe(time.perf_counter() - started - validate_time - write_time, stage="download")
+            tts_stage_duration.observe(validate_time, stage="validate")
+            tts_stage_duration.observe(write_time, stage="write")
+    duration = header.duration(total)
+    if duration is None:
+        logger.warning(f"Could not read WAV duration from stream header for {file_path}")
+    return total, duration
+
+class AudioStreamResponse(StreamingResponse):
+    """StreamingResponse that always finalizes its body generator, also on client disconnect."""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+# --- Clone sample upload ---
+_BASE64_BODY = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+_WHITESPACE = re.compile(r'\s')
+
+class Base64Reader(io.RawIOBase):
+    """
+    Read-only, seekable file object that decodes a base64 string on demand.
+
+    httpx reads multipart file fields in small chunks, so the decoded audio is never held in
+    memory as a whole. The decoded length is known up front, which lets httpx send a
+    Content-Length instead of falling back to chunked encoding.
+    """
+
+    def __init__(self, encoded):
+        self._encoded = encoded
+        padding = len(encoded) - len(encoded.rstrip("="))
+        self._size = len(encoded) // 4 * 3 - padding
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = min(max(offset, 0), self._size)
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._size - self._pos
+        end = min(self._pos + size, self._size)
+        if end <= self._pos:
+            return b""
+        # Decode whole 4-character groups covering [pos, end) and trim to the requested range
+        first_group, last_group = self._pos // 3, (end + 2) // 3
+        decoded = base64.b64decode(self._encoded[first_group * 4:last_group * 4])
+        start = self._pos - first_group * 3
+        data = decoded[start:start + end - self._pos]
+        self._pos = end
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def open_clone_sample(content):
+    """
+    Validate a clone sample and return (reader, size) for streaming it into the upload.
+
+    Base64 strings are checked for alphabet and length without decoding them in full; only the
+    leading bytes are decoded to validate the WAV header. Raw bytes are wrapped as-is.
+
+    Raises:
+        ValueError: If the content is not valid base64, exceeds CLONE_MAX_UPLOAD_BYTES or is not a WAV.
+    """
+    if isinstance(content, str):
+        if _WHITESPACE.search(content):
+            content = _WHITESPACE.sub("", content)
+        if len(content) % 4 or not _BASE64_BODY.fullmatch(content):
+            raise ValueError("Invalid base64 content: not a valid base64 string")
+        reader = Base64Reader(content)
+    elif isinstance(content, (bytes, bytearray)):
+        reader = io.BytesIO(content)
+    else:
+        raise ValueError(f"Unsupported file content type: {type(content).__name__}")
+
+    size = reader.seek(0, io.SEEK_END)
+    reader.seek(0)
+    if size > CLONE_MAX_UPLOAD_BYTES:
+        raise ValueError(f"File too large: {size} bytes (maximum is {CLONE_MAX_UPLOAD_BYTES})")
+
+    header = WavHeaderParser()
+    try:
+        header.feed(reader.read(WavHeaderParser.MAX_HEADER_BYTES))
+    except AudioValidationError as e:
+        raise ValueError(f"Invalid WAV file: {e}") from e
+    if not header.sample_rate or header.data_offset is None:
+        raise ValueError("Invalid WAV file: missing fmt or data chunk")
+    reader.seek(0)
+    return reader, size
+
+# --- Long-form synthesis ---
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?\u2026\u3002\uff01\uff1f])\s+|\n+')
+_CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:\u2014\uff0c\uff1b])\s+')
+_SAMPLE_DTYPES = {1: 'u1', 2: '<i2', 4: '<i4'}
+
+def split_text_for_synthesis(text, max_chars):
+    """
+    Split text into chunks of at most max_chars, preferring sentence boundaries,
+    then clause boundaries, then whitespace. Sentences are packed greedily so
+    chunks stay close to max_chars.
+    """
+    def pieces(segment, boundaries):
+        if len(segment) <= max_chars:
+            return [segment]
+        if not boundaries:
+            words = segment.split()
+            if len(words) > 1:
+                return pack(words, " ")
+            return [segment[i:i + max_chars] for i in range(0, len(segment), max_chars)]
+        parts = [p for p in boundaries[0].split(segment) if p and p.strip()]
+        if len(parts) == 1:
+            return pieces(segment, boundaries[1:])
+        out = []
+        for part in parts:
+            out.extend(pieces(part, boundaries[1:]))
+        return pack(out, " ")
+
+    def pack(parts, sep):
+        chunks, current = [], ""
+        for part in parts:
+            if len(part) > max_chars:
+                chunks.extend(c for c in [current] if c)
+                chunks.extend(pieces(part, []))
+                current = ""
+            elif current and len(current) + len(sep) + len(part) > max_chars:
+                chunks.append(current)
+                current = part
+            else:
+                current = f"{current}{sep}{part}" if current else part
+        if current:
+            chunks.append(current)
+        return chunks
+
+    text = text.strip()
+    if not text:
+        return []
+    return [c.strip() for c in pieces(text, [_SENTENCE_BOUNDARY, _CLAUSE_BOUNDARY]) if c.strip()]
+
+def decode_wav_bytes(content):
+    """Decode a WAV byte string into (params, frames) with frames shaped (n_frames, channels)."""
+    if content[:4] != b'RIFF':
+        raise AudioValidationError("missing RIFF header")
+    try:
+        with wave.open(io.BytesIO(content), 'rb') as wf:
+            params = wf.getparams()
+            raw = wf.readframes(params.nframes)
+    except (wave.Error, EOFError) as e:
+        raise AudioValidationError(f"unreadable WAV data: {e}") from e
+    dtype = _SAMPLE_DTYPES.get(params.sampwidth)
+    if dtype is None:
+        raise AudioValidationError(f"unsupported sample width: {params.sampwidth}")
+    frames = np.frombuffer(raw, dtype=dtype)
+    frames = frames[:len(frames) - len(frames) % params.nchannels].reshape(-1, params.nchannels)
+    return params, frames
+
+def crossfade_frames(tail, head):
+    """Linearly crossfade two equal-length frame blocks, returning the mixed block in the input dtype."""
+    ramp = np.linspace(0.0, 1.0, len(head), endpoint=False)[:, None]
+    mixed = tail.astype(np.float64) * (1.0 - ramp) + head.astype(np.float64) * ramp
+    info = np.iinfo(tail.dtype)
+    return np.clip(np.rint(mixed), info.min, info.max).astype(tail.dtype)
+
+async def synthesize_long_form(endpoint_url, payload, chunks, file_path, max_concurrency, crossfade_ms=0.0, pause_ms=0.0):
+    """
+    Synthesize text chunks concurrently and stitch them into a single WAV at file_path.
+
+    Requests run over the shared Waves client with at most max_concurrency in flight. Chunks
+    are written in order as soon as each one and its predecessors are available, so only
+    out-of-order results are held in memory. Adjacent chunks are joined with pause_ms of
+    silence, or with a crossfade_ms linear crossfade when no pause is requested. The output is
+    written to a temporary file and atomically renamed into place.
+
+    Returns:
+        A tuple (size_in_bytes, duration_seconds).
+
+    Raises:
+        WavesApiError: If any chunk request fails.
+        AudioValidationError: If a chunk is not a valid WAV or formats differ between chunks.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch(index, chunk_text):
+        chunk_payload = dict(payload, text=chunk_text, add_wav_header=True)
+        async with semaphore:
+            logger.debug(f"Synthesizing long-form chunk {index + 1}/{len(chunks)} ({len(chunk_text)} chars)")
+            resp = await waves_api(
+                endpoint_url,
+                method="POST",
+                headers={"Content-Type": "application/json"},
+                json_payload=chunk_payload
+            )
+            return decode_wav_bytes(resp.content)
+
+    tasks = [asyncio.create_task(fetch(i, c)) for i, c in enumerate(chunks)]
+    tmp_path = temp_path_for(file_path)
+    total_frames = 0
+    f = out = None
+    try:
+        # The wave writer is used by this task only, one call at a time, on the disk I/O pool
+        f = await run_io(open, tmp_path, 'wb')
+        out = wave.open(f, 'wb')
+        fmt = None
+        pending_tail = None
+        for index, task in enumerate(tasks):
+            params, frames = await task
+            if fmt is None:
+                fmt = (params.nchannels, params.sampwidth, params.framerate)
+                out.setnchannels(params.nchannels)
+                out.setsampwidth(params.sampwidth)
+                out.setframerate(params.framerate)
+                fade = int(params.framerate * crossfade_ms / 1000.0) if not pause_ms else 0
+                if fade and params.sampwidth == 1:
+                    logger.warning("Crossfade is not supported for 8-bit audio, concatenating instead")
+                    fade = 0
+                silence = np.zeros((int(params.framerate * pause_ms / 1000.0), params.nchannels), dtype=frames.dtype)
+            elif (params.nchannels, params.sampwidth, params.framerate) != fmt:
+                raise AudioValidationError(f"chunk {index + 1} audio format {params.nchannels}ch/{params.sampwidth * 8}bit/{params.framerate}Hz does not match the first chunk")
+
+            # Frames for this chunk are joined and handed to the pool in one write
+            parts = []
+            if pending_tail is not None:
+                overlap = min(fade, len(pending_tail), len(frames))
+                if overlap:
+                    parts.append(pending_tail[:len(pending_tail) - overlap])
+                    parts.append(crossfade_frames(pending_tail[len(pending_tail) - overlap:], frames[:overlap]))
+                    total_frames += len(pending_tail)
+                    frames = frames[overlap:]
+                else:
+                    parts.append(pending_tail)
+                    total_frames += len(pending_tail)
+                if len(silence):
+                    parts.append(silence)
+                    total_frames += len(silence)
+
+            # Hold back the tail of the current chunk so it can be crossfaded with the next one
+            keep = min(fade, len(frames)) if index < len(tasks) - 1 else 0
+            parts.append(frames[:len(frames) - keep])
+            total_frames += len(frames) - keep
+            pending_tail = frames[len(frames) - keep:]
+            await run_io(out.writeframes, b"".join(p.tobytes() for p in parts))
+        await run_io(out.close)
+        await run_io(finish_file, f, tmp_path, file_path)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if out is not None:
+            # Close the writer now; left to the garbage collector it writes to the closed file
+            with contextlib.suppress(Exception):
+                await run_io(out.close)
+        if f is not None:
+            await run_io(f.close)
+        await run_io(unlink_quietly, tmp_path)
+        raise
+    size = await run_io(os.path.getsize, file_path)
+    return size, total_frames / float(fmt[2])
+
+# --- Audio encoding ---
+# Formats ttsToWav can store. The upstream always returns PCM WAV; the others are encoded
+# locally in the audio executor. G.711 (mu-law/A-law) is the 8 kHz telephony codec.
+OUTPUT_FORMATS = {
+    "wav": {"codec": "pcm", "extension": ".wav", "mimeType": "audio/wav"},
+    "flac": {"codec": "flac", "extension": ".flac", "mimeType": "audio/flac"},
+    "mulaw": {"codec": "mulaw", "extension": ".wav", "mimeType": "audio/wav", "sample_rate": 8000},
+    "alaw": {"codec": "alaw", "extension": ".wav", "mimeType": "audio/wav", "sample_rate": 8000},
+}
+WAV_FORMAT_TAGS = {1: "pcm", 6: "alaw", 7: "mulaw", 0xFFFE: "pcm"}
+FLAC_BLOCK_SIZE = 4096
+FLAC_MAX_PARTITION_ORDER = 6
+FLAC_MAX_FIXED_ORDER = 4
+
+def _crc_table(poly, width):
+    top, mask = 1 << (width - 1), (1 << width) - 1
+    table = []
+    for byte in range(256):
+        crc = byte << (width - 8)
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & mask if crc & top else (crc << 1) & mask
+        table.append(crc)
+    return table
+
+_CRC8_TABLE = _crc_table(0x07, 8)
+_CRC16_TABLE = _crc_table(0x8005, 16)
+
+def flac_crc8(data):
+    crc = 0
+    for byte in data:
+        crc = _CRC8_TABLE[crc ^ byte]
+    return crc
+
+def flac_crc16(data):
+    crc, table = 0, _CRC16_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+def _bits(value, width):
+    """MSB-first bits of an unsigned integer as a uint8 array."""
+    return np.array([(value >> i) & 1 for i in range(width - 1, -1, -1)], dtype=np.uint8)
+
+def _bits_array(values, width):
+    """MSB-first bits of each value (two's complement within width), concatenated."""
+    shifts = np.arange(width - 1, -1, -1, dtype=np.int64)
+    return ((values.astype(np.int64)[:, None] >> shifts) & 1).astype(np.uint8).ravel()
+
+def _utf8_number(n):
+    """FLAC frame number coding (UTF-8 extended to 36 bits)."""
+    if n < 0x80:
+        return bytes([n])
+    length = 2
+    while n >= 1 << (5 * length + 1):
+        length += 1
+    tail = [0x80 | ((n >> (6 * i)) & 0x3F) for i in range(length - 2, -1, -1)]
+    return bytes([((0xFF << (8 - length)) & 0xFF) | (n >> (6 * (length - 1)))] + tail)
+
+def _rice_partitions(residual, order, block_size):
+    """
+    Pick the Rice partition order and per-partition parameters that minimize the coded size.
+    Returns (partition_order, params, bits).
+    """
+    u = (residual << 1) ^ (residual >> 63)  # zigzag to unsigned
+    full = np.concatenate([np.zeros(order, dtype=np.int64), u])
+    best = None
+    for p in range(FLAC_MAX_PARTITION_ORDER + 1):
+        if block_size % (1 << p) or (block_size >> p) <= order:
+            break
+        parts = full.reshape(1 << p, -1)
+        counts = np.full(1 << p, block_size >> p)
+        counts[0] -= order
+        mean = parts.sum(axis=1) / counts
+        params = np.clip(np.floor(np.log2(np.maximum(mean, 1.0))), 0, 30).astype(np.int64)
+        bits = int(((parts >> params[:, None]).sum(axis=1) + counts * (params + 1)).sum()) + 5 * (1 << p)
+        if best is None or bits < best[2]:
+            best = (p, params, bits)
+    return best
+
+def _rice_bits(residual, order, partition_order, params, block_size):
+    """Residual section (RICE2 method) of a fixed-predictor subframe as a bit array."""
+    u = ((residual << 1) ^ (residual >> 63)).astype(np.int64)
+    size = block_size >> partition_order
+    index = np.arange(order, block_size)
+    k = params[index // size]
+    first = np.zeros(len(u), dtype=bool)
+    first[np.maximum(np.arange(1 << partition_order) * size - order, 0)] = True
+    prefix = np.where(first, 5, 0)
+    q = u >> k
+    lengths = prefix + q + 1 + k
+    starts = np.cumsum(lengths) - lengths
+    bits = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    heads = starts[first]
+    for j in range(5):
+        bits[heads + j] = (params >> (4 - j)) & 1
+    stop = starts + prefix + q
+    bits[stop] = 1
+    for j in range(int(k.max()) if len(k) else 0):
+        mask = k > j
+        bits[stop[mask] + 1 + j] = (u[mask] >> (k[mask] - 1 - j)) & 1
+    return np.concatenate([_bits(0b01, 2), _bits(partition_order, 4), bits])
+
+def flac_subframe(x, bps):
+    """Smallest of a CONSTANT, FIXED (orders 0-4, Rice coded) or VERBATIM subframe, as a bit array."""
+    n = len(x)
+    if (x == x[0]).all():
+        return np.concatenate([_bits(0, 8), _bits_array(x[:1], bps)])
+    verbatim_bits = n * bps
+    best = None
+    residual = x
+    for order in range(min(FLAC_MAX_FIXED_ORDER, n - 1) + 1):
+        if order:
+            residual = np.diff(residual)
+        choice = _rice_partitions(residual, order, n)
+        if choice is None:
+            continue
+        bits = choice[2] + order * bps + 6
+        if best is None or bits < best[0]:
+            best = (bits, order, residual, choice)
+    if best is None or best[0] >= verbatim_bits:
+        return np.concatenate([_bits(0b00000010, 8), _bits_array(x, bps)])
+    _, order, residual, (partition_order, params, _) = best
+    return np.concatenate([
+        _bits((0b001000 | order) << 1, 8),
+        _bits_array(x[:order], bps),
+        _rice_bits(residual, order, partition_order, params, n),
+    ])
+
+def encode_flac(frames, sample_rate, bps):
+    """
+    Encode signed integer frames shaped (n_frames, channels) as a FLAC stream (fixed block
+    size, fixed linear predictors, partitioned Rice residuals). NumPy does the per-sample work.
+    """
+    n_frames, channels = frames.shape
+    frames = frames.astype(np.int64)
+    sample_codes = {8: 0b001, 16: 0b100}
+    body = []
+    frame_sizes = []
+    for number, start in enumerate(range(0, n_frames, FLAC_BLOCK_SIZE)):
+        block = frames[start:start + FLAC_BLOCK_SIZE]
+        n = len(block)
+        header = bytearray(b"\xff\xf8")
+        header.append((0b1100 if n == FLAC_BLOCK_SIZE else 0b0111) << 4)  # sample rate from STREAMINFO
+        header.append(((channels - 1) << 4) | (sample_codes[bps] << 1))
+        header += _utf8_number(number)
+        if n != FLAC_BLOCK_SIZE:
+            header += struct.pack(">H", n - 1)
+        header.append(flac_crc8(header))
+        bits = np.concatenate([flac_subframe(block[:, c], bps) for c in range(channels)])
+        frame = bytes(header) + np.packbits(bits).tobytes()
+        frame += struct.pack(">H", flac_crc16(frame))
+        body.append(frame)
+        frame_sizes.append(len(frame))
+    block_size = min(FLAC_BLOCK_SIZE, max(16, n_frames))
+    md5 = hashlib.md5(frames.astype("<i1" if bps == 8 else "<i2").tobytes()).digest()
+    info = (
+        struct.pack(">HH", block_size, block_size)
+        + (min(frame_sizes, default=0)).to_bytes(3, "big") + (max(frame_sizes, default=0)).to_bytes(3, "big")
+        + ((sample_rate << 44) | ((channels - 1) << 41) | ((bps - 1) << 36) | n_frames).to_bytes(8, "big")
+        + md5
+    )
+    return b"".join([b"fLaC", bytes([0x80]), len(info).to_bytes(3, "big"), info] + body)
+
+def linear16(frames):
+    """Integer PCM frames of any supported width as 16-bit linear samples (int64)."""
+    width = frames.dtype.itemsize
+    frames = frames.astype(np.int64)
+    if width == 1:
+        return (frames - 128) << 8
+    return frames >> (8 * (width - 2))
+
+_MULAW_SEGMENT_ENDS = (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF)
+_ALAW_SEGMENT_ENDS = (0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF)
+
+def encode_mulaw(samples):
+    """G.711 mu-law encode 16-bit linear samples (14-bit magnitude, segment table as in the reference coder)."""
+    pcm = samples >> 2
+    negative = pcm < 0
+    mask = np.where(negative, 0x7F, 0xFF)
+    pcm = np.minimum(np.where(negative, -pcm, pcm), 8159) + 0x21
+    segment = np.searchsorted(_MULAW_SEGMENT_ENDS, pcm)
+    value = (segment << 4) | ((pcm >> (np.minimum(segment, 7) + 1)) & 0x0F)
+    value = np.where(segment >= 8, 0x7F, value)
+    return ((value ^ mask) & 0xFF).astype(np.uint8)
+
+def encode_alaw(samples):
+    """G.711 A-law encode 16-bit linear samples (13-bit magnitude, segment table as in the reference coder)."""
+    pcm = samples >> 3
+    negative = pcm < 0
+    mask = np.where(negative, 0x55, 0xD5)
+    pcm = np.where(negative, -pcm - 1, pcm)
+    segment = np.searchsorted(_ALAW_SEGMENT_ENDS, pcm)
+    value = (segment << 4) | ((pcm >> np.clip(segment, 1, 7)) & 0x0F)
+    value = np.where(segment >= 8, 0x7F, value)
+    return ((value ^ mask) & 0xFF).astype(np.uint8)
+
+def g711_wav(codes, sample_rate, codec):
+    """WAV file bytes for G.711 codes shaped (n_frames, channels), with the fact chunk non-PCM WAVs require."""
+    n_frames, channels = codes.shape
+    tag = 7 if codec == "mulaw" else 6
+    data = codes.tobytes()
+    pad = b"\x00" if len(data) & 1 else b""
+    fmt = struct.pack("<HHIIHHH", tag, channels, sample_rate, sample_rate * channels, channels, 8, 0)
+    chunks = b"".join([
+        b"fmt ", struct.pack("<I", len(fmt)), fmt,
+        b"fact", struct.pack("<II", 4, n_frames),
+        b"data", struct.pack("<I", len(data)), data, pad,
+    ])
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+def encode_audio(frames, sample_rate, sample_width, codec):
+    """
+    Encode integer PCM frames shaped (n_frames, channels) into file bytes for codec.
+
+    Raises:
+        AudioValidationError: If the codec cannot represent the input.
+    """
+    if codec == "flac":
+        if sample_width == 1:
+            return encode_flac(frames.astype(np.int64) - 128, sample_rate, 8)
+        if sample_width == 2:
+            return encode_flac(frames, sample_rate, 16)
+        raise AudioValidationError(f"FLAC output supports 8- and 16-bit PCM, not {8 * sample_width}-bit")
+    if codec in ("mulaw", "alaw"):
+        linear = linear16(frames)
+        return g711_wav(encode_mulaw(linear) if codec == "mulaw" else encode_alaw(linear), sample_rate, codec)
+    raise AudioValidationError(f"unsupported codec: {codec}")
+
+def probe_audio_header(head):
+    """
+    Identify stored audio from its first bytes: RIFF/WAVE (PCM, mu-law or A-law) or FLAC.
+
+    Returns:
+        The codec name ("pcm", "mulaw", "alaw" or "flac").
+
+    Raises:
+        AudioValidationError: If the bytes are not a supported audio file.
+    """
+    if head[:4] == b"fLaC":
+        if len(head) < 8 or head[4] & 0x7F != 0 or int.from_bytes(head[5:8], "big") != 34:
+            raise AudioValidationError("FLAC stream without STREAMINFO")
+        return "flac"
+    parser = WavHeaderParser()
+    parser.feed(head)
+    if parser.audio_format is None:
+        raise AudioValidationError("WAV 'fmt ' chunk not found")
+    codec = WAV_FORMAT_TAGS.get(parser.audio_format)
+    if codec is None:
+        raise AudioValidationError(f"unsupported WAV format tag: {parser.audio_format}")
+    return codec
+
+# --- Audio post-processing ---
+_FULL_SCALE = {1: 128.0, 2: 32768.0, 4: 2147483648.0}
+audio_executor = None
+
+def get_audio_executor():
+    """Thread pool for CPU-bound audio processing (NumPy releases the GIL for the heavy work)."""
+    global audio_executor
+    if audio_executor is None:
+        audio_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, AUDIO_PROCESS_WORKERS), thread_name_prefix="audio")
+    return audio_executor
+
+def shutdown_audio_executor():
+    """Stop the audio thread pool, dropping queued work (called on app shutdown)."""
+    global audio_executor
+    if audio_executor is not None:
+        audio_executor.shutdown(wait=False, cancel_futures=True)
+        audio_executor = None
+
+def audio_post_spec(resample_rate=None, normalize_db=None, trim_silence=False, peak_limit_db=None, output_format=None):
+    """
+    Validate ttsToWav post-processing arguments. output_format is a locally encoded
+    OUTPUT_FORMATS entry (anything but "wav"); G.711 formats default resample_rate to 8 kHz.
+
+    Returns:
+        A dictionary of the requested stages (part of the cache key), or None if none are requested.
+
+    Raises:
+        ValueError: If an argument is out of range.
+    """
+    spec = {}
+    if resample_rate is not None:
+        if not AUDIO_MIN_SAMPLE_RATE <= int(resample_rate) <= AUDIO_MAX_SAMPLE_RATE:
+            raise ValueError(f"resample_rate must be between {AUDIO_MIN_SAMPLE_RATE} and {AUDIO_MAX_SAMPLE_RATE} Hz.")
+        spec["resample_rate"] = int(resample_rate)
+    if normalize_db is not None:
+        if not -70.0 <= float(normalize_db) <= 0.0:
+            raise ValueError("normalize_db must be between -70 and 0 dBFS.")
+        spec["normalize_db"] = float(normalize_db)
+    if trim_silence:
+        spec["trim_silence"] = {"threshold_db": AUDIO_TRIM_THRESHOLD_DB, "pad_ms": AUDIO_TRIM_PAD_MS}
+    if peak_limit_db is not None:
+        if not -40.0 <= float(peak_limit_db) <= 0.0:
+            raise ValueError("peak_limit_db must be between -40 and 0 dBFS.")
+        spec["peak_limit_db"] = float(peak_limit_db)
+    if output_format is not None and output_format != "wav":
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"outputFormat must be one of: {', '.join(OUTPUT_FORMATS)}.")
+        spec["format"] = output_format
+        default_rate = OUTPUT_FORMATS[output_format].get("sample_rate")
+        if default_rate and "resample_rate" not in spec:
+            spec["resample_rate"] = default_rate
+    return spec or None
+
+def pcm_to_float(frames):
+    """Convert integer PCM frames to float64 in [-1, 1)."""
+    width = frames.dtype.itemsize
+    if width == 1:
+        return (frames.astype(np.float64) - 128.0) / _FULL_SCALE[1]
+    return frames.astype(np.float64) / _FULL_SCALE[width]
+
+def float_to_pcm(samples, sample_width):
+    """Convert float samples to integer PCM of sample_width bytes, rounding and clipping to full scale."""
+    scale = _FULL_SCALE[sample_width]
+    ints = np.clip(np.rint(samples * scale), -scale, scale - 1)
+    if sample_width == 1:
+        return (ints + 128.0).astype(np.uint8)
+    return ints.astype(_SAMPLE_DTYPES[sample_width])
+
+def resample_poly(samples, source_rate, target_rate, zero_crossings=16, block=16384):
+    """
+    Polyphase resampling of float samples shaped (n_frames, channels) from source_rate to target_rate.
+
+    The rate ratio is reduced to up/down factors L/M and a Kaiser-windowed sinc low-pass is split
+    into L phases, so each output frame costs one dot product of about 2 * zero_crossings taps
+    instead of filtering the L-times upsampled signal. Output frames are computed in blocks to
+    bound the size of the gathered tap matrix.
+    """
+    if source_rate == target_rate or not len(samples):
+        return samples
+    g = np.gcd(source_rate, target_rate)
+    up, down = target_rate // g, source_rate // g
+    cutoff = 0.5 / max(up, down)  # cycles per sample at the upsampled rate
+    half = zero_crossings * max(up, down)
+    n = np.arange(-half, half + 1)
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * n) * np.kaiser(len(n), 8.6) * up
+    taps = -(-len(h) // up)
+    phases = np.zeros(taps * up)
+    phases[:len(h)] = h
+    phases = phases.reshape(taps, up).T  # phases[r, k] = h[r + k * up]
+
+    n_out = -(-len(samples) * up // down)
+    padded = np.concatenate([np.zeros((taps, samples.shape[1])), samples, np.zeros((taps, samples.shape[1]))])
+    out = np.empty((n_out, samples.shape[1]))
+    k = np.arange(taps)
+    for start in range(0, n_out, block):
+        pos = np.arange(start, min(start + block, n_out)) * down + half
+        base, phase = pos // up, pos % up
+        index = np.clip(base[:, None] - k[None, :] + taps, 0, len(padded) - 1)
+        out[start:start + len(pos)] = np.einsum('nk,nkc->nc', phases[phase], padded[index])
+    return out
+
+def trim_silence_frames(samples, sample_rate, threshold_db, pad_ms, window_ms=10.0):
+    """Drop leading and trailing windows whose RMS is below threshold_db, keeping pad_ms around speech."""
+    window = max(1, int(sample_rate * window_ms / 1000.0))
+    count = len(samples) // window
+    if not count:
+        return samples
+    power = np.square(samples[:count * window]).reshape(count, window, -1).mean(axis=(1, 2))
+    loud = np.flatnonzero(power > 10.0 ** (threshold_db / 10.0))
+    if not len(loud):
+        return samples  # nothing but silence; leave it to the caller rather than return empty audio
+    pad = int(sample_rate * pad_ms / 1000.0)
+    start = max(0, loud[0] * window - pad)
+    end = min(len(samples), (loud[-1] + 1) * window + pad)
+    return samples[start:end]
+
+def normalize_loudness(samples, sample_rate, target_db, block_ms=400.0, gate_db=-70.0):
+    """
+    Scale samples so their gated RMS level is target_db dBFS. Levels are measured over
+    block_ms blocks and blocks quieter than gate_db are ignored, as in LUFS measurement
+    (without the K-weighting filter), so pauses do not pull the level down.
+    """
+    if not len(samples):
+        return samples
+    block = max(1, int(sample_rate * block_ms / 1000.0))
+    count = max(1, len(samples) // block)
+    power = np.square(samples[:count * block]).reshape(count, -1).mean(axis=1)
+    gated = power[power > 10.0 ** (gate_db / 10.0)]
+    if not len(gated):
+        return samples
+    level_db = 10.0 * np.log10(gated.mean())
+    return samples * 10.0 ** ((target_db - level_db) / 20.0)
+
+def limit_peaks(samples, sample_rate, ceiling_db, lookahead_ms=5.0):
+    """
+    Look-ahead peak limiter: the gain needed to keep each frame under ceiling_db is spread
+    with a sliding minimum and then smoothed with a shorter moving average, so gain changes
+    ramp in ahead of peaks instead of hard clipping them.
+    """
+    ceiling = 10.0 ** (ceiling_db / 20.0)
+    peak = np.abs(samples).max(axis=1)
+    if not len(peak) or peak.max() <= ceiling:
+        return samples
+    gain = np.minimum(1.0, ceiling / np.maximum(peak, 1e-12))
+    reach = max(1, int(sample_rate * lookahead_ms / 1000.0))
+    spread = np.lib.stride_tricks.sliding_window_view(np.pad(gain, reach, mode='edge'), 2 * reach + 1).min(axis=1)
+    smooth = np.convolve(np.pad(spread, reach, mode='edge'), np.ones(2 * reach + 1) / (2 * reach + 1), mode='valid')
+    return np.clip(samples * smooth[:, None], -ceiling, ceiling)
+
+def process_audio_file(source_path, file_path, target_rate=None, spec=None):
+    """
+    Apply post-processing stages to the WAV at source_path and write the result to file_path.
+    Stages run in order: silence trim, resample, loudness normalization, peak limiting, then
+    encoding to spec["format"] if one is set. A format-only spec skips the float conversion.
+    Blocking; run it in the audio executor.
+
+    Returns:
+        A tuple (size_in_bytes, duration_seconds).
+
+    Raises:
+        AudioValidationError: If the source is not a supported PCM WAV.
+    """
+    spec = spec or {}
+    with open(source_path, 'rb') as f:
+        params, frames = decode_wav_bytes(f.read())
+    rate = params.framerate
+    target_rate = spec.get("resample_rate") or target_rate or rate
+    if target_rate != rate or spec.keys() - {"format", "resample_rate"}:
+        samples = pcm_to_float(frames)
+        if "trim_silence" in spec:
+            samples = trim_silence_frames(samples, rate, spec["trim_silence"]["threshold_db"], spec["trim_silence"]["pad_ms"])
+        samples = resample_poly(samples, rate, target_rate)
+        if "normalize_db" in spec:
+            samples = normalize_loudness(samples, target_rate, spec["normalize_db"])
+        if "peak_limit_db" in spec:
+            samples = limit_peaks(samples, target_rate, spec["peak_limit_db"])
+        frames = float_to_pcm(samples, params.sampwidth)
+
+    codec = OUTPUT_FORMATS[spec.get("format", "wav")]["codec"]
+    tmp_path = temp_path_for(file_path)
+    try:
+        f = open(tmp_path, 'wb')
+        try:
+            if codec == "pcm":
+                with wave.open(f, 'wb') as out:
+                    out.setnchannels(params.nchannels)
+                    out.setsampwidth(params.sampwidth)
+                    out.setframerate(target_rate)
+                    out.writeframes(frames.tobytes())
+            else:
+                f.write(encode_audio(frames, target_rate, params.sampwidth, codec))
+        except BaseException:
+            f.close()
+            raise
+        finish_file(f, tmp_path, file_path)
+    except BaseException:
+        unlink_quietly(tmp_path)
+        raise
+    return os.path.getsize(file_path), len(frames) / float(target_rate)
@@ -0,0 +1,143 @@
+"""
+Local stand-in for the Waves API, used by the benchmark harness (benchmarks/run.py).
+
+Serves get_speech, get_voices, get_cloned_voices, add_voice and delete for any model
+with configurable latency, audio payload size and error injection, so server.py can be
+load tested without an API key or quota. Run it directly to point a real server at it:
+
+    python benchmarks/mock_waves.py --port 9000 --latency-ms 150 --error-rate 0.01
+    WAVES_API_BASE_URL=http://127.0.0.1:9000 WAVES_API_KEY=test python server.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import struct
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+def wav_header(data_size, sample_rate, channels=1, sample_width=2):
+    """Canonical 44-byte PCM WAV header."""
+    block_align = channels * sample_width
+    return b"".join([
+        b"RIFF", struct.pack("<I", 36 + data_size), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8),
+        b"data", struct.pack("<I", data_size),
+    ])
+
+def create_app(latency_ms=100.0, jitter_ms=0.0, error_rate=0.0, error_status=503,
+               audio_seconds=None, seconds_per_char=0.06, chunk_size=16 * 1024, voices=50):
+    """
+    Build the mock Waves ASGI app.
+
+    Args:
+        latency_ms: Delay before each response starts.
+        jitter_ms: Uniform random extra delay added to latency_ms.
+        error_rate: Fraction of requests answered with error_status instead.
+        error_status: HTTP status used for injected errors (429 and 503 carry Retry-After: 0).
+        audio_seconds: Fixed get_speech audio length; by default it scales with the text.
+        seconds_per_char: Audio length per text character when audio_seconds is not set.
+        chunk_size: Size of the streamed get_speech body chunks.
+        voices: Number of voices returned by get_voices.
+    """
+    clones = {}
+    silence = bytes(chunk_size)
+
+    async def delay():
+        await asyncio.sleep((latency_ms + random.uniform(0.0, jitter_ms)) / 1000.0)
+
+    def injected_error():
+        if error_rate and random.random() < error_rate:
+            headers = {"Retry-After": "0"} if error_status in (429, 503) else None
+            return JSONResponse({"error": "injected failure"}, status_code=error_status, headers=headers)
+        return None
+
+    async def get_speech(request):
+        body = await request.json()
+        await delay()
+        error = injected_error()
+        if error is not None:
+            return error
+        sample_rate = int(body.get("sample_rate", 24000))
+        seconds = audio_seconds if audio_seconds is not None else len(body.get("text", "")) * seconds_per_char
+        data_size = int(seconds * sample_rate) * 2
+
+        async def stream():
+            yield wav_header(data_size, sample_rate)
+            remaining = data_size
+            while remaining > 0:
+                n = min(remaining, chunk_size)
+                yield silence[:n]
+                remaining -= n
+
+        return StreamingResponse(stream(), media_type="audio/wav", headers={"Content-Length": str(44 + data_size)})
+
+    async def get_voices(request):
+        await delay()
+        model = request.path_params["model"]
+        return injected_error() or JSONResponse({"voices": [
+            {
+                "voiceId": f"{model}-voice-{i}",
+                "displayName": f"Voice {i}",
+                "tags": {"language": [["english", "hindi"][i % 2]], "gender": ["female", "male"][i % 2], "accent": "neutral"},
+            }
+            for i in range(voices)
+        ]})
+
+    async def get_cloned_voices(request):
+        await delay()
+        return injected_error() or JSONResponse({"voices": list(clones.values())})
+
+    async def add_voice(request):
+        # Count the multipart body instead of parsing it (no python-multipart dependency)
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        await delay()
+        error = injected_error()
+        if error is not None:
+            return error
+        voice_id = f"clone-{uuid.uuid4().hex[:12]}"
+        clones[voice_id] = {"voiceId": voice_id, "displayName": voice_id, "size": size}
+        return JSONResponse({"message": "Voice cloned successfully", "data": {"voiceId": voice_id}})
+
+    async def delete_voice(request):
+        body = json.loads(await request.body() or b"{}")
+        await delay()
+        error = injected_error()
+        if error is not None:
+            return error
+        clones.pop(body.get("voiceId"), None)
+        return JSONResponse({"message": "Voice deleted successfully"})
+
+    return Starlette(routes=[
+        Route("/api/v1/{model}/get_speech", get_speech, methods=["POST"]),
+        Route("/api/v1/{model}/get_voices", get_voices, methods=["GET"]),
+        Route("/api/v1/{model}/get_cloned_voices", get_cloned_voices, methods=["GET"]),
+        Route("/api/v1/{model}/add_voice", add_voice, methods=["POST"]),
+        Route("/api/v1/{model}", delete_voice, methods=["DELETE"]),
+    ])
+
+def add_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="delay before each response (default: 100)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform random extra delay (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail (default: 0)")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures (default: 503)")
+    parser.add_argument("--audio-seconds", type=float, default=None, help="fixed get_speech audio length (default: scales with text)")
+    parser.add_argument("--voices", type=int, default=50, help="number of voices returned by get_voices (default: 50)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Waves API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    app = create_app(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        error_status=args.error_status, audio_seconds=args.audio_seconds, voices=args.voices,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,252 @@
+"""
+Offline benchmark for server.py against a local mock of the Waves API.
+
+Starts benchmarks/mock_waves.py in a subprocess, points WAVES_API_BASE_URL at it and
+drives the MCP tools through FastMCP's call_tool (argument validation and result
+conversion included) at a fixed concurrency. Prints a JSON report with throughput,
+latency percentiles, RSS and open file descriptors per scenario, so runs can be diffed
+or compared with --baseline.
+
+    python benchmarks/run.py --scenarios tts,list_voices --requests 500 --concurrency 32
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --baseline before.json --max-regression 10
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+from mock_waves import add_arguments, wav_header  # noqa: E402
+
+def clone_sample(kb):
+    """Base64 encoded silent WAV of about kb kilobytes."""
+    data_size = kb * 1024
+    return base64.b64encode(wav_header(data_size, 24000) + bytes(data_size)).decode()
+
+# name -> (tool, function of the request number returning the tool arguments)
+SCENARIOS = {
+    "tts": ("ttsToWav", lambda i, a: {"text": f"Benchmark utterance number {i}. " * a.text_repeat, "voiceId": "lightning-voice-0"}),
+    "tts_cached": ("ttsToWav", lambda i, a: {"text": "Benchmark cached utterance. " * a.text_repeat, "voiceId": "lightning-voice-0"}),
+    "tts_long_form": ("ttsToWav", lambda i, a: {"text": f"Long form benchmark sentence {i}. " * 40, "voiceId": "lightning-voice-0", "long_form": True}),
+    "list_voices": ("listVoices", lambda i, a: {"model": "lightning"}),
+    "find_voices": ("findVoices", lambda i, a: {"model": "lightning", "language": "hindi", "limit": 10}),
+    "list_clones": ("listClones", lambda i, a: {"model": "lightning-large"}),
+    "create_clone": ("createClone", lambda i, a: {"displayName": f"bench-{i}", "file": {"name": "voice.wav", "type": "audio/wav", "content": a.sample}, "model": "lightning-large"}),
+    "delete_clone": ("deleteClone", lambda i, a: {"model": "lightning-large", "voiceId": f"clone-{i}"}),
+}
+
+def rss_bytes():
+    """Current resident set size, from /proc where available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def open_fds():
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_mock(args, port):
+    command = [
+        sys.executable, os.path.join(HERE, "mock_waves.py"), "--port", str(port),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+        "--voices", str(args.voices),
+    ]
+    if args.audio_seconds is not None:
+        command += ["--audio-seconds", str(args.audio_seconds)]
+    proc = subprocess.Popen(command)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/v1/lightning/get_cloned_voices", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("mock Waves server did not start")
+
+def is_error(content):
+    """True if a call_tool result is an MCP error result from one of our tools."""
+    try:
+        result = json.loads(content[0].text)
+    except (AttributeError, IndexError, ValueError):
+        return False
+    entries = result.get("content") or []
+    return bool(entries) and entries[0].get("type") == "error"
+
+def summarize(latencies):
+    if not latencies:
+        return {}
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+async def run_scenario(server, name, args):
+    tool, make_arguments = SCENARIOS[name]
+    for i in range(args.warmup):
+        await server.mcp.call_tool(tool, make_arguments(-1 - i, args))
+
+    latencies = []
+    errors = 0
+    next_index = 0
+    rss = {"start": rss_bytes(), "peak": rss_bytes()}
+    fds = {"start": open_fds(), "peak": open_fds()}
+
+    async def sample():
+        while True:
+            rss["peak"] = max(rss["peak"] or 0, rss_bytes() or 0) or None
+            fds["peak"] = max(fds["peak"] or 0, open_fds() or 0) or None
+            await asyncio.sleep(0.05)
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < args.requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                failed = is_error(await server.mcp.call_tool(tool, make_arguments(index, args)))
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    rss["end"], fds["end"] = rss_bytes(), open_fds()
+    return {
+        "tool": tool,
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "duration_seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize(latencies),
+        "rss_mb": {k: round(v / 1048576, 2) for k, v in rss.items() if v is not None},
+        "fds": fds,
+    }
+
+def compare(report, baseline, max_regression):
+    """Print per-scenario changes against a baseline report; return False if any exceeds max_regression percent."""
+    ok = True
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        checks = [
+            ("throughput_rps", current["throughput_rps"], previous["throughput_rps"], -1),
+            ("p95_ms", current["latency_ms"].get("p95"), previous["latency_ms"].get("p95"), 1),
+            ("p99_ms", current["latency_ms"].get("p99"), previous["latency_ms"].get("p99"), 1),
+            ("peak_rss_mb", current["rss_mb"].get("peak"), previous["rss_mb"].get("peak"), 1),
+        ]
+        for metric, now, before, worse in checks:
+            if not now or not before:
+                continue
+            change = (now - before) / before * 100.0
+            regressed = max_regression is not None and change * worse > max_regression
+            ok = ok and not regressed
+            print(f"{name:14} {metric:15} {before:12.2f} -> {now:12.2f} ({change:+6.1f}%){'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return ok
+
+async def main(args):
+    port = free_port()
+    work_dir = tempfile.mkdtemp(prefix="waves-bench-")
+    os.environ["WAVES_API_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("WAVES_API_KEY", "benchmark")
+    os.environ["MCP_BASE_PATH"] = work_dir
+    os.environ.setdefault("TTS_CACHE_INDEX_PATH", os.path.join(work_dir, ".tts_cache_index.json"))
+    mock = start_mock(args, port)
+    try:
+        sys.path.insert(0, ROOT)
+        import server
+        server.init_resources()
+        args.sample = clone_sample(args.clone_kb)
+        report = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "commit": subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None,
+            "config": {k: v for k, v in vars(args).items() if k not in ("sample", "baseline", "output")},
+            "scenarios": {},
+        }
+        for name in args.scenarios:
+            report["scenarios"][name] = await run_scenario(server, name, args)
+            print(f"{name}: {report['scenarios'][name]['throughput_rps']} req/s, p99 {report['scenarios'][name]['latency_ms'].get('p99')} ms", file=sys.stderr)
+        report["peak_rss_mb"] = round(peak_rss_bytes() / 1048576, 2)
+        await server.close_http_client()
+        return report
+    finally:
+        mock.terminate()
+        mock.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark server.py tools against a local mock Waves API")
+    parser.add_argument("--scenarios", default="tts,tts_cached,list_voices,create_clone",
+                        type=lambda s: [n.strip() for n in s.split(",") if n.strip()],
+                        help=f"comma-separated scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="tool calls per scenario (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent tool calls (default: 16)")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured calls before each scenario (default: 5)")
+    parser.add_argument("--text-repeat", type=int, default=1, help="repeat the tts text this many times (default: 1)")
+    parser.add_argument("--clone-kb", type=int, default=256, help="size of the createClone sample in KiB (default: 256)")
+    add_arguments(parser)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="with --baseline, exit with status 1 if a metric regresses by more than this percent")
+    args = parser.parse_args()
+    unknown = [n for n in args.scenarios if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    report = asyncio.run(main(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            if not compare(report, json.load(f), args.max_regression):
+                sys.exit(1)
@@ -0,0 +1,164 @@
+"""
+Startup benchmark for server.py.
+
+Measures, over several fresh interpreters, the time to import server.py and the time from
+launching `python server.py` until the first `/` response. No Waves API calls are made;
+WAVES_API_BASE_URL points at an unused local port. Prints a JSON report (median, min and
+max per metric, plus the slowest imports from `python -X importtime`) that can be diffed
+across releases or compared with --baseline.
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --output before.json
+    python benchmarks/startup.py --baseline before.json --max-regression 15
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def server_env(work_dir, port):
+    env = dict(os.environ)
+    env.setdefault("WAVES_API_KEY", "benchmark")
+    env["WAVES_API_BASE_URL"] = f"http://127.0.0.1:{free_port()}"
+    env["MCP_BASE_PATH"] = work_dir
+    env["MCP_HOST"] = "127.0.0.1"
+    env["MCP_PORT"] = str(port)
+    env["MCP_WORKERS"] = "1"
+    return env
+
+def measure_import(env):
+    """Seconds to import server.py in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def get_root(port):
+    """Status of GET / (http.client keeps the probe itself from dominating the measurement)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+    try:
+        conn.request("GET", "/")
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+def measure_first_response(env, port, timeout):
+    """Seconds from launching the server until GET / answers 200."""
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "server.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline:
+            try:
+                if get_root(port) == 200:
+                    return time.perf_counter() - started
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited with status {proc.returncode} before answering")
+            time.sleep(0.005)
+        raise RuntimeError(f"server did not answer within {timeout} seconds")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+def slowest_imports(env, count):
+    """Modules imported directly by server.py with the largest cumulative import time, in milliseconds."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    totals = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        if name.strip() == "server":
+            totals["server (module body)"] = round(int(self_us) / 1000.0, 1)
+        elif name.startswith("   ") and not name.startswith("    "):
+            # One level below server; deeper imports are part of their parent's cumulative time
+            totals[name.strip()] = round(int(cumulative) / 1000.0, 1)
+    return dict(sorted(totals.items(), key=lambda item: -item[1])[:count])
+
+def summarize(samples):
+    return {
+        "median": round(statistics.median(samples), 4),
+        "min": round(min(samples), 4),
+        "max": round(max(samples), 4),
+    }
+
+def compare(report, baseline, max_regression):
+    """Print changes against a baseline report; return False if a median regresses by more than max_regression percent."""
+    ok = True
+    for metric, current in report["metrics"].items():
+        previous = baseline.get("metrics", {}).get(metric)
+        if not previous:
+            continue
+        now, before = current["median"], previous["median"]
+        change = (now - before) / before * 100.0
+        regressed = max_regression is not None and change > max_regression
+        ok = ok and not regressed
+        print(f"{metric:24} {before:8.3f}s -> {now:8.3f}s ({change:+6.1f}%){'  REGRESSION' if regressed else ''}", file=sys.stderr)
+    return ok
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="waves-startup-")
+    port = free_port()
+    env = server_env(work_dir, port)
+    measure_import(env)  # compile and cache bytecode so every run measures the same thing
+    imports = [measure_import(env) for _ in range(args.runs)]
+    print(f"import: median {statistics.median(imports):.3f}s", file=sys.stderr)
+    responses = [measure_first_response(env, port, args.timeout) for _ in range(args.runs)]
+    print(f"first / response: median {statistics.median(responses):.3f}s", file=sys.stderr)
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "commit": subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None,
+        "runs": args.runs,
+        "metrics": {
+            "import_seconds": summarize(imports),
+            "first_response_seconds": summarize(responses),
+        },
+        "slowest_imports_ms": slowest_imports(env, args.top_imports),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark server.py import time and time to first response")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per metric (default: 5)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for the first response (default: 30)")
+    parser.add_argument("--top-imports", type=int, default=10, help="slowest direct imports of server.py to report (default: 10)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="with --baseline, exit with status 1 if a median regresses by more than this percent")
+    args = parser.parse_args()
+
+    report = main(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as f:
+            if not compare(report, json.load(f), args.max_regression):
+                sys.exit(1)
@@ -0,0 +1,187 @@
+"""Voice and clone catalogs: a TTL cache with background refresh and a lookup index for findVoices."""
+import logging
+import json
+import asyncio
+import time
+
+from config import (
+    CATALOG_CACHE_ENABLED, CATALOG_STALE_TTL, CATALOG_TTL, ENDPOINT_MODEL_GET_CLONES,
+    ENDPOINT_MODEL_GET_VOICES
+)
+from diskio import run_io, submit_io
+from waves import waves_get_text
+
+logger = logging.getLogger(__name__)
+
+# --- Voice catalog cache ---
+VOICE_INDEX_FIELDS = ("language", "gender", "accent", "age")
+
+class VoiceIndex:
+    """
+    Lookup index over a voice catalog response ({"voices": [...]} or a bare list).
+
+    Voices are indexed by id and by the VOICE_INDEX_FIELDS found either on the voice or in
+    its "tags" dictionary; values may be strings or lists and are matched case-insensitively.
+    """
+
+    def __init__(self, data):
+        voices = data.get("voices") if isinstance(data, dict) else data
+        self.voices = [v for v in voices if isinstance(v, dict)] if isinstance(voices, list) else []
+        self.by_id = {}
+        self.fields = {field: {} for field in VOICE_INDEX_FIELDS}
+        for position, voice in enumerate(self.voices):
+            voice_id = voice.get("voiceId") or voice.get("voice_id") or voice.get("id")
+            if voice_id:
+                self.by_id[str(voice_id)] = position
+            attributes = dict(voice)
+            if isinstance(voice.get("tags"), dict):
+                attributes.update(voice["tags"])
+            for field in VOICE_INDEX_FIELDS:
+                values = attributes.get(field)
+                for value in values if isinstance(values, list) else [values]:
+                    if isinstance(value, str) and value:
+                        self.fields[field].setdefault(value.lower(), set()).add(position)
+
+    def find(self, voice_id=None, limit=None, **filters):
+        """Return voices matching the id and every given field filter, in catalog order."""
+        if voice_id:
+            position = self.by_id.get(str(voice_id))
+            positions = {position} if position is not None else set()
+        else:
+            positions = None
+        for field, value in filters.items():
+            if not value:
+                continue
+            matches = self.fields.get(field, {}).get(str(value).lower(), set())
+            positions = matches if positions is None else positions & matches
+        ordered = range(len(self.voices)) if positions is None else sorted(positions)
+        results = [self.voices[p] for p in ordered]
+        return results[:limit] if limit else results
+
+class CatalogCache:
+    """
+    In-process TTL cache for voice and clone catalogs, keyed per model.
+
+    Fresh entries (younger than `ttl`) are served directly. Stale entries (younger than
+    `ttl + stale_ttl`) are served immediately while a background refresh runs
+    (stale-while-revalidate). Older or missing entries are fetched inline. Fetches go through
+    waves_get_text, so concurrent misses share one upstream request. Entries hold the raw
+    response text; it is parsed only to build the lookup index.
+
+    With a SharedState, fetched catalogs are published to the shared database and each
+    lookup first adopts a newer snapshot (or an invalidation) recorded by another worker.
+    """
+
+    def __init__(self, ttl, stale_ttl, shared=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.shared = shared
+        self._entries = {}  # key -> {"raw", "fetched_at", "index"}
+        self._refreshing = {}  # key -> background refresh task
+        self._generation = {}  # key -> invalidation counter, guards against stale refreshes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    async def get(self, key, url):
+        if self.shared is not None:
+            await self._sync_shared(key)
+        entry = self._entries.get(key)
+        age = time.time() - entry["fetched_at"] if entry else None
+        if entry is not None and age < self.ttl:
+            self.hits += 1
+            return entry
+        if entry is not None and age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            if key not in self._refreshing:
+                task = asyncio.create_task(self._refresh(key, url))
+                self._refreshing[key] = task
+                task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+            return entry
+        self.misses += 1
+        return await self._fetch(key, url)
+
+    async def _sync_shared(self, key):
+        try:
+            row = await run_io(self.shared.catalog_get, key)
+        except Exception as e:
+            logger.warning(f"Failed to read shared catalog {key}: {e}")
+            return
+        if row is None:
+            return
+        raw, fetched_at, invalidated_at = row
+        entry = self._entries.get(key)
+        if entry is not None and entry["fetched_at"] <= invalidated_at:
+            # Invalidated by another worker
+            self._generation[key] = self._generation.get(key, 0) + 1
+            self._entries.pop(key, None)
+            entry = None
+        if raw is not None and (entry is None or fetched_at > entry["fetched_at"]):
+            self._entries[key] = {"raw": raw, "fetched_at": fetched_at, "index": None}
+
+    async def _fetch(self, key, url):
+        generation = self._generation.get(key, 0)
+        raw = await waves_get_text(url)
+        entry = {"raw": raw, "fetched_at": time.time(), "index": None}
+        if self._generation.get(key, 0) == generation:
+            self._entries[key] = entry
+            if self.shared is not None:
+                submit_io(self.shared.catalog_put, key, raw, entry["fetched_at"])
+        return entry
+
+    async def _refresh(self, key, url):
+        try:
+            await self._fetch(key, url)
+            logger.debug(f"Refreshed catalog {key} in the background")
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh of catalog {key} failed, serving stale data: {e}")
+
+    def index(self, entry):
+        """Voice lookup index for a cached entry, built on first use."""
+        if entry["index"] is None:
+            entry["index"] = VoiceIndex(json.loads(entry["raw"]))
+        return entry["index"]
+
+    def invalidate(self, key):
+        """Drop an entry immediately, e.g. after a clone was created or deleted."""
+        self._generation[key] = self._generation.get(key, 0) + 1
+        if self.shared is not None:
+            submit_io(self.shared.catalog_invalidate, key, time.time())
+        if self._entries.pop(key, None) is not None:
+            logger.info(f"Invalidated catalog cache entry {key}")
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "entries": sorted(self._entries),
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+        }
+
+catalog_cache = CatalogCache(CATALOG_TTL, CATALOG_STALE_TTL) if CATALOG_CACHE_ENABLED else None  # shared by init_resources()
+
+async def get_catalog(kind, model):
+    """
+    Return the catalog entry ({"raw", "index", ...}) for kind "voices" or "clones" and model,
+    from the catalog cache when enabled.
+    """
+    url = (ENDPOINT_MODEL_GET_VOICES if kind == "voices" else ENDPOINT_MODEL_GET_CLONES).format(model=model)
+    key = f"{kind}:{model}"
+    if catalog_cache is None:
+        return {"raw": await waves_get_text(url), "fetched_at": time.time(), "index": None}
+    return await catalog_cache.get(key, url)
+
+def voice_index(entry):
+    if catalog_cache is not None:
+        return catalog_cache.index(entry)
+    return VoiceIndex(json.loads(entry["raw"]))
+
+def invalidate_catalog(kind, model):
+    if catalog_cache is not None:
+        catalog_cache.invalidate(f"{kind}:{model}")
@@ -0,0 +1,142 @@
+"""
+Settings for the server, read from environment variables once at import.
+
+Importing this module also sets up logging for the whole process.
+"""
+import os
+import logging
+
+# --- Configuration ---
+# Set up basic logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# API Configuration
+WAVES_API_BASE_URL = os.getenv("WAVES_API_BASE_URL", "https://waves-api.smallest.ai").rstrip("/")
+WAVES_API_KEY = os.getenv("WAVES_API_KEY")  # required to serve; checked by validate_config() on startup
+
+# Model Endpoints (using f-strings for clarity if base URL might change)
+ENDPOINT_LIGHTNING_GET_SPEECH = f"{WAVES_API_BASE_URL}/api/v1/lightning/get_speech"
+ENDPOINT_LIGHTNING_LARGE_GET_SPEECH = f"{WAVES_API_BASE_URL}/api/v1/lightning-large/get_speech"
+ENDPOINT_MODEL_GET_VOICES = f"{WAVES_API_BASE_URL}/api/v1/{{model}}/get_voices" # Placeholder for model
+ENDPOINT_MODEL_ADD_VOICE = f"{WAVES_API_BASE_URL}/api/v1/{{model}}/add_voice" # Placeholder for model
+ENDPOINT_MODEL_GET_CLONES = f"{WAVES_API_BASE_URL}/api/v1/{{model}}/get_cloned_voices" # Placeholder for model
+ENDPOINT_MODEL_DELETE = f"{WAVES_API_BASE_URL}/api/v1/{{model}}" # Placeholder for model
+
+# Waves HTTP client configuration (connection pool, HTTP/2 and timeouts in seconds)
+WAVES_HTTP_MAX_CONNECTIONS = int(os.getenv("WAVES_HTTP_MAX_CONNECTIONS", "100"))
+WAVES_HTTP_MAX_KEEPALIVE = int(os.getenv("WAVES_HTTP_MAX_KEEPALIVE", "20"))
+WAVES_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("WAVES_HTTP_KEEPALIVE_EXPIRY", "30"))
+WAVES_HTTP2 = os.getenv("WAVES_HTTP2", "false").lower() in ("1", "true", "yes")
+WAVES_CONNECT_TIMEOUT = float(os.getenv("WAVES_CONNECT_TIMEOUT", "5"))
+WAVES_READ_TIMEOUT = float(os.getenv("WAVES_READ_TIMEOUT", "30"))
+WAVES_WRITE_TIMEOUT = float(os.getenv("WAVES_WRITE_TIMEOUT", "30"))
+WAVES_POOL_TIMEOUT = float(os.getenv("WAVES_POOL_TIMEOUT", "10"))
+WAVES_SPEECH_READ_TIMEOUT = float(os.getenv("WAVES_SPEECH_READ_TIMEOUT", "120"))  # get_speech can take long for long texts
+WAVES_UPLOAD_WRITE_TIMEOUT = float(os.getenv("WAVES_UPLOAD_WRITE_TIMEOUT", "120"))  # add_voice uploads audio samples
+
+# Resilience: retries for idempotent calls, hedged get_speech requests and a circuit breaker
+WAVES_RETRY_MAX_ATTEMPTS = int(os.getenv("WAVES_RETRY_MAX_ATTEMPTS", "3"))
+WAVES_RETRY_BASE_DELAY = float(os.getenv("WAVES_RETRY_BASE_DELAY", "0.25"))
+WAVES_RETRY_MAX_DELAY = float(os.getenv("WAVES_RETRY_MAX_DELAY", "8"))
+WAVES_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+WAVES_HEDGE_DELAY = float(os.getenv("WAVES_HEDGE_DELAY", "0"))  # seconds before a duplicate get_speech is sent; 0 disables
+WAVES_BREAKER_FAILURE_THRESHOLD = int(os.getenv("WAVES_BREAKER_FAILURE_THRESHOLD", "5"))
+WAVES_BREAKER_RESET_TIMEOUT = float(os.getenv("WAVES_BREAKER_RESET_TIMEOUT", "30"))
+
+# Admission control for outbound Waves requests
+WAVES_MAX_CONCURRENCY = int(os.getenv("WAVES_MAX_CONCURRENCY", "32"))
+WAVES_MAX_QUEUE = int(os.getenv("WAVES_MAX_QUEUE", "1000"))
+WAVES_RATE_LIMIT = float(os.getenv("WAVES_RATE_LIMIT", "0"))  # requests per second; 0 disables
+WAVES_RATE_BURST = float(os.getenv("WAVES_RATE_BURST", "10"))
+WAVES_TENANT_WEIGHTS = os.getenv("WAVES_TENANT_WEIGHTS", "")  # e.g. "ivr-builder=1,support-agent=4"
+
+# Voice/clone catalog cache (seconds): served fresh for CATALOG_TTL, then stale while refreshing for CATALOG_STALE_TTL
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))
+CATALOG_STALE_TTL = float(os.getenv("CATALOG_STALE_TTL", "3600"))
+
+# Output directory lifecycle: quota/age-based cleanup of the default output directory
+OUTPUT_GC_ENABLED = os.getenv("OUTPUT_GC_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTPUT_MAX_BYTES = int(os.getenv("OUTPUT_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))  # 5 GiB; 0 disables
+OUTPUT_MAX_AGE = float(os.getenv("OUTPUT_MAX_AGE", str(7 * 24 * 3600)))  # seconds; 0 disables
+OUTPUT_MIN_RETENTION = float(os.getenv("OUTPUT_MIN_RETENTION", "600"))  # files just returned to a client are kept at least this long
+OUTPUT_GC_INTERVAL = float(os.getenv("OUTPUT_GC_INTERVAL", "300"))
+OUTPUT_SHARD_DEPTH = int(os.getenv("OUTPUT_SHARD_DEPTH", "2"))
+
+# HTTP audio serving: generated files under the default output directory are served at /audio/
+AUDIO_HTTP_ENABLED = os.getenv("AUDIO_HTTP_ENABLED", "true").lower() in ("1", "true", "yes")
+AUDIO_BASE_URL = os.getenv("AUDIO_BASE_URL", "http://localhost:8000")  # externally reachable URL of this server
+AUDIO_CACHE_MAX_AGE = int(os.getenv("AUDIO_CACHE_MAX_AGE", "86400"))
+# Longest /stream/tts URL ttsStreamUrl hands out; proxies commonly reject request lines over 8 KB
+STREAM_URL_MAX_LENGTH = int(os.getenv("STREAM_URL_MAX_LENGTH", "8000"))
+TTS_URI_TYPE = os.getenv("TTS_URI_TYPE", "file")  # default ttsToWav resource URI: "file" or "http"
+TTS_OUTPUT_FORMAT = os.getenv("TTS_OUTPUT_FORMAT", "wav").lower()  # default ttsToWav outputFormat
+AUDIO_MIME_TYPES = {".wav": "audio/wav", ".flac": "audio/flac"}
+
+# Disk I/O: filesystem work on the request path runs on a bounded worker pool
+DISK_IO_WORKERS = int(os.getenv("DISK_IO_WORKERS", "8"))
+DISK_WRITE_BUFFER = int(os.getenv("DISK_WRITE_BUFFER", str(256 * 1024)))  # bytes batched per write call
+DISK_FSYNC = os.getenv("DISK_FSYNC", "never").lower()  # "never", "file" (fsync before rename) or "full" (also the directory)
+if DISK_FSYNC not in ("never", "file", "full"):
+    logger.warning(f"Unknown DISK_FSYNC value {DISK_FSYNC!r}, using 'never'")
+    DISK_FSYNC = "never"
+
+# Metrics: Prometheus text format at /metrics, plus an event loop lag probe
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# Maximum decoded size of a createClone audio sample
+CLONE_MAX_UPLOAD_BYTES = int(os.getenv("CLONE_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+
+# Output Configuration
+MCP_BASE_PATH = os.getenv("MCP_BASE_PATH", "/tmp")
+logger.info(f"Using MCP_BASE_PATH: {MCP_BASE_PATH}")
+
+def default_output_dir():
+    """Directory ttsToWav writes to when no output_dir is given: ./tmp in the project folder or MCP_BASE_PATH."""
+    return MCP_BASE_PATH if MCP_BASE_PATH != "/tmp" else os.path.abspath(os.path.join(os.path.dirname(__file__), "tmp"))
+
+# Streaming download chunk size for synthesized audio
+TTS_STREAM_CHUNK_SIZE = int(os.getenv("TTS_STREAM_CHUNK_SIZE", str(64 * 1024)))
+
+# Long-form synthesis: text is split into chunks synthesized concurrently and stitched
+TTS_LONG_FORM_CHUNK_CHARS = int(os.getenv("TTS_LONG_FORM_CHUNK_CHARS", "500"))
+TTS_LONG_FORM_CONCURRENCY = int(os.getenv("TTS_LONG_FORM_CONCURRENCY", "4"))
+
+# Audio post-processing (resample, normalize, trim, limit) runs on a dedicated thread pool
+AUDIO_PROCESS_WORKERS = int(os.getenv("AUDIO_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUDIO_TRIM_THRESHOLD_DB = float(os.getenv("AUDIO_TRIM_THRESHOLD_DB", "-50"))
+AUDIO_TRIM_PAD_MS = float(os.getenv("AUDIO_TRIM_PAD_MS", "25"))
+AUDIO_RESAMPLE_FROM_CACHE = os.getenv("AUDIO_RESAMPLE_FROM_CACHE", "true").lower() in ("1", "true", "yes")
+AUDIO_RESAMPLE_SOURCE_RATES = [int(r) for r in os.getenv("AUDIO_RESAMPLE_SOURCE_RATES", "8000,16000,22050,24000,44100,48000").split(",") if r.strip()]
+AUDIO_MIN_SAMPLE_RATE = 8000
+AUDIO_MAX_SAMPLE_RATE = 192000
+
+# Batch synthesis limits for the ttsBatch tool
+TTS_BATCH_MAX_ITEMS = int(os.getenv("TTS_BATCH_MAX_ITEMS", "500"))
+TTS_BATCH_CONCURRENCY = int(os.getenv("TTS_BATCH_CONCURRENCY", "8"))
+
+# Cache pre-warming from phrase packs (warmCache tool and `python server.py warm`)
+TTS_WARMUP_CONCURRENCY = int(os.getenv("TTS_WARMUP_CONCURRENCY", "4"))
+TTS_WARMUP_MAX_ITEMS = int(os.getenv("TTS_WARMUP_MAX_ITEMS", "10000"))
+
+# TTS Cache Configuration
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1 GiB
+TTS_CACHE_MAX_ENTRIES = int(os.getenv("TTS_CACHE_MAX_ENTRIES", "10000"))
+TTS_CACHE_INDEX_PATH = os.getenv("TTS_CACHE_INDEX_PATH", os.path.join(default_output_dir(), ".tts_cache_index.json"))
+TTS_CACHE_SAVE_DELAY = float(os.getenv("TTS_CACHE_SAVE_DELAY", "1"))  # seconds; index changes within this window are written once
+
+# Stateless streamable-HTTP MCP transport, served next to SSE
+MCP_HTTP_ENABLED = os.getenv("MCP_HTTP_ENABLED", "true").lower() in ("1", "true", "yes")
+MCP_HTTP_PATH = os.getenv("MCP_HTTP_PATH", "/mcp")
+STREAMABLE_HTTP_BUFFER = 64  # server messages buffered per request before the session waits
+
+# Multi-worker deployment: MCP_WORKERS > 1 runs worker processes behind a session-sticky router.
+# Workers share the TTS cache, catalogs and rate limit through an SQLite file.
+MCP_HOST = os.getenv("MCP_HOST", "0.0.0.0")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+MCP_WORKER_ID = int(os.getenv("MCP_WORKER_ID", "0"))  # set by the router for each worker
+MCP_SHARED_STATE_PATH = os.getenv("MCP_SHARED_STATE_PATH", "")  # set automatically in multi-worker mode
@@ -0,0 +1,142 @@
+"""Disk I/O off the event loop: a bounded thread pool, atomic file writes and an async file writer."""
+import logging
+import os
+import uuid
+import asyncio
+import concurrent.futures
+
+from config import DISK_FSYNC, DISK_IO_WORKERS, DISK_WRITE_BUFFER
+
+logger = logging.getLogger(__name__)
+
+# --- Disk I/O ---
+# Filesystem work on the request path runs on a bounded thread pool so a slow or
+# network-backed volume delays only the requests writing to it, not the event loop.
+io_executor = None
+
+def get_io_executor():
+    global io_executor
+    if io_executor is None:
+        io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, DISK_IO_WORKERS), thread_name_prefix="disk-io")
+    return io_executor
+
+def shutdown_io_executor():
+    """Wait for queued writes to finish and stop the disk I/O pool (called on app shutdown)."""
+    global io_executor
+    if io_executor is not None:
+        io_executor.shutdown(wait=True)
+        io_executor = None
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking filesystem call on the disk I/O pool."""
+    return await asyncio.wrap_future(get_io_executor().submit(fn, *args, **kwargs))
+
+def submit_io(fn, *args):
+    """Queue a blocking call on the disk I/O pool without waiting for it; a failure is logged."""
+    future = get_io_executor().submit(fn, *args)
+
+    def done(f):
+        if not f.cancelled() and f.exception() is not None:
+            logger.warning(f"Background {getattr(fn, '__name__', fn)} failed: {f.exception()}")
+
+    future.add_done_callback(done)
+    return future
+
+def fsync_dir(directory):
+    """fsync a directory so a rename in it is durable (no-op where directories cannot be opened)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def finish_file(f, tmp_path, file_path):
+    """
+    Close a temporary file and atomically rename it to file_path, applying DISK_FSYNC:
+    "file" syncs the data before the rename, "full" also syncs the directory after it.
+    Blocking; run it on a worker thread.
+    """
+    try:
+        if DISK_FSYNC != "never":
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        f.close()
+    os.replace(tmp_path, file_path)
+    if DISK_FSYNC == "full":
+        fsync_dir(os.path.dirname(file_path) or ".")
+
+def unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to delete {path}: {e}")
+
+def temp_path_for(file_path):
+    """Hidden temporary path next to file_path, renamed into place once the file is complete."""
+    return os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.{uuid.uuid4().hex}.part")
+
+class AsyncFileWriter:
+    """
+    Writes a file through the disk I/O pool without blocking the event loop.
+
+    Data goes to a temporary file next to path. Writes are buffered and flushed in batches of
+    DISK_WRITE_BUFFER bytes; one batch may be in flight while the next one is being filled, so
+    network reads and disk writes overlap, and a slow disk applies backpressure to the caller.
+    commit() renames the finished file into place; discard() removes it.
+    """
+
+    def __init__(self, path, buffer_size=None):
+        self.path = path
+        self.tmp_path = temp_path_for(path)
+        self.buffer_size = buffer_size or DISK_WRITE_BUFFER
+        self.size = 0
+        self._file = None
+        self._buffer = bytearray()
+        self._pending = None  # concurrent.futures.Future of the batch being written
+
+    async def open(self):
+        self._file = await run_io(open, self.tmp_path, "wb")
+        return self
+
+    async def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= self.buffer_size:
+            await self._flush()
+
+    async def _flush(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            await asyncio.wrap_future(pending)
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            self._pending = get_io_executor().submit(self._file.write, data)
+
+    async def commit(self):
+        await self._flush()
+        await self._flush()
+        await run_io(finish_file, self._file, self.tmp_path, self.path)
+        self._file = None
+
+    async def discard(self):
+        """Close and remove the temporary file. Safe to call after a failed or cancelled write."""
+        if self._file is None:
+            return
+        f, pending, self._file, self._pending = self._file, self._pending, None, None
+
+        def abort():
+            if pending is not None:
+                concurrent.futures.wait([pending])
+            f.close()
+            unlink_quietly(self.tmp_path)
+
+        await run_io(abort)
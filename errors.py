@@ -0,0 +1,16 @@
+"""Errors raised for Waves API calls."""
+
+# Custom Exception for Waves API errors
+class WavesApiError(Exception):
+    def __init__(self, message, status_code=None, reason=None, text=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+        self.retry_after = retry_after  # seconds requested by the upstream Retry-After header, if any
+
+    def __str__(self):
+        # Log the full error when it's created/raised might be better than just in __str__
+        full_error_details = f"Status: {self.status_code}, Reason: {self.reason}, Text: {self.text}"
+        # Shorten the string representation for general display
+        return f"WavesApiError: {super().__str__()} (Status: {self.status_code})"
@@ -0,0 +1,134 @@
+"""Prometheus-style metrics: counters, gauges and histograms, and the registry /metrics renders."""
+import logging
+import bisect
+import urllib.parse
+
+from config import (
+    ENDPOINT_LIGHTNING_GET_SPEECH, ENDPOINT_LIGHTNING_LARGE_GET_SPEECH, ENDPOINT_MODEL_ADD_VOICE,
+    ENDPOINT_MODEL_DELETE, ENDPOINT_MODEL_GET_CLONES, ENDPOINT_MODEL_GET_VOICES
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics ---
+# Counters and histograms are plain dict updates on the hot path; gauges are read from
+# existing state only when /metrics is scraped. Rendered in the Prometheus text format.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metric:
+    """A named metric with a fixed set of label names; values are keyed by label value tuples."""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key)) + (extra or [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        return [f"{self.name}{self._labels(key)} {value}" for key, value in self.values.items()]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def samples(self):
+        lines = []
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{self._labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+class Gauge(Metric):
+    """Gauge whose value is computed at scrape time by fn (a number, or a dict of label tuple -> number)."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{self._labels(key)} {v}" for key, v in value.items() if v is not None]
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.warning(f"Failed to collect metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+tool_calls = metrics.register(Counter("mcp_tool_calls_total", "MCP tool calls by outcome.", ("tool", "status")))
+tool_duration = metrics.register(Histogram("mcp_tool_duration_seconds", "MCP tool call duration.", ("tool",)))
+waves_requests = metrics.register(Counter("waves_requests_total", "Waves API request attempts by endpoint and HTTP status ('error' for network failures).", ("endpoint", "method", "status")))
+waves_duration = metrics.register(Histogram("waves_request_duration_seconds", "Waves API request attempt latency until response headers.", ("endpoint", "method")))
+waves_bytes = metrics.register(Counter("waves_bytes_total", "Bytes transferred to and from the Waves API.", ("endpoint", "direction")))
+tts_stage_duration = metrics.register(Histogram("tts_stage_duration_seconds", "Time spent per synthesis stage (download, write, validate, postprocess).", ("stage",)))
+loop_lag = metrics.register(Histogram("event_loop_lag_seconds", "Event loop scheduling delay.", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)))
+
+# Paths of every Waves endpoint for the models this server knows; anything else (free-form
+# model names passed to the voice and clone tools) is labelled "other" to keep metrics bounded.
+ENDPOINT_LABELS = frozenset(
+    urllib.parse.urlsplit(template.format(model=model)).path
+    for template in (ENDPOINT_LIGHTNING_GET_SPEECH, ENDPOINT_LIGHTNING_LARGE_GET_SPEECH, ENDPOINT_MODEL_GET_VOICES,
+                     ENDPOINT_MODEL_ADD_VOICE, ENDPOINT_MODEL_GET_CLONES, ENDPOINT_MODEL_DELETE)
+    for model in ("lightning", "lightning-large")
+)
+
+def endpoint_label(url):
+    """Metric label for a Waves URL: its path if it is a known endpoint, otherwise "other"."""
+    path = urllib.parse.urlsplit(str(url)).path
+    return path if path in ENDPOINT_LABELS else "other"
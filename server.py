@@ -1,103 +1,452 @@
 import os
-import base64
-import requests
 import json
 import logging
-from dotenv import load_dotenv
-from mcp.server.fastmcp import FastMCP
-from starlette.applications import Starlette
-from starlette.responses import PlainTextResponse, StreamingResponse
-import httpx
+from mcp.server.fastmcp import FastMCP, Context
+from mcp.types import (
+    JSONRPCMessage, JSONRPCRequest, JSONRPCResponse, JSONRPCError, ClientRequest, METHOD_NOT_FOUND,
+    INVALID_PARAMS
+)
+from starlette.responses import PlainTextResponse, FileResponse, Response, JSONResponse
 import uuid
-import wave
 import datetime
-import tempfile
+import struct
+import asyncio
+import inspect
+import contextlib
+import sys
+import functools
+import importlib.util
+import time
+import urllib.parse
 
-load_dotenv()
+# .env is read when server.py runs as a program, before config reads the settings (worker
+# processes inherit the result); code that imports server (tests, benchmarks,
+# `uvicorn server:app`) uses the environment as is
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+import admission
+import waves
+import storage
+from config import (
+    AUDIO_BASE_URL, AUDIO_CACHE_MAX_AGE, AUDIO_HTTP_ENABLED, AUDIO_MIME_TYPES, AUDIO_RESAMPLE_FROM_CACHE,
+    AUDIO_RESAMPLE_SOURCE_RATES, ENDPOINT_LIGHTNING_GET_SPEECH, ENDPOINT_LIGHTNING_LARGE_GET_SPEECH,
+    ENDPOINT_MODEL_ADD_VOICE, ENDPOINT_MODEL_DELETE, ENDPOINT_MODEL_GET_CLONES, ENDPOINT_MODEL_GET_VOICES,
+    MCP_HOST, MCP_HTTP_ENABLED, MCP_HTTP_PATH, MCP_PORT, MCP_SHARED_STATE_PATH, MCP_WORKER_ID,
+    MCP_WORKERS, METRICS_ENABLED, METRICS_LOOP_LAG_INTERVAL, OUTPUT_GC_INTERVAL, STREAM_URL_MAX_LENGTH,
+    TTS_BATCH_CONCURRENCY, TTS_BATCH_MAX_ITEMS, TTS_CACHE_ENABLED, TTS_CACHE_INDEX_PATH,
+    TTS_CACHE_MAX_BYTES, TTS_CACHE_MAX_ENTRIES, TTS_LONG_FORM_CHUNK_CHARS, TTS_LONG_FORM_CONCURRENCY,
+    TTS_OUTPUT_FORMAT, TTS_STREAM_CHUNK_SIZE, TTS_URI_TYPE, TTS_WARMUP_CONCURRENCY, TTS_WARMUP_MAX_ITEMS,
+    WAVES_API_KEY, WAVES_RATE_LIMIT, default_output_dir
+)
+from errors import WavesApiError
+from metrics import (
+    endpoint_label, Gauge, loop_lag, metrics, tool_calls, tool_duration, tts_stage_duration, waves_bytes
+)
+from diskio import AsyncFileWriter, get_io_executor, run_io, shutdown_io_executor, unlink_quietly
+from admission import scheduler_args, SharedRateScheduler, waves_priority, waves_timings
+from waves import (
+    close_http_client, get_http_client, http_pool_stats, resilience_stats, single_flight, waves_api
+)
+from audio import (
+    OUTPUT_FORMATS, audio_post_spec, AudioStreamResponse, AudioValidationError, get_audio_executor,
+    open_clone_sample, process_audio_file, shutdown_audio_executor, split_text_for_synthesis,
+    stream_wav_to_file, synthesize_long_form, WavHeaderParser
+)
+from storage import (
+    export_tts_cache, import_tts_cache, output_store_args, OutputStore, place_cached_file,
+    SharedOutputStore, SharedState, SharedTTSCache, tts_cache_key, TTSCache
+)
+from catalog import catalog_cache, get_catalog, invalidate_catalog, voice_index
+from transport import (
+    CLIENT_REQUEST_METHODS, exchange_stateless, jsonrpc_batch_adapter, jsonrpc_error_message,
+    jsonrpc_error_response
+)
+from workers import run_workers
 
-# --- Configuration ---
-# Set up basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# API Configuration
-WAVES_API_BASE_URL = "https://waves-api.smallest.ai"
-WAVES_API_KEY = os.getenv("WAVES_API_KEY")
-if not WAVES_API_KEY:
-    # Log error before raising
-    logger.critical("WAVES_API_KEY environment variable is not set. Server cannot start.")
-    raise RuntimeError("WAVES_API_KEY env variable required")
-
-# Model Endpoints (using f-strings for clarity if base URL might change)
-ENDPOINT_LIGHTNING_GET_SPEECH = f"{WAVES_API_BASE_URL}/api/v1/lightning/get_speech"
-ENDPOINT_LIGHTNING_LARGE_GET_SPEECH = f"{WAVES_API_BASE_URL}/api/v1/lightning-large/get_speech"
-ENDPOINT_GET_VOICES = f"{WAVES_API_BASE_URL}/api/v1/lightning/get_voices" # Assuming lightning for general voices
-ENDPOINT_MODEL_ADD_VOICE = f"{WAVES_API_BASE_URL}/api/v1/{{model}}/add_voice" # Placeholder for model
-ENDPOINT_MODEL_GET_CLONES = f"{WAVES_API_BASE_URL}/api/v1/{{model}}/get_cloned_voices" # Placeholder for model
-ENDPOINT_MODEL_DELETE = f"{WAVES_API_BASE_URL}/api/v1/{{model}}" # Placeholder for model
-
-# Output Configuration
-MCP_BASE_PATH = os.getenv("MCP_BASE_PATH", "/tmp")
-logger.info(f"Using MCP_BASE_PATH: {MCP_BASE_PATH}")
-
-# Custom Exception for Waves API errors
-class WavesApiError(Exception):
-    def __init__(self, message, status_code=None, reason=None, text=None):
-        super().__init__(message)
-        self.status_code = status_code
-        self.reason = reason
-        self.text = text
-
-    def __str__(self):
-        # Log the full error when it's created/raised might be better than just in __str__
-        full_error_details = f"Status: {self.status_code}, Reason: {self.reason}, Text: {self.text}"
-        # Shorten the string representation for general display
-        return f"WavesApiError: {super().__str__()} (Status: {self.status_code})"
-
-# Create a single httpx client for reuse
-http_client = httpx.AsyncClient()
-
-# Wrapper for Waves API calls - now asynchronous
-async def waves_api(path, method="GET", headers=None, json_payload=None, data=None, files=None):
-    """
-    Asynchronous wrapper for all Waves API calls.
-    Uses defined constants for base URL and Authorization header.
-    """
-    headers = headers.copy() if headers else {}
-    headers['Authorization'] = f'Bearer {WAVES_API_KEY}'
-    # Use path directly as it should now contain the full URL from constants
-    url = path # Assuming path is now a full URL like ENDPOINT_GET_VOICES
-    logger.debug(f"Calling Waves API: {method} {url}")
+# --- Tool metrics ---
+tools_in_flight = 0
+event_loop_lag = 0.0
+
+def instrument_tool(fn):
+    """Count and time calls of an MCP tool. Results whose first content entry is an error count as errors."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        global tools_in_flight
+        if not METRICS_ENABLED:
+            return await fn(*args, **kwargs)
+        status = "exception"
+        tools_in_flight += 1
+        started = time.perf_counter()
+        try:
+            result = await fn(*args, **kwargs)
+            content = result.get("content") if isinstance(result, dict) else None
+            status = "error" if content and len(content) == 1 and content[0].get("type") == "error" else "ok"
+            return result
+        finally:
+            tools_in_flight -= 1
+            tool_calls.inc(tool=fn.__name__, status=status)
+            tool_duration.observe(time.perf_counter() - started, tool=fn.__name__)
+    return wrapper
+
+async def monitor_event_loop_lag(interval):
+    """Measure how late the event loop wakes up from a sleep of `interval` seconds, forever."""
+    global event_loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag = max(0.0, loop.time() - started - interval)
+        loop_lag.observe(event_loop_lag)
+
+# --- Synthesis to file ---
+async def synthesize_to_file(endpoint_url, payload, chunks, save_dir, cache_key, max_concurrency, crossfade_ms, pause_ms):
+    """
+    Synthesize one ttsToWav request into a new file in save_dir and return the MCP result.
+
+    Known failures (output directory, invalid audio, write errors) are returned as MCP error
+    results; WavesApiError propagates to the caller. The new file is registered in the TTS
+    cache under cache_key when one is given.
+    """
+    timings = {}
+    timings_token = waves_timings.set(timings)
     try:
-        resp = await http_client.request(method, url, headers=headers, json=json_payload, data=data, files=files)
-        logger.debug(f"Received response: {resp.status_code}")
+        filename = f"tts_{uuid.uuid4().hex}.wav"
+        if storage.output_store is not None and storage.output_store.manages(save_dir):
+            file_path = storage.output_store.path_for(filename)
+        else:
+            file_path = os.path.join(save_dir, filename)
 
-        if not resp.is_success:
+        # Ensure directory exists
+        try:
+            await run_io(os.makedirs, os.path.dirname(file_path), exist_ok=True)
+        except OSError as e:
+            error_msg = f"Failed to create output directory {save_dir}: {e}"
+            logger.error(error_msg)
+            return {"content": [{"type": "error", "message": error_msg}]}
+
+        try:
+            if len(chunks) > 1:
+                logger.info(f"Long-form synthesis of {len(chunks)} chunks (concurrency {max_concurrency}) to {file_path}")
+                size, duration = await synthesize_long_form(
+                    endpoint_url, payload, chunks, file_path, max_concurrency,
+                    crossfade_ms=crossfade_ms, pause_ms=pause_ms
+                )
+            else:
+                # Stream the response body to disk (waves_api ensures success or raises error)
+                resp = await waves_api(
+                    endpoint_url,
+                    method="POST",
+                    headers={"Content-Type": "application/json"},
+                    json_payload=payload,
+                    stream=True
+                )
+                logger.info(f"Streaming audio to {file_path}")
+                size, duration = await stream_wav_to_file(resp, file_path)
+        except AudioValidationError as e:
+            error_msg = f"Invalid WAV file received ({e}): {file_path}"
+            logger.error(error_msg)
+            return {"content": [{"type": "error", "message": error_msg}]}
+        except OSError as e:
+            # Use logger, return MCP error format
+            error_msg = f"Failed to write audio file {file_path}: {e}"
+            logger.error(error_msg)
+            return {"content": [{"type": "error", "message": error_msg}]}
+
+        file_stat = await run_io(os.stat, file_path)
+        created_at = datetime.datetime.fromtimestamp(file_stat.st_ctime).isoformat()
+        logger.info(f"Successfully generated TTS file: {file_path}, Size: {file_stat.st_size}, Duration: {duration}")
+        if storage.output_store is not None:
+            storage.output_store.register(file_path, file_stat.st_size)
+        if cache_key is not None and storage.tts_cache is not None:
+            storage.tts_cache.put(cache_key, file_path, file_stat.st_size, duration, created_at, codec="pcm")
+        return {
+            "content": [{
+                "type": "resource",
+                "resource": {
+                    "uri": f"file://{file_path}",
+                    "filename": filename,
+                    "mimeType": "audio/wav",
+                    "codec": "pcm",
+                    "size": file_stat.st_size,
+                    "duration": duration,
+                    "created_at": created_at
+                }
+            }],
+            "meta": {
+                "output_dir": os.path.dirname(file_path),
+                "cached": False,
+                "queue_wait_seconds": timings.get("queue_wait", 0.0),
+                "upstream_seconds": timings.get("upstream", 0.0)
+            }
+        }
+    finally:
+        waves_timings.reset(timings_token)
+
+async def find_cached_sample_rate(model, payload, variant=None):
+    """
+    Look for cached audio of the same request at another sample rate that can be resampled
+    locally. The lowest cached rate above the requested one is preferred; lower rates are not
+    used since upsampling cannot restore the missing bandwidth.
+
+    Returns:
+        The cache entry, or None.
+    """
+    if storage.tts_cache is None:
+        return None
+    requested = payload.get("sample_rate")
+    for rate in sorted(r for r in AUDIO_RESAMPLE_SOURCE_RATES if requested and r > requested):
+        entry = await storage.tts_cache.lookup(tts_cache_key(model, dict(payload, sample_rate=rate), variant), count=False)
+        if entry is not None:
+            return entry
+    return None
+
+async def postprocess_to_file(source_path, save_dir, cache_key, target_rate=None, spec=None):
+    """
+    Run process_audio_file in the audio executor, writing a new file in save_dir, and return
+    the MCP result. The new file is registered in the TTS cache under cache_key when one is given.
+    """
+    output_format = OUTPUT_FORMATS[(spec or {}).get("format", "wav")]
+    filename = f"tts_{uuid.uuid4().hex}{output_format['extension']}"
+    if storage.output_store is not None and storage.output_store.manages(save_dir):
+        file_path = storage.output_store.path_for(filename)
+    else:
+        file_path = os.path.join(save_dir, filename)
+
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    try:
+        await run_io(os.makedirs, os.path.dirname(file_path), exist_ok=True)
+        size, duration = await loop.run_in_executor(
+            get_audio_executor(), process_audio_file, source_path, file_path, target_rate, spec
+        )
+    except AudioValidationError as e:
+        error_msg = f"Audio post-processing failed ({e}): {source_path}"
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+    except OSError as e:
+        error_msg = f"Failed to write audio file {file_path}: {e}"
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+    elapsed = time.monotonic() - started
+    if METRICS_ENABLED:
+        tts_stage_duration.observe(elapsed, stage="postprocess")
+
+    created_at = datetime.datetime.now().isoformat()
+    logger.info(f"Post-processed {source_path} into {file_path} in {elapsed:.3f}s, Size: {size}, Duration: {duration}")
+    if storage.output_store is not None:
+        storage.output_store.register(file_path, size)
+    if cache_key is not None and storage.tts_cache is not None:
+        storage.tts_cache.put(cache_key, file_path, size, duration, created_at, codec=output_format["codec"])
+    return {
+        "content": [{
+            "type": "resource",
+            "resource": {
+                "uri": f"file://{file_path}",
+                "filename": filename,
+                "mimeType": output_format["mimeType"],
+                "codec": output_format["codec"],
+                "size": size,
+                "duration": duration,
+                "created_at": created_at
+            }
+        }],
+        "meta": {
+            "output_dir": os.path.dirname(file_path),
+            "cached": False,
+            "postprocess_seconds": elapsed
+        }
+    }
+
+# --- TTS request building ---
+def build_tts_request(text, voiceId, model="lightning", language=None, outputFormat="wav", add_wav_header=False,
+                      sample_rate=24000, speed=1.0, consistency=0.5, similarity=0.0, enhancement=1.0):
+    """
+    Select the get_speech endpoint for model and build its payload.
+
+    Returns:
+        A tuple (endpoint_url, payload).
+
+    Raises:
+        ValueError: If the model is unsupported or lightning-large is used without a language.
+    """
+    base_payload = {
+        "text": text,
+        "voice_id": voiceId,
+        "add_wav_header": add_wav_header,
+        "sample_rate": sample_rate,
+        "speed": speed,
+        "consistency": consistency,
+        "similarity": similarity,
+        "enhancement": enhancement,
+        "output_format": outputFormat,
+    }
+
+    # Select endpoint based on model
+    if model == "lightning":
+        return ENDPOINT_LIGHTNING_GET_SPEECH, base_payload
+    if model == "lightning-large":
+        if not language:
+            raise ValueError("Language parameter is required for the lightning-large model.")
+        payload = base_payload.copy()
+        payload["language"] = language
+        return ENDPOINT_LIGHTNING_LARGE_GET_SPEECH, payload
+    raise ValueError(f"Unsupported model requested in ttsToWav: {model}")
+
+# --- Audio resource URIs ---
+def audio_uri(path, uri_type="file"):
+    """
+    Resource URI for a generated file: file:// by default, or an /audio/ URL on this server
+    when uri_type is "http" and the file lives under the served output directory.
+    """
+    if uri_type == "http" and AUDIO_HTTP_ENABLED:
+        root = os.path.realpath(default_output_dir())
+        real = os.path.realpath(path)
+        if real.startswith(root + os.sep):
+            relative = os.path.relpath(real, root).replace(os.sep, "/")
+            return f"{AUDIO_BASE_URL.rstrip('/')}/audio/{urllib.parse.quote(relative)}"
+        logger.warning(f"{path} is outside the served output directory, returning a file URI")
+    return f"file://{path}"
+
+def with_audio_uri(result, uri_type):
+    """Return result with its audio resource URI rewritten for uri_type (results may be shared, so copy)."""
+    content = result.get("content") or []
+    if uri_type == "file" or not content or content[0].get("type") != "resource":
+        return result
+    resource = content[0]["resource"]
+    if not resource.get("uri", "").startswith("file://"):
+        return result
+    resource = dict(resource, uri=audio_uri(resource["uri"][len("file://"):], uri_type))
+    return dict(result, content=[dict(content[0], resource=resource)] + content[1:])
+
+# --- Live audio streaming ---
+def streaming_wav_header(audio_format, channels, sample_rate, sample_width):
+    """WAV header for a stream of unknown length (RIFF and data sizes set to 0xFFFFFFFF)."""
+    block_align = channels * sample_width
+    return b"".join([
+        b"RIFF", struct.pack("<I", 0xFFFFFFFF), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, audio_format or 1, channels, sample_rate,
+                             sample_rate * block_align, block_align, sample_width * 8),
+        b"data", struct.pack("<I", 0xFFFFFFFF),
+    ])
+
+async def open_tts_stream(endpoint_url, payload):
+    """
+    Start a streaming get_speech request and read just enough to parse the WAV header.
+
+    Returns:
+        A tuple (resp, chunks, header, head) where chunks is the response byte iterator
+        positioned after `head`, the bytes already read. The caller must close resp.
+
+    Raises:
+        WavesApiError: If the request fails.
+        AudioValidationError: If the stream is not a WAV with fmt and data chunks.
+    """
+    resp = await waves_api(
+        endpoint_url,
+        method="POST",
+        headers={"Content-Type": "application/json"},
+        json_payload=payload,
+        stream=True
+    )
+    chunks = resp.aiter_bytes(TTS_STREAM_CHUNK_SIZE)
+    header = WavHeaderParser()
+    head = bytearray()
+    try:
+        async for chunk in chunks:
+            head.extend(chunk)
+            header.feed(chunk)
+            if header.done:
+                break
+        if header.data_offset is None or not header.sample_rate:
+            raise AudioValidationError("missing fmt or data chunk")
+    except BaseException:
+        await resp.aclose()
+        raise
+    return resp, chunks, header, bytes(head)
+
+def stream_tts_body(resp, chunks, header, head, cache_key=None, file_path=None):
+    """
+    Async generator relaying upstream audio to the client: a streaming WAV header first,
+    then PCM data as it arrives. Each chunk is yielded only after the client has taken the
+    previous one, so upstream reads are paced by the client (backpressure).
+
+    When file_path is given the raw upstream bytes are also written to a temporary file that
+    is renamed into place and registered in the TTS cache once the stream completes. On a
+    client disconnect or upstream error the partial file is removed and the upstream response
+    is closed.
+    """
+    async def body():
+        tee = None
+        total = 0
+        complete = False
+        try:
+            if file_path is not None:
+                await run_io(os.makedirs, os.path.dirname(file_path), exist_ok=True)
+                tee = await AsyncFileWriter(file_path).open()
+                await tee.write(head)
+            total = len(head)
+            yield streaming_wav_header(header.audio_format, header.channels, header.sample_rate, header.sample_width)
+            if len(head) > header.data_offset:
+                yield head[header.data_offset:]
+            async for chunk in chunks:
+                if tee is not None:
+                    await tee.write(chunk)
+                total += len(chunk)
+                yield chunk
+            complete = True
+        finally:
+            await resp.aclose()
+            if METRICS_ENABLED:
+                waves_bytes.inc(total, endpoint=endpoint_label(resp.url), direction="received")
+            if tee is not None:
+                if complete:
+                    await tee.commit()
+                    duration = header.duration(total)
+                    created_at = datetime.datetime.now().isoformat()
+                    if storage.output_store is not None:
+                        storage.output_store.register(file_path, total)
+                    if storage.tts_cache is not None and cache_key is not None:
+                        storage.tts_cache.put(cache_key, file_path, total, duration, created_at, codec="pcm")
+                    logger.info(f"Streamed {total} bytes and cached them at {file_path}")
+                else:
+                    logger.info(f"Audio stream ended early after {total} bytes, discarding partial file")
+                    await tee.discard()
+    return body()
+
+STREAM_PARAM_TYPES = {
+    "text": str, "voiceId": str, "model": str, "language": str, "outputFormat": str,
+    "sample_rate": int, "speed": float, "consistency": float, "similarity": float,
+    "enhancement": float, "use_cache": bool,
+}
+
+def parse_stream_params(raw):
+    """Coerce query-string or JSON values for /stream/tts to their expected types."""
+    params = {}
+    for name, value in raw.items():
+        kind = STREAM_PARAM_TYPES.get(name)
+        if kind is None:
+            raise ValueError(f"Unknown parameter: {name}")
+        if kind is bool and isinstance(value, str):
+            params[name] = value.lower() in ("1", "true", "yes")
+        else:
             try:
-                error_text = await resp.aread()
-                error_text = error_text.decode('utf-8', errors='replace')
-            except Exception as decode_err:
-                error_text = f"[Could not decode error body: {decode_err}]"
-            # Log the detailed error before raising
-            logger.error(f"Waves API Error: Status={resp.status_code}, Reason={resp.reason_phrase}, URL={url}, Response Text={error_text}")
-            raise WavesApiError(
-                f"Waves API request failed to {url}",
-                status_code=resp.status_code,
-                reason=resp.reason_phrase,
-                text=error_text
-            )
-        return resp
-    except httpx.RequestError as exc:
-        logger.error(f"HTTPX RequestError while calling {url}: {exc}")
-        raise WavesApiError(f"Network error calling Waves API at {url}: {exc}") from exc
-    except Exception as exc:
-        # Catch unexpected errors during the request process
-        logger.exception(f"Unexpected error during Waves API call to {url}: {exc}")
-        raise WavesApiError(f"Unexpected error during API call to {url}") from exc
+                params[name] = kind(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for {name}: {value!r}")
+    if not params.get("text") or not params.get("voiceId"):
+        raise ValueError("text and voiceId are required")
+    if params.get("outputFormat", "wav") != "wav":
+        raise ValueError("/stream/tts only streams WAV; use ttsToWav for other output formats")
+    return params
 
 mcp = FastMCP("smallest-ai-waves")
 
 @mcp.tool()
+@instrument_tool
 async def createClone(
     model: str = "lightning-large",
     displayName: str = "",
@@ -135,75 +484,55 @@ async def createClone(
 
         logger.info(f"File info - name: {file.get('name', 'N/A')}, type: {file.get('type', 'N/A')}")
 
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-            temp_file_path = temp_file.name # Store path for logging/cleanup
-            try:
-                if isinstance(file['content'], str):
-                    logger.info("Decoding base64 content")
-                    try:
-                        wav_bytes = base64.b64decode(file['content'])
-                        logger.info(f"Successfully decoded base64 content, size: {len(wav_bytes)} bytes")
-                    except Exception as decode_err:
-                        error_msg = f"Invalid base64 content: {str(decode_err)}"
-                        logger.error(error_msg)
-                        return {"content": [{"type": "error", "message": error_msg}]}
-                else:
-                    # This case might not be expected anymore if client always sends base64
-                    logger.warning("Received raw bytes content directly, expected base64 string.")
-                    wav_bytes = file['content']
-
-                logger.info(f"Writing {len(wav_bytes)} bytes to temporary file: {temp_file_path}")
-                temp_file.write(wav_bytes)
-                temp_file.flush()
-
-                logger.info("Preparing multipart form data")
-                # Ensure file is opened in binary read mode for httpx
-                with open(temp_file_path, 'rb') as f_for_upload:
-                    files = {'file': ('voice.wav', f_for_upload, 'audio/wav')}
-                    data = {'displayName': displayName}
-
-                    endpoint_url = ENDPOINT_MODEL_ADD_VOICE.format(model=model)
-                    logger.info(f"Making API request to: {endpoint_url}")
-
-                    try:
-                        resp = await waves_api(endpoint_url, method="POST", files=files, data=data)
-                        logger.info(f"API response status: {resp.status_code}")
-                        # Handle successful but potentially error-containing JSON responses if necessary
-                        # Example: if resp.status_code == 200 and 'error' in resp.json(): ...
-                        resp_json = resp.json()
-                        logger.info(f"API response: {resp_json}")
-
-                        return {
-                            "content": [{
-                                "type": "resource",
-                                "resource": {
-                                    "uri": "waves://create-clone",
-                                    "text": json.dumps(resp_json),
-                                    "mimeType": "application/json"
-                                }
-                            }]
-                        }
-                    # Catch WavesApiError specifically to extract details
-                    except WavesApiError as api_err:
-                        # Format detailed error message
-                        error_msg = f"API Request Failed: Status={api_err.status_code}, Reason={api_err.reason}, Details={api_err.text}"
-                        logger.error(error_msg, exc_info=False) # Log concise error message
-                        return {"content": [{"type": "error", "message": error_msg}]}
-                    except Exception as api_err: # Catch other potential request errors
-                        error_msg = f"API request failed unexpectedly: {str(api_err)}"
-                        logger.error(error_msg, exc_info=True)
-                        return {"content": [{"type": "error", "message": error_msg}]}
+        # Validate up front so malformed uploads never reach the network
+        try:
+            sample, size = open_clone_sample(file['content'])
+        except ValueError as e:
+            error_msg = str(e)
+            logger.error(error_msg)
+            return {"content": [{"type": "error", "message": error_msg}]}
+        logger.info(f"Validated clone sample, size: {size} bytes")
 
-            except Exception as e:
-                error_msg = f"Error processing file: {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                return {"content": [{"type": "error", "message": error_msg}]}
-            finally:
-                try:
-                    logger.info(f"Cleaning up temporary file: {temp_file_path}")
-                    os.unlink(temp_file_path)
-                except Exception as unlink_err:
-                    logger.warning(f"Failed to delete temporary file {temp_file_path}: {unlink_err}")
+        logger.info("Preparing multipart form data")
+        # The sample is decoded chunk by chunk as httpx streams the multipart body
+        files = {'file': ('voice.wav', sample, 'audio/wav')}
+        data = {'displayName': displayName}
+
+        endpoint_url = ENDPOINT_MODEL_ADD_VOICE.format(model=model)
+        logger.info(f"Making API request to: {endpoint_url}")
+
+        try:
+            resp = await waves_api(endpoint_url, method="POST", files=files, data=data)
+            logger.info(f"API response status: {resp.status_code}")
+            if METRICS_ENABLED:
+                waves_bytes.inc(size, endpoint=endpoint_label(endpoint_url), direction="sent")
+            # The upstream JSON is forwarded as is, without decoding and re-encoding it
+            resp_text = resp.text
+            logger.info(f"API response: {resp_text}")
+            invalidate_catalog("clones", model)
+
+            return {
+                "content": [{
+                    "type": "resource",
+                    "resource": {
+                        "uri": "waves://create-clone",
+                        "text": resp_text,
+                        "mimeType": "application/json"
+                    }
+                }]
+            }
+        # Catch WavesApiError specifically to extract details
+        except WavesApiError as api_err:
+            # Format detailed error message
+            error_msg = f"API Request Failed: Status={api_err.status_code}, Reason={api_err.reason}, Details={api_err.text}"
+            logger.error(error_msg, exc_info=False) # Log concise error message
+            return {"content": [{"type": "error", "message": error_msg}]}
+        except Exception as api_err: # Catch other potential request errors
+            error_msg = f"API request failed unexpectedly: {str(api_err)}"
+            logger.error(error_msg, exc_info=True)
+            return {"content": [{"type": "error", "message": error_msg}]}
+        finally:
+            sample.close()
 
     except Exception as e:
         # Check if it's a WavesApiError bubbled up
@@ -215,6 +544,7 @@ async def createClone(
         return {"content": [{"type": "error", "message": error_msg}]}
 
 @mcp.tool()
+@instrument_tool
 async def listClones(
     model: str = "lightning-large"
 ) -> dict:
@@ -230,15 +560,14 @@ async def listClones(
     endpoint_url = ENDPOINT_MODEL_GET_CLONES.format(model=model)
     logger.info(f"Listing clones for model: {model} via {endpoint_url}")
     try:
-        resp = await waves_api(endpoint_url)
-        resp_json = resp.json()
+        resp_text = (await get_catalog("clones", model))["raw"]
         logger.info(f"Successfully retrieved clones for model {model}")
         return {
             "content": [{
                 "type": "resource",
                 "resource": {
                     "uri": "waves://clones",
-                    "text": json.dumps(resp_json),
+                    "text": resp_text,
                     "mimeType": "application/json"
                 }
             }]
@@ -247,16 +576,13 @@ async def listClones(
         error_msg = f"Failed to list clones: Status={e.status_code}, Reason={e.reason}, Details={e.text}"
         logger.error(error_msg)
         return {"content": [{"type": "error", "message": error_msg}]}
-    except json.JSONDecodeError as e:
-        error_msg = f"Failed to parse listClones response: {e}"
-        logger.error(error_msg)
-        return {"content": [{"type": "error", "message": error_msg}]}
     except Exception as e:
         error_msg = f"Unexpected error listing clones for model {model}: {str(e)}"
         logger.error(error_msg, exc_info=True)
         return {"content": [{"type": "error", "message": error_msg}]}
 
 @mcp.tool()
+@instrument_tool
 async def deleteClone(
     model: str = "lightning-large",
     voiceId: str = ""
@@ -285,14 +611,14 @@ async def deleteClone(
             headers={"Content-Type": "application/json"},
             json_payload={"voiceId": voiceId}
         )
-        resp_json = resp.json()
+        invalidate_catalog("clones", model)
         logger.info(f"Successfully requested deletion for clone {voiceId}")
         return {
             "content": [{
                 "type": "resource",
                 "resource": {
                     "uri": "waves://delete-clone",
-                    "text": json.dumps(resp_json),
+                    "text": resp.text,
                     "mimeType": "application/json"
                 }
             }]
@@ -301,34 +627,35 @@ async def deleteClone(
         error_msg = f"Failed to delete clone {voiceId}: Status={e.status_code}, Reason={e.reason}, Details={e.text}"
         logger.error(error_msg)
         return {"content": [{"type": "error", "message": error_msg}]}
-    except json.JSONDecodeError as e:
-        error_msg = f"Failed to parse deleteClone response for {voiceId}: {e}"
-        logger.error(error_msg)
-        return {"content": [{"type": "error", "message": error_msg}]}
     except Exception as e:
         error_msg = f"Unexpected error deleting clone {voiceId} for model {model}: {str(e)}"
         logger.error(error_msg, exc_info=True)
         return {"content": [{"type": "error", "message": error_msg}]}
 
 @mcp.tool()
-async def listVoices() -> dict:
+@instrument_tool
+async def listVoices(
+    model: str = "lightning"
+) -> dict:
     """
     Lists all available pre-set voices from the Waves API.
 
+    Args:
+        model: The model whose voices to list (e.g., "lightning").
+
     Returns:
         A dictionary in MCP format containing the list of voices or an error message.
     """
-    logger.info(f"Listing available voices via {ENDPOINT_GET_VOICES}")
+    logger.info(f"Listing available voices via {ENDPOINT_MODEL_GET_VOICES.format(model=model)}")
     try:
-        resp = await waves_api(ENDPOINT_GET_VOICES)
-        data = resp.json()
+        raw = (await get_catalog("voices", model))["raw"]
         logger.info("Successfully retrieved available voices.")
         return {
             "content": [{
                 "type": "resource",
                 "resource": {
                     "uri": "waves://voices",
-                    "text": json.dumps(data),
+                    "text": raw,
                     "mimeType": "application/json"
                 }
             }]
@@ -337,32 +664,99 @@ async def listVoices() -> dict:
         error_msg = f"Failed to list voices: Status={e.status_code}, Reason={e.reason}, Details={e.text}"
         logger.error(error_msg)
         return {"content": [{"type": "error", "message": error_msg}]}
+    except Exception as e:
+        error_msg = f"Unexpected error listing voices: {str(e)}"
+        logger.error(error_msg, exc_info=True)
+        return {"content": [{"type": "error", "message": error_msg}]}
+
+@mcp.tool()
+@instrument_tool
+async def findVoices(
+    model: str = "lightning",
+    voiceId: str = None,
+    language: str = None,
+    gender: str = None,
+    accent: str = None,
+    includeClones: bool = False,
+    limit: int = None
+) -> dict:
+    """
+    Finds voices by id, language, gender or accent without returning the whole catalog.
+    Uses the cached, indexed voice catalog; filters are case-insensitive and combined with AND.
+
+    Args:
+        model: The model whose voices to search (e.g., "lightning").
+        voiceId: Exact voice id to look up.
+        language: Language tag to match (e.g., "english").
+        gender: Gender tag to match (e.g., "female").
+        accent: Accent tag to match (e.g., "indian").
+        includeClones: Also search the voice clones for this model.
+        limit: Maximum number of voices to return.
+
+    Returns:
+        A dictionary in MCP format containing the matching voices or an error message.
+    """
+    logger.info(f"Finding voices for model {model}: voiceId={voiceId}, language={language}, gender={gender}, accent={accent}")
+    try:
+        catalogs = ["voices", "clones"] if includeClones else ["voices"]
+        matches = []
+        for kind in catalogs:
+            entry = await get_catalog(kind, model)
+            matches.extend(voice_index(entry).find(voice_id=voiceId, language=language, gender=gender, accent=accent))
+        if limit:
+            matches = matches[:limit]
+        logger.info(f"Found {len(matches)} matching voices")
+        return {
+            "content": [{
+                "type": "resource",
+                "resource": {
+                    "uri": "waves://voices/search",
+                    "text": json.dumps({"voices": matches}),
+                    "mimeType": "application/json"
+                }
+            }]
+        }
+    except WavesApiError as e:
+        error_msg = f"Failed to find voices: Status={e.status_code}, Reason={e.reason}, Details={e.text}"
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
     except json.JSONDecodeError as e:
-        error_msg = f"Failed to parse listVoices response: {e}"
+        error_msg = f"Failed to parse voice catalog response: {e}"
         logger.error(error_msg)
         return {"content": [{"type": "error", "message": error_msg}]}
     except Exception as e:
-        error_msg = f"Unexpected error listing voices: {str(e)}"
+        error_msg = f"Unexpected error finding voices: {str(e)}"
         logger.error(error_msg, exc_info=True)
         return {"content": [{"type": "error", "message": error_msg}]}
 
 @mcp.tool()
+@instrument_tool
 async def ttsToWav(
     text: str,
     voiceId: str,
     model: str = "lightning",
     language: str = None,
-    outputFormat: str = "wav",
+    outputFormat: str = None,
     add_wav_header: bool = False,
     sample_rate: int = 24000,
     speed: float = 1.0,
     consistency: float = 0.5,
     similarity: float = 0.0,
     enhancement: float = 1.0,
-    output_dir: str = None
+    output_dir: str = None,
+    uri_type: str = None,
+    use_cache: bool = True,
+    long_form: bool = False,
+    max_concurrency: int = None,
+    crossfade_ms: float = 0.0,
+    pause_ms: float = 0.0,
+    resample_rate: int = None,
+    normalize_db: float = None,
+    trim_silence: bool = False,
+    peak_limit_db: float = None
 ) -> dict:
     """
-    Generate TTS audio and save it as a WAV file in a configurable output directory,
+    Generate TTS audio and save it as an audio file (WAV by default) in a configurable output directory,
     returning the file URI for LLM playback. Follows MCP resource conventions.
     Adds duration, timestamp, and file size to metadata.
 
@@ -374,7 +768,9 @@ async def ttsToWav(
         voiceId: The ID of the voice to use.
         model: The TTS model to use ("lightning" or "lightning-large").
         language: Language code (required for lightning-large).
-        outputFormat: The desired output format (e.g., "wav").
+        outputFormat: "wav" (PCM), "flac" (lossless, about half the size), or "mulaw"/"alaw"
+            (8 kHz G.711 WAV for telephony). FLAC and G.711 are encoded locally from the WAV
+            returned by the API. Defaults to TTS_OUTPUT_FORMAT.
         add_wav_header: Whether to add a WAV header to the output.
         sample_rate: The sample rate for the audio.
         speed: Playback speed factor.
@@ -382,6 +778,25 @@ async def ttsToWav(
         similarity: Voice similarity level.
         enhancement: Enhancement level.
         output_dir: Optional directory to save the output file.
+        uri_type: "file" for a file:// URI or "http" for a URL served by this server at /audio/
+            (supports Range requests; only for files in the default output directory).
+            Defaults to TTS_URI_TYPE.
+        use_cache: Return a previously synthesized file for an identical request instead of
+            calling the API again (only when the TTS cache is enabled).
+        long_form: Split long text at sentence/clause boundaries, synthesize the chunks
+            concurrently and stitch them into one WAV.
+        max_concurrency: Maximum concurrent chunk requests in long-form mode
+            (defaults to TTS_LONG_FORM_CONCURRENCY).
+        crossfade_ms: Long-form only: crossfade between adjacent chunks, in milliseconds.
+        pause_ms: Long-form only: silence inserted between adjacent chunks, in milliseconds.
+        resample_rate: Resample the synthesized audio locally to this sample rate.
+        normalize_db: Normalize loudness to this gated RMS level in dBFS (e.g. -20).
+        trim_silence: Trim leading and trailing silence.
+        peak_limit_db: Limit peaks to this level in dBFS (e.g. -1).
+
+    Post-processing runs locally on a worker thread pool. When the TTS cache holds the same
+    request at a higher sample rate, the requested sample_rate is produced by resampling the
+    cached audio instead of calling the API.
 
     Returns:
         A dictionary in MCP format containing the audio resource details or an error message.
@@ -391,159 +806,488 @@ async def ttsToWav(
     # import os - Already imported globally
 
     logger.info(f"Starting ttsToWav for voiceId: {voiceId}, model: {model}")
+    uri_type = uri_type or TTS_URI_TYPE
+    if uri_type not in ("file", "http"):
+        error_msg = f"Unsupported uri_type requested in ttsToWav: {uri_type}"
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+    outputFormat = outputFormat or TTS_OUTPUT_FORMAT
+    local_format = outputFormat if outputFormat in OUTPUT_FORMATS and outputFormat != "wav" else None
     try:
-        # Refactored payload creation
-        base_payload = {
-            "text": text,
-            "voice_id": voiceId,
-            "add_wav_header": add_wav_header,
-            "sample_rate": sample_rate,
-            "speed": speed,
-            "consistency": consistency,
-            "similarity": similarity,
-            "enhancement": enhancement,
-            "output_format": outputFormat,
-        }
-
-        # Select endpoint based on model
-        if model == "lightning":
-            endpoint_url = ENDPOINT_LIGHTNING_GET_SPEECH
-            payload = base_payload
-        elif model == "lightning-large":
-            endpoint_url = ENDPOINT_LIGHTNING_LARGE_GET_SPEECH
-            payload = base_payload.copy()
-            payload["language"] = language
-            if not language:
-                error_msg = "Language parameter is required for the lightning-large model."
-                logger.error(error_msg)
-                return {"content": [{"type": "error", "message": error_msg}]}
-        else:
+        try:
+            endpoint_url, payload = build_tts_request(
+                text, voiceId, model, language, "wav" if local_format else outputFormat, add_wav_header,
+                sample_rate, speed, consistency, similarity, enhancement
+            )
+            post = audio_post_spec(resample_rate, normalize_db, trim_silence, peak_limit_db, local_format)
+        except ValueError as e:
             # Use logger, return MCP error format instead of raising RuntimeError directly in tool
-            error_msg = f"Unsupported model requested in ttsToWav: {model}"
+            error_msg = str(e)
             logger.error(error_msg)
             return {"content": [{"type": "error", "message": error_msg}]}
 
         logger.debug(f"TTS Payload: {payload}")
-        resp = await waves_api(
-            endpoint_url,
-            method="POST",
-            headers={"Content-Type": "application/json"},
-            json_payload=payload
-        )
 
-        # No need to check resp.is_success here, waves_api raises WavesApiError on failure
+        chunks = split_text_for_synthesis(text, TTS_LONG_FORM_CHUNK_CHARS) if long_form else []
+        variant = None
+        if len(chunks) > 1:
+            variant = {"long_form": {"chunk_chars": TTS_LONG_FORM_CHUNK_CHARS, "crossfade_ms": crossfade_ms, "pause_ms": pause_ms}}
+
+        request_key = tts_cache_key(model, payload, variant)
+        output_key = tts_cache_key(model, payload, dict(variant or {}, post=post)) if post else request_key
 
         # Determine output directory
         if output_dir:
             save_dir = output_dir
         else:
             # Use ./tmp in the project folder by default
-            save_dir = MCP_BASE_PATH if MCP_BASE_PATH != "/tmp" else os.path.abspath(os.path.join(os.path.dirname(__file__), "tmp"))
+            save_dir = default_output_dir()
 
-        # Ensure directory exists (handle potential race conditions if needed, though unlikely here)
-        try:
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-                logger.info(f"Created output directory: {save_dir}")
-        except OSError as e:
-            error_msg = f"Failed to create output directory {save_dir}: {e}"
-            logger.error(error_msg)
-            return {"content": [{"type": "error", "message": error_msg}]}
+        cache_key = None
+        if storage.tts_cache is not None and use_cache:
+            cache_key = output_key
+            entry = await storage.tts_cache.lookup(cache_key)
+            path = None
+            if entry is not None:
+                try:
+                    path = await run_io(place_cached_file, entry["path"], save_dir)
+                except OSError as e:
+                    logger.warning(f"Could not place cached file {entry['path']} in {save_dir}, synthesizing again: {e}")
+            if path is not None:
+                logger.info(f"TTS cache hit for key {cache_key}: {path}")
+                if storage.output_store is not None:
+                    if path != entry["path"]:
+                        storage.output_store.register(path, entry["size"])
+                    await storage.output_store.touch(path)
+                return {
+                    "content": [{
+                        "type": "resource",
+                        "resource": {
+                            "uri": audio_uri(path, uri_type),
+                            "filename": os.path.basename(path),
+                            "mimeType": AUDIO_MIME_TYPES.get(os.path.splitext(path)[1], "audio/wav"),
+                            "codec": entry.get("codec") or "pcm",
+                            "size": entry["size"],
+                            "duration": entry["duration"],
+                            "created_at": entry["created_at"]
+                        }
+                    }],
+                    "meta": {
+                        "output_dir": os.path.dirname(path),
+                        "cached": True
+                    }
+                }
 
-        filename = f"tts_{uuid.uuid4().hex}.wav"
-        file_path = os.path.join(save_dir, filename)
+        # Post-process already cached audio locally: the unprocessed result, or the same
+        # request at a higher sample rate that can be resampled to the one requested
+        source = None
+        if cache_key is not None:
+            # Probes only: the lookup above already counted this request's hit or miss
+            source = await storage.tts_cache.lookup(request_key, count=False) if post else None
+            if source is None and AUDIO_RESAMPLE_FROM_CACHE:
+                source = await find_cached_sample_rate(model, payload, variant)
 
-        # Get audio bytes (waves_api ensures success or raises error)
-        audio_bytes = await resp.aread() # Read bytes async
+        async def produce():
+            if source is not None:
+                logger.info(f"Producing ttsToWav output locally from cached audio {source['path']}")
+                if storage.output_store is not None:
+                    await storage.output_store.touch(source["path"])
+                return await postprocess_to_file(source["path"], save_dir, cache_key, sample_rate, post)
+            base_key = request_key if cache_key is not None else None
+            result = await synthesize_to_file(
+                endpoint_url, payload, chunks, save_dir, base_key,
+                max_concurrency or TTS_LONG_FORM_CONCURRENCY, crossfade_ms, pause_ms
+            )
+            if not post or result["content"][0]["type"] != "resource":
+                return result
+            base_path = result["content"][0]["resource"]["uri"][len("file://"):]
+            processed = await postprocess_to_file(base_path, save_dir, cache_key, sample_rate, post)
+            if base_key is None:
+                # The unprocessed file is only worth keeping as a cache entry
+                if storage.output_store is not None:
+                    storage.output_store.forget(base_path)
+                await run_io(unlink_quietly, base_path)
+            return dict(processed, meta=dict(result["meta"], **processed.get("meta", {})))
 
-        logger.info(f"Writing {len(audio_bytes)} bytes to {file_path}")
-        try:
-            with open(file_path, "wb") as f:
-                f.write(audio_bytes)
-        except IOError as e:
-            # Use logger, return MCP error format
-            error_msg = f"Failed to write audio file {file_path}: {e}"
-            logger.error(error_msg)
-            return {"content": [{"type": "error", "message": error_msg}]}
+        # Identical concurrent requests share one synthesis and one output file
+        flight_key = ("POST", endpoint_url, output_key, os.path.abspath(save_dir))
+        result, coalesced = await single_flight.do(flight_key, produce)
+        if coalesced:
+            logger.info("ttsToWav request coalesced with an identical in-flight request")
+            result = dict(result, meta=dict(result.get("meta", {}), coalesced=True))
+        return with_audio_uri(result, uri_type)
+    except WavesApiError as e:
+        error_msg = f"TTS generation failed (API Error): Status={e.status_code}, Reason={e.reason}, Details={e.text}"
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+    except Exception as e:
+        # Catch any other unexpected errors during the process
+        error_msg = f"Unexpected error during ttsToWav execution: {str(e)}"
+        logger.error(error_msg, exc_info=True)
+        return {"content": [{"type": "error", "message": error_msg}]}
 
-        # Validate file was written
-        if not os.path.exists(file_path) or os.stat(file_path).st_size == 0:
-             # Use logger, return MCP error format
-            error_msg = f"Failed to write audio file or file is empty: {file_path}"
-            logger.error(error_msg)
-            # Attempt cleanup even if write failed
-            try:
-                if os.path.exists(file_path): os.unlink(file_path)
-            except OSError: pass # Ignore cleanup error
-            return {"content": [{"type": "error", "message": error_msg}]}
+@mcp.tool()
+@instrument_tool
+async def ttsBatch(
+    items: list[dict],
+    max_concurrency: int = None,
+    progress: bool = False,
+    ctx: Context = None
+) -> dict:
+    """
+    Synthesize many utterances in one call. Each item is run through ttsToWav with
+    bounded concurrency; identical items are synthesized once and share the result.
 
+    Args:
+        items: List of synthesis requests. Each item is a dictionary of ttsToWav arguments,
+            e.g. {"text": "Please hold", "voiceId": "emily", "model": "lightning"}.
+        max_concurrency: Maximum number of items synthesized at once
+            (defaults to TTS_BATCH_CONCURRENCY).
+        progress: Send MCP progress notifications as items finish.
 
-        # Validate WAV header (RIFF) - crucial check
+    Returns:
+        A dictionary in MCP format with one content entry per item, in input order. Each entry
+        is the item's audio resource or an error, tagged with its "index". The "meta" field
+        summarizes succeeded, failed and deduplicated counts.
+    """
+    if not isinstance(items, list) or not items:
+        error_msg = "items must be a non-empty list of ttsToWav argument dictionaries."
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+    if len(items) > TTS_BATCH_MAX_ITEMS:
+        error_msg = f"Batch too large: {len(items)} items (maximum is {TTS_BATCH_MAX_ITEMS})."
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+
+    logger.info(f"Starting ttsBatch with {len(items)} items")
+    signature = inspect.signature(ttsToWav)
+    results = [None] * len(items)
+    groups = {}  # normalized arguments -> (arguments, indices of identical items)
+    for index, item in enumerate(items):
         try:
-            with open(file_path, "rb") as f:
-                header = f.read(4)
-            if header != b'RIFF':
-                 # Use logger, return MCP error format
-                error_msg = f"Invalid WAV file written (missing RIFF header): {file_path}"
-                logger.error(error_msg)
-                try: os.unlink(file_path) # Cleanup invalid file
-                except OSError: pass
-                return {"content": [{"type": "error", "message": error_msg}]}
-        except IOError as e:
-            error_msg = f"Could not read back WAV file for validation: {file_path}, Error: {e}"
-            logger.error(error_msg)
-            # File might exist but be unreadable, attempt cleanup
+            if not isinstance(item, dict):
+                raise TypeError(f"expected a dictionary, got {type(item).__name__}")
+            bound = signature.bind(**item)
+        except TypeError as e:
+            results[index] = {"type": "error", "message": f"Invalid batch item: {e}"}
+            continue
+        bound.apply_defaults()
+        key = json.dumps(bound.arguments, sort_keys=True, default=str)
+        groups.setdefault(key, (bound.arguments, []))[1].append(index)
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or TTS_BATCH_CONCURRENCY))
+    # Batch work queues behind interactive requests in the outbound scheduler
+    priority_token = waves_priority.set("batch")
+    completed = len(items) - sum(len(indices) for _, indices in groups.values())
+
+    async def run(arguments, indices):
+        nonlocal completed
+        async with semaphore:
+            result = await ttsToWav(**arguments)
+        entry = result["content"][0]
+        for index in indices:
+            results[index] = entry
+        completed += len(indices)
+        if progress and ctx is not None:
             try:
-                if os.path.exists(file_path): os.unlink(file_path)
-            except OSError: pass
-            return {"content": [{"type": "error", "message": error_msg}]}
+                await ctx.report_progress(completed, len(items))
+            except Exception as e:
+                logger.warning(f"Failed to send ttsBatch progress notification: {e}")
 
+    try:
+        await asyncio.gather(*(run(arguments, indices) for arguments, indices in groups.values()))
+    finally:
+        waves_priority.reset(priority_token)
 
-        # Get duration (if WAV)
-        duration = None
+    content = [dict(entry, index=index) for index, entry in enumerate(results)]
+    failed = sum(1 for entry in content if entry["type"] == "error")
+    logger.info(f"ttsBatch finished: {len(items) - failed} succeeded, {failed} failed, {len(groups)} unique requests")
+    return {
+        "content": content,
+        "meta": {
+            "total": len(items),
+            "succeeded": len(items) - failed,
+            "failed": failed,
+            "deduplicated": sum(len(indices) - 1 for _, indices in groups.values())
+        }
+    }
+
+# --- Cache pre-warming ---
+def expand_phrase_pack(pack):
+    """
+    Expand a phrase pack into the list of ttsToWav argument dictionaries it describes.
+
+    A phrase pack is a JSON object with "voices" (voice ids), "texts" and optional "params"
+    (a list of ttsToWav argument sets such as {"model": "lightning", "sample_rate": 8000});
+    every voice x text x params combination is one entry. Explicit ttsToWav argument
+    dictionaries may be listed under "items". Duplicate entries are dropped.
+
+    Raises:
+        ValueError: If the pack is malformed or an entry has invalid arguments.
+    """
+    if not isinstance(pack, dict):
+        raise ValueError("Phrase pack must be a JSON object.")
+    voices = pack.get("voices", [])
+    texts = pack.get("texts", [])
+    param_sets = pack.get("params") or [{}]
+    extra = pack.get("items", [])
+    if not all(isinstance(v, str) for v in voices) or not all(isinstance(t, str) for t in texts):
+        raise ValueError("Phrase pack voices and texts must be lists of strings.")
+    if not all(isinstance(p, dict) for p in param_sets) or not all(isinstance(i, dict) for i in extra):
+        raise ValueError("Phrase pack params and items must be lists of objects.")
+    signature = inspect.signature(ttsToWav)
+    items = {}
+    candidates = [dict(params, voiceId=voice, text=text) for voice in voices for text in texts for params in param_sets]
+    for index, item in enumerate(candidates + extra):
         try:
-            with wave.open(file_path, 'rb') as wf:
-                frames = wf.getnframes()
-                rate = wf.getframerate()
-                if rate > 0: # Avoid division by zero
-                    duration = frames / float(rate)
+            bound = signature.bind(**item)
+        except TypeError as e:
+            raise ValueError(f"Invalid phrase pack entry {index}: {e}")
+        bound.apply_defaults()
+        # Entries must land in the cache, and their file paths are needed for export
+        bound.arguments.update(use_cache=True, uri_type="file")
+        items.setdefault(json.dumps(bound.arguments, sort_keys=True, default=str), bound.arguments)
+    if not items:
+        raise ValueError("Phrase pack is empty: give voices and texts, or items.")
+    return list(items.values())
+
+async def warm_cache(items, concurrency, on_progress=None):
+    """
+    Synthesize ttsToWav argument sets into the TTS cache with bounded concurrency.
+
+    Entries already cached are skipped (ttsToWav answers them from the cache without an API
+    call), so an interrupted run resumes where it stopped. Work is queued as batch priority.
+
+    Args:
+        items: ttsToWav argument dictionaries, e.g. from expand_phrase_pack.
+        concurrency: Maximum entries in flight.
+        on_progress: Optional async callback receiving the running summary after each entry.
+
+    Returns:
+        A tuple (summary, paths) with counts and throughput, and the cached file of each
+        successful entry.
+    """
+    summary = {
+        "total": len(items), "completed": 0, "cached": 0, "synthesized": 0, "failed": 0,
+        "audio_seconds": 0.0, "bytes": 0, "elapsed_seconds": 0.0, "items_per_second": 0.0,
+        "realtime_factor": 0.0, "errors": [],
+    }
+    paths = []
+    pending = iter(items)
+    start = time.monotonic()
+    priority_token = waves_priority.set("batch")
+
+    async def worker():
+        for arguments in pending:
+            result = await ttsToWav(**arguments)
+            entry = result["content"][0]
+            if entry["type"] != "resource":
+                summary["failed"] += 1
+                if len(summary["errors"]) < 20:
+                    summary["errors"].append({"voiceId": arguments["voiceId"], "text": arguments["text"][:80], "message": entry.get("message")})
+            else:
+                paths.append(entry["resource"]["uri"][len("file://"):])
+                if result.get("meta", {}).get("cached"):
+                    summary["cached"] += 1
                 else:
-                    logger.warning(f"Invalid frame rate (0) in WAV file: {file_path}")
-        except wave.Error as e:
-            # Log warning but proceed, duration is optional metadata
-            logger.warning(f"Could not read WAV duration from {file_path}: {e}")
-        except Exception as e:
-            # Catch other potential errors during wave processing
-            logger.warning(f"Unexpected error getting WAV duration from {file_path}: {e}")
+                    summary["synthesized"] += 1
+                    summary["audio_seconds"] += entry["resource"].get("duration") or 0.0
+                    summary["bytes"] += entry["resource"].get("size") or 0
+            summary["completed"] += 1
+            elapsed = time.monotonic() - start
+            summary["elapsed_seconds"] = elapsed
+            summary["items_per_second"] = summary["completed"] / elapsed if elapsed > 0 else 0.0
+            summary["realtime_factor"] = summary["audio_seconds"] / elapsed if elapsed > 0 else 0.0
+            if on_progress is not None:
+                await on_progress(summary)
 
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(items))))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # On cancellation, wait for in-flight entries to stop before the caller releases the client
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        waves_priority.reset(priority_token)
+    logger.info(
+        f"Cache warm-up finished: {summary['synthesized']} synthesized, {summary['cached']} already cached, "
+        f"{summary['failed']} failed in {summary['elapsed_seconds']:.1f}s"
+    )
+    return summary, paths
 
-        file_stat = os.stat(file_path)
-        logger.info(f"Successfully generated TTS file: {file_path}, Size: {file_stat.st_size}, Duration: {duration}")
-        return {
-            "content": [{
-                "type": "resource",
-                "resource": {
-                    "uri": f"file://{file_path}",
-                    "filename": filename,
-                    "mimeType": "audio/wav",
-                    "size": file_stat.st_size,
-                    "duration": duration,
-                    "created_at": datetime.datetime.fromtimestamp(file_stat.st_ctime).isoformat()
-                }
-            }],
-            "meta": {
-                "output_dir": save_dir
+@mcp.tool()
+@instrument_tool
+async def warmCache(
+    pack: dict,
+    max_concurrency: int = None,
+    progress: bool = False,
+    ctx: Context = None
+) -> dict:
+    """
+    Pre-synthesize a phrase pack into the TTS cache so the first callers of known prompts
+    get cache hits. Entries already cached are skipped, so repeating a call resumes an
+    interrupted warm-up.
+
+    Args:
+        pack: Phrase pack: {"voices": [...], "texts": [...], "params": [{ttsToWav arguments}, ...]}
+            expands to every voice x text x params combination; {"items": [{ttsToWav arguments}, ...]}
+            lists entries explicitly. Both forms may be combined.
+        max_concurrency: Maximum entries synthesized at once (defaults to TTS_WARMUP_CONCURRENCY).
+        progress: Send MCP progress notifications as entries finish.
+
+    Returns:
+        A dictionary in MCP format with a summary of synthesized, already cached and failed
+        entries and the throughput, or an error message.
+    """
+    if storage.tts_cache is None:
+        error_msg = "Cache pre-warming requires the TTS cache (TTS_CACHE_ENABLED)."
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+    try:
+        items = expand_phrase_pack(pack)
+    except ValueError as e:
+        error_msg = str(e)
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+    if len(items) > TTS_WARMUP_MAX_ITEMS:
+        error_msg = f"Phrase pack too large: {len(items)} entries (maximum is {TTS_WARMUP_MAX_ITEMS})."
+        logger.error(error_msg)
+        return {"content": [{"type": "error", "message": error_msg}]}
+
+    async def report(summary):
+        if progress and ctx is not None:
+            try:
+                await ctx.report_progress(summary["completed"], summary["total"])
+            except Exception as e:
+                logger.warning(f"Failed to send warmCache progress notification: {e}")
+
+    logger.info(f"Starting cache warm-up with {len(items)} entries")
+    summary, _ = await warm_cache(items, max_concurrency or TTS_WARMUP_CONCURRENCY, report)
+    return {
+        "content": [{
+            "type": "resource",
+            "resource": {
+                "uri": "waves://cache-warmup",
+                "mimeType": "application/json",
+                "text": json.dumps(summary)
             }
-        }
-    except WavesApiError as e:
-        error_msg = f"TTS generation failed (API Error): Status={e.status_code}, Reason={e.reason}, Details={e.text}"
+        }],
+        "meta": {k: summary[k] for k in ("total", "synthesized", "cached", "failed")}
+    }
+
+@mcp.tool()
+@instrument_tool
+async def ttsStreamUrl(
+    text: str,
+    voiceId: str,
+    model: str = "lightning",
+    language: str = None,
+    sample_rate: int = 24000,
+    speed: float = 1.0,
+    consistency: float = 0.5,
+    similarity: float = 0.0,
+    enhancement: float = 1.0
+) -> dict:
+    """
+    Returns a URL on this server that streams the synthesized speech as it is produced.
+    Playback can start on the first chunk instead of after the whole file is written.
+    The stream is a WAV header followed by PCM data over HTTP chunked transfer. The text is
+    part of the URL, so URLs longer than STREAM_URL_MAX_LENGTH are refused.
+
+    Args:
+        text: The text to synthesize.
+        voiceId: The ID of the voice to use.
+        model: The TTS model to use ("lightning" or "lightning-large").
+        language: Language code (required for lightning-large).
+        sample_rate: The sample rate for the audio.
+        speed: Playback speed factor.
+        consistency: Voice consistency level.
+        similarity: Voice similarity level.
+        enhancement: Enhancement level.
+
+    Returns:
+        A dictionary in MCP format containing the stream URL or an error message.
+    """
+    params = {
+        "text": text, "voiceId": voiceId, "model": model, "sample_rate": sample_rate, "speed": speed,
+        "consistency": consistency, "similarity": similarity, "enhancement": enhancement,
+    }
+    if language:
+        params["language"] = language
+    try:
+        build_tts_request(text, voiceId, model, language)
+    except ValueError as e:
+        error_msg = str(e)
         logger.error(error_msg)
         return {"content": [{"type": "error", "message": error_msg}]}
-    except Exception as e:
-        # Catch any other unexpected errors during the process
-        error_msg = f"Unexpected error during ttsToWav execution: {str(e)}"
-        logger.error(error_msg, exc_info=True)
+    url = f"{AUDIO_BASE_URL.rstrip('/')}/stream/tts?{urllib.parse.urlencode(params)}"
+    if len(url) > STREAM_URL_MAX_LENGTH:
+        error_msg = (f"Text is too long for a stream URL ({len(url)} characters, limit {STREAM_URL_MAX_LENGTH}); "
+                     f"use ttsToWav, or POST the parameters as JSON to /stream/tts")
+        logger.error(error_msg)
         return {"content": [{"type": "error", "message": error_msg}]}
+    return {
+        "content": [{
+            "type": "resource",
+            "resource": {
+                "uri": url,
+                "mimeType": "audio/wav"
+            }
+        }]
+    }
+
+@mcp.tool()
+@instrument_tool
+async def wavesClientStats() -> dict:
+    """
+    Reports Waves HTTP client pool utilization (open and idle connections,
+    configured limits, current/peak in-flight requests), retry, hedging
+    and circuit breaker counters, admission queue depth and wait times,
+    request coalescing counters and voice catalog cache counters.
+
+    Returns:
+        A dictionary in MCP format containing the client statistics.
+    """
+    return {
+        "content": [{
+            "type": "resource",
+            "resource": {
+                "uri": "waves://client-stats",
+                "text": json.dumps(dict(
+                    http_pool_stats(),
+                    resilience=resilience_stats(),
+                    admission=admission.waves_scheduler.stats(),
+                    coalescing=single_flight.stats(),
+                    catalog_cache=catalog_cache.stats() if catalog_cache is not None else {"enabled": False}
+                )),
+                "mimeType": "application/json"
+            }
+        }]
+    }
+
+@mcp.tool()
+@instrument_tool
+async def ttsCacheStats() -> dict:
+    """
+    Reports TTS result cache statistics (entry count, bytes used, limits,
+    hits, misses, evictions and hit ratio) and output directory usage and cleanup.
+
+    Returns:
+        A dictionary in MCP format containing the cache statistics.
+    """
+    stats = storage.tts_cache.stats() if storage.tts_cache is not None else {"enabled": False}
+    stats["output_store"] = storage.output_store.stats() if storage.output_store is not None else {"enabled": False}
+    return {
+        "content": [{
+            "type": "resource",
+            "resource": {
+                "uri": "waves://tts-cache-stats",
+                "text": json.dumps(stats),
+                "mimeType": "application/json"
+            }
+        }]
+    }
 
 
 # NOTE: The playWavFile tool is deprecated and will be removed. For MCP-compliance and client-side playback, only return file resources (URIs) via ttsToWav. Clients/LLMs are responsible for playback. - REMOVED
@@ -555,16 +1299,382 @@ app = mcp.sse_app()
 @app.route("/")
 async def homepage(request):
     logger.info("Homepage '/' accessed.")
+    if MCP_HTTP_ENABLED:
+        return PlainTextResponse(f"MCP server running. Use /sse (SSE) or {MCP_HTTP_PATH} (streamable HTTP) for protocol.")
     return PlainTextResponse("MCP SSE server running. Use /sse for protocol.")
 
-# Ensure the HTTP client is closed gracefully on shutdown
-# Starlette provides lifespan events for this
-@app.on_event("shutdown")
-async def shutdown_event():
+class AudioFileResponse(FileResponse):
+    """
+    FileResponse that hands whole-file transfers to the server with the ASGI
+    "http.response.pathsend" extension when available (zero-copy sendfile), and otherwise
+    streams the file in chunks from a worker thread. Range requests are handled by Starlette.
+    """
+
+    async def __call__(self, scope, receive, send):
+        self._pathsend = "http.response.pathsend" in (scope.get("extensions") or {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send, send_header_only):
+        if not self._pathsend or send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": str(self.path)})
+
+def etag_matches(if_none_match, etag):
+    """
+    Evaluate an If-None-Match header against an entity tag (RFC 9110 section 13.1.2): the
+    header is "*" or a comma-separated list of tags, compared weakly (W/ prefixes ignored).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    return opaque(etag) in {opaque(tag) for tag in if_none_match.split(",")}
+
+if AUDIO_HTTP_ENABLED:
+    @app.route("/audio/{path:path}", methods=["GET", "HEAD"])
+    async def audio_file(request):
+        """Serve a generated audio file with Range, ETag and Cache-Control support."""
+        def resolve():
+            root = os.path.realpath(default_output_dir())
+            path = os.path.realpath(os.path.join(root, request.path_params["path"]))
+            if not path.startswith(root + os.sep) or not os.path.basename(path).startswith(OutputStore.FILE_PREFIX):
+                return path, None
+            try:
+                return path, os.stat(path)
+            except OSError:
+                return path, None
+
+        path, stat_result = await run_io(resolve)
+        if stat_result is None:
+            return PlainTextResponse("Not Found", status_code=404)
+        if storage.output_store is not None:
+            await storage.output_store.touch(path)
+        # File names are unique per synthesis and never rewritten, so responses are immutable
+        response = AudioFileResponse(
+            path,
+            stat_result=stat_result,
+            media_type=AUDIO_MIME_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"),
+            filename=os.path.basename(path),
+            content_disposition_type="inline",
+            headers={"Cache-Control": f"public, max-age={AUDIO_CACHE_MAX_AGE}, immutable"},
+        )
+        if etag_matches(request.headers.get("if-none-match"), response.headers["etag"]):
+            return Response(status_code=304, headers={
+                "ETag": response.headers["etag"],
+                "Cache-Control": response.headers["cache-control"],
+            })
+        return response
+
+# Scrape-time gauges over existing state
+metrics.register(Gauge("mcp_tools_in_flight", "MCP tool calls currently running.", lambda: tools_in_flight))
+metrics.register(Gauge("waves_requests_in_flight", "Waves API requests currently in flight.", lambda: waves.http_in_flight))
+metrics.register(Gauge("waves_requests_in_flight_peak", "Peak concurrent Waves API requests.", lambda: waves.http_in_flight_peak))
+metrics.register(Gauge("waves_scheduler_queued", "Waves API requests waiting for admission.", lambda: admission.waves_scheduler.queued))
+metrics.register(Gauge("waves_circuit_open", "1 while the Waves circuit breaker is open or half-open.", lambda: int(waves.circuit_breaker.state != "closed")))
+metrics.register(Gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample.", lambda: event_loop_lag))
+metrics.register(Gauge("tts_cache_entries", "Entries in the TTS result cache.", lambda: storage.tts_cache.size()[0] if storage.tts_cache is not None else None))
+metrics.register(Gauge("tts_cache_bytes", "Bytes of audio in the TTS result cache.", lambda: storage.tts_cache.size()[1] if storage.tts_cache is not None else None))
+metrics.register(Gauge("output_store_bytes", "Bytes of generated audio in the managed output directory.", lambda: storage.output_store.total_bytes if storage.output_store is not None else None))
+
+if METRICS_ENABLED:
+    @app.route("/metrics")
+    async def metrics_endpoint(request):
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route("/stream/tts", methods=["GET", "POST"])
+async def stream_tts(request):
+    """
+    Stream synthesized speech to the client as it arrives from the Waves API.
+
+    Parameters (query string for GET, JSON body for POST) are the ttsToWav synthesis
+    arguments: text, voiceId, model, language, sample_rate, speed, consistency, similarity,
+    enhancement, outputFormat and use_cache. Cached audio is served from disk.
+    """
+    try:
+        raw = dict(request.query_params) if request.method == "GET" else await request.json()
+        if not isinstance(raw, dict):
+            raise ValueError("expected a JSON object")
+        params = parse_stream_params(raw)
+        use_cache = params.pop("use_cache", True)
+        endpoint_url, payload = build_tts_request(**params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    logger.info(f"Starting audio stream for voiceId: {params['voiceId']}, model: {params.get('model', 'lightning')}")
+    model = params.get("model", "lightning")
+    cache_key = tts_cache_key(model, payload) if storage.tts_cache is not None and use_cache else None
+    if cache_key is not None:
+        entry = await storage.tts_cache.lookup(cache_key)
+        if entry is not None:
+            logger.info(f"TTS cache hit for stream, serving {entry['path']}")
+            if storage.output_store is not None:
+                await storage.output_store.touch(entry["path"])
+            media_type = AUDIO_MIME_TYPES.get(os.path.splitext(entry["path"])[1], "audio/wav")
+            return AudioFileResponse(entry["path"], media_type=media_type, content_disposition_type="inline")
+
+    file_path = None
+    if cache_key is not None:
+        filename = f"tts_{uuid.uuid4().hex}.wav"
+        save_dir = default_output_dir()
+        file_path = storage.output_store.path_for(filename) if storage.output_store is not None else os.path.join(save_dir, filename)
+
+    try:
+        resp, chunks, header, head = await open_tts_stream(endpoint_url, payload)
+    except WavesApiError as e:
+        logger.error(f"Audio stream failed (API Error): Status={e.status_code}, Reason={e.reason}, Details={e.text}")
+        return JSONResponse({"error": "TTS generation failed", "status": e.status_code, "reason": e.reason, "details": e.text}, status_code=502)
+    except AudioValidationError as e:
+        logger.error(f"Invalid audio stream received: {e}")
+        return JSONResponse({"error": f"Invalid WAV stream received: {e}"}, status_code=502)
+
+    return AudioStreamResponse(
+        stream_tts_body(resp, chunks, header, head, cache_key=cache_key, file_path=file_path),
+        media_type="audio/wav",
+        headers={"Cache-Control": "no-store"},
+    )
+
+# --- Streamable HTTP transport ---
+if MCP_HTTP_ENABLED:
+    @app.route(MCP_HTTP_PATH, methods=["GET", "POST", "DELETE"])
+    async def streamable_http(request):
+        """
+        Stateless MCP streamable-HTTP endpoint: each POST carries JSON-RPC messages and gets its
+        responses back, so any worker or replica can serve any request without sticky sessions.
+        Responses are plain JSON; they stream as SSE when the client accepts text/event-stream
+        and asked for progress notifications.
+        """
+        if request.method != "POST":
+            # No session to resume or delete and no standalone server-to-client stream
+            return PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "POST"})
+        if not request.headers.get("content-type", "").startswith("application/json"):
+            return jsonrpc_error_response(-32700, "Content-Type must be application/json", 415)
+        body = await request.body()
+        try:
+            batch = body.lstrip()[:1] == b"["
+            messages = jsonrpc_batch_adapter().validate_json(body) if batch else [JSONRPCMessage.model_validate_json(body)]
+        except ValueError as e:
+            return jsonrpc_error_response(-32700, f"Parse error: {e}", 400)
+        if not messages:
+            return jsonrpc_error_response(-32600, "Invalid Request: empty batch", 400)
+        requests_ = [m.root for m in messages if isinstance(m.root, JSONRPCRequest)]
+        if not requests_:
+            # Notifications and responses have no session to reach in stateless mode
+            return Response(status_code=202)
+
+        # The session cannot process unknown or malformed requests; answer those directly
+        rejected = []
+        for r in requests_:
+            if r.method not in CLIENT_REQUEST_METHODS:
+                rejected.append(jsonrpc_error_message(r.id, METHOD_NOT_FOUND, f"Method not found: {r.method}"))
+                continue
+            try:
+                ClientRequest.model_validate(r.model_dump(by_alias=True, mode="json", exclude_none=True))
+            except ValueError:
+                rejected.append(jsonrpc_error_message(r.id, INVALID_PARAMS, f"Invalid params for {r.method}"))
+        rejected_ids = {m.root.id for m in rejected}
+        messages = [m for m in messages if not (isinstance(m.root, JSONRPCRequest) and m.root.id in rejected_ids)]
+        request_ids = [r.id for r in requests_ if r.id not in rejected_ids]
+
+        async def replies():
+            for message in rejected:
+                yield message
+            if request_ids:
+                async for message in exchange_stateless(mcp._mcp_server, messages, request_ids):
+                    yield message
+
+        wants_progress = any((r.params or {}).get("_meta", {}).get("progressToken") is not None for r in requests_)
+        if wants_progress and "text/event-stream" in request.headers.get("accept", ""):
+            async def events():
+                async for message in replies():
+                    yield f"event: message\ndata: {message.model_dump_json(by_alias=True, exclude_none=True)}\n\n".encode()
+            return AudioStreamResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+        results = [
+            message.model_dump_json(by_alias=True, exclude_none=True)
+            async for message in replies()
+            if isinstance(message.root, (JSONRPCResponse, JSONRPCError))
+        ]
+        return Response(f"[{','.join(results)}]" if batch else results[0], media_type="application/json")
+
+# --- Startup ---
+resources_ready = False
+
+def validate_config():
+    """
+    Check settings that have no usable default. Runs on startup (app lifespan, CLI) rather
+    than at import, so tooling can import the module without a full configuration.
+
+    Returns:
+        A list of problems, empty when the server can start.
+    """
+    problems = []
+    if not WAVES_API_KEY:
+        problems.append("WAVES_API_KEY environment variable is not set")
+    if TTS_URI_TYPE not in ("file", "http"):
+        problems.append(f"TTS_URI_TYPE must be 'file' or 'http', not {TTS_URI_TYPE!r}")
+    if MCP_WORKERS < 1:
+        problems.append(f"MCP_WORKERS must be at least 1, not {MCP_WORKERS}")
+    return problems
+
+def init_resources():
+    """
+    Open the shared state database and load the TTS cache index (blocking, once). Called
+    from the app lifespan and the CLI commands instead of at import time.
+    """
+    global resources_ready
+    if resources_ready:
+        return
+    resources_ready = True
+    if MCP_SHARED_STATE_PATH:
+        storage.shared_state = SharedState(MCP_SHARED_STATE_PATH)
+        if catalog_cache is not None:
+            catalog_cache.shared = storage.shared_state
+        if WAVES_RATE_LIMIT > 0:
+            admission.waves_scheduler = SharedRateScheduler(storage.shared_state, *scheduler_args)
+        if storage.output_store is not None:
+            storage.output_store = SharedOutputStore(storage.shared_state, *output_store_args)
+    if TTS_CACHE_ENABLED and storage.tts_cache is None:
+        if storage.shared_state is not None:
+            storage.tts_cache = SharedTTSCache(storage.shared_state, TTS_CACHE_MAX_BYTES, TTS_CACHE_MAX_ENTRIES)
+        else:
+            storage.tts_cache = TTSCache(TTS_CACHE_INDEX_PATH, TTS_CACHE_MAX_BYTES, TTS_CACHE_MAX_ENTRIES)
+
+async def release_resources():
+    """Close the Waves client, stop worker pools and persist the TTS cache index."""
     logger.info("Shutting down HTTP client...")
-    await http_client.aclose()
+    await close_http_client()
+    shutdown_audio_executor()
+    if storage.tts_cache is not None:
+        storage.tts_cache.save()
+    shutdown_io_executor()
+
+# Validate the configuration and create clients and caches on startup; close them on shutdown
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    problems = validate_config()
+    if problems:
+        for problem in problems:
+            logger.critical(f"{problem}. Server cannot start.")
+        raise RuntimeError(f"Invalid configuration: {'; '.join(problems)}")
+    init_resources()
+    get_http_client()
+    # Load NumPy off the event loop now rather than on the first audio request
+    get_io_executor().submit(importlib.import_module, "numpy")
+    tasks = []
+    if storage.output_store is not None and MCP_WORKER_ID == 0:
+        # Workers share the output directory; one of them collects it
+        tasks.append(asyncio.create_task(storage.output_store.run(OUTPUT_GC_INTERVAL)))
+    if METRICS_ENABLED and METRICS_LOOP_LAG_INTERVAL > 0:
+        tasks.append(asyncio.create_task(monitor_event_loop_lag(METRICS_LOOP_LAG_INTERVAL)))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await release_resources()
+
+app.router.lifespan_context = lifespan
+
+# --- Command line ---
+def run_offline(fn, *args):
+    """Run a coroutine function outside the server, then release clients, pools and the cache index."""
+    async def main():
+        try:
+            init_resources()
+            return await fn(*args)
+        finally:
+            # Stop leftover work (e.g. coalesced syntheses after an interrupt) before closing the client
+            leftover = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in leftover:
+                task.cancel()
+            await asyncio.gather(*leftover, return_exceptions=True)
+            await release_resources()
+    return asyncio.run(main())
+
+async def warm_from_file(pack_path, concurrency, export_path=None):
+    with open(pack_path, "r", encoding="utf-8") as f:
+        items = expand_phrase_pack(json.load(f))
+    print(f"Warming TTS cache with {len(items)} entries from {pack_path} ({concurrency} concurrent)...", flush=True)
+    last_report = 0.0
+
+    async def report(summary):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < 1.0 and summary["completed"] < summary["total"]:
+            return
+        last_report = now
+        remaining = summary["total"] - summary["completed"]
+        eta = remaining / summary["items_per_second"] if summary["items_per_second"] else 0.0
+        print(
+            f"[{summary['completed']}/{summary['total']}] {summary['synthesized']} synthesized, "
+            f"{summary['cached']} cached, {summary['failed']} failed | {summary['items_per_second']:.1f} entries/s, "
+            f"{summary['realtime_factor']:.1f}x realtime, ETA {eta:.0f}s",
+            flush=True
+        )
+
+    summary, paths = await warm_cache(items, concurrency, report)
+    if export_path:
+        count, size = await export_tts_cache(export_path, paths)
+        print(f"Exported {count} entries ({size} bytes) to {export_path}", flush=True)
+    print(json.dumps(summary, indent=2))
+    return summary["failed"] == 0
+
+def cli(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Smallest.ai Waves MCP server")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="Run the MCP server (default)")
+    warm = commands.add_parser("warm", help="Pre-synthesize a phrase pack into the TTS cache")
+    warm.add_argument("pack", help="Phrase pack JSON file (see the warmCache tool)")
+    warm.add_argument("--concurrency", type=int, default=TTS_WARMUP_CONCURRENCY, help="Entries synthesized at once")
+    warm.add_argument("--export", metavar="ARCHIVE", help="Afterwards, export the pack's cached audio to this archive")
+    export = commands.add_parser("export-cache", help="Write the TTS cache to a .tar or .tar.gz archive")
+    export.add_argument("archive")
+    import_ = commands.add_parser("import-cache", help="Load a TTS cache archive written by export-cache or warm --export")
+    import_.add_argument("archive")
+    args = parser.parse_args(argv)
+
+    if args.command in ("warm", "export-cache", "import-cache") and not TTS_CACHE_ENABLED:
+        parser.error("the TTS cache is disabled (TTS_CACHE_ENABLED)")
+    if args.command in (None, "serve", "warm"):
+        problems = validate_config()
+        if problems:
+            parser.error("; ".join(problems))
+    if args.command == "warm":
+        try:
+            ok = run_offline(warm_from_file, args.pack, max(1, args.concurrency), args.export)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        except KeyboardInterrupt:
+            print("Interrupted; run the same command again to resume.", file=sys.stderr)
+            sys.exit(130)
+        sys.exit(0 if ok else 1)
+    if args.command == "export-cache":
+        count, size = run_offline(export_tts_cache, args.archive)
+        print(f"Exported {count} entries ({size} bytes) to {args.archive}")
+        return
+    if args.command == "import-cache":
+        import tarfile
+        try:
+            imported, skipped, rejected = run_offline(import_tts_cache, args.archive)
+        except (OSError, ValueError, tarfile.TarError) as e:
+            parser.error(str(e))
+        print(f"Imported {imported} entries from {args.archive} ({skipped} already cached, {rejected} invalid)")
+        return
+
+    if MCP_WORKERS > 1:
+        print(f"Starting MCP server with SSE transport on port {MCP_PORT} with {MCP_WORKERS} workers...")
+        run_workers(MCP_WORKERS, MCP_HOST, MCP_PORT, mcp.settings.sse_path, mcp.settings.message_path)
+    else:
+        print(f"Starting MCP server with SSE transport on port {MCP_PORT}...")
+        import uvicorn
+        # Pass the app object: "server:app" would import this module a second time
+        uvicorn.run(app, host=MCP_HOST, port=MCP_PORT, log_level="info")
 
 if __name__ == "__main__":
-    print("Starting MCP server with SSE transport on port 8000...")
-    import uvicorn
-    uvicorn.run("server:app", host="0.0.0.0", port=8000, log_level="info")
+    cli()
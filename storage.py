@@ -0,0 +1,921 @@
+"""Generated audio on disk: the output directory store, the TTS result cache, cache archives and multi-worker shared state."""
+import logging
+import os
+import json
+import uuid
+import datetime
+import hashlib
+import re
+import io
+import asyncio
+import contextlib
+import threading
+import shutil
+import time
+from collections import OrderedDict
+
+from config import (
+    AUDIO_MIME_TYPES, DISK_WRITE_BUFFER, OUTPUT_GC_ENABLED, OUTPUT_MAX_AGE, OUTPUT_MAX_BYTES,
+    OUTPUT_MIN_RETENTION, OUTPUT_SHARD_DEPTH, TTS_CACHE_INDEX_PATH, TTS_CACHE_SAVE_DELAY,
+    default_output_dir
+)
+from diskio import finish_file, get_io_executor, run_io, submit_io, temp_path_for, unlink_quietly
+from audio import AudioValidationError, probe_audio_header
+
+logger = logging.getLogger(__name__)
+
+# --- Output directory lifecycle ---
+class OutputStore:
+    """
+    Manages generated audio in the default output directory.
+
+    New files are sharded into subdirectories by the leading hex digits of their name
+    (tts_ab12... -> ab/12/tts_ab12...), so directories stay small. A background task
+    (see run()) rescans the directory, deletes files older than `max_age` and then, least
+    recently used first, files beyond the `max_bytes` quota. A file is pinned for `min_retention` seconds each time it is
+    returned to a client and is never deleted while pinned. Explicit output_dir locations
+    chosen by callers are not managed.
+    """
+    FILE_PREFIX = "tts_"
+    PARTIAL_MAX_AGE = 3600  # abandoned .part files from interrupted writes
+
+    def __init__(self, root, max_bytes, max_age, min_retention, shard_depth):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_retention = min_retention
+        self.shard_depth = max(0, shard_depth)
+        self.files = {}  # path -> [size, created, last_access, pinned_until]
+        self.total_bytes = 0
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        self.last_gc = None
+        self._scanned = False
+
+    def manages(self, directory):
+        return os.path.abspath(directory) == self.root
+
+    def path_for(self, filename):
+        """Sharded path for a new file in the managed directory (the caller creates the shard directory)."""
+        stem = filename[len(self.FILE_PREFIX):] if filename.startswith(self.FILE_PREFIX) else filename
+        shard = os.path.join(self.root, *[stem[2 * i:2 * i + 2] for i in range(self.shard_depth)])
+        return os.path.join(shard, filename)
+
+    def register(self, path, size):
+        """Track a newly written file and pin it, since it is about to be returned."""
+        if not os.path.abspath(path).startswith(self.root + os.sep):
+            return
+        now = time.time()
+        old = self.files.get(path)
+        if old is not None:
+            self.total_bytes -= old[0]
+        self.files[path] = [size, now, now, now + self.min_retention]
+        self.total_bytes += size
+
+    async def touch(self, path):
+        """Mark a file as just returned to a client: most recently used and pinned."""
+        record = self.files.get(path)
+        if record is not None:
+            now = time.time()
+            record[2] = now
+            record[3] = now + self.min_retention
+
+    def pinned(self, path):
+        record = self.files.get(path)
+        return record is not None and record[3] > time.time()
+
+    def forget(self, path):
+        record = self.files.pop(path, None)
+        if record is not None:
+            self.total_bytes -= record[0]
+
+    def _scan(self):
+        """Walk the managed directory (in a worker thread). Returns (files, partial_files)."""
+        found, partials = {}, []
+        now = time.time()
+        index_path = os.path.abspath(TTS_CACHE_INDEX_PATH)
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if path == index_path or path.startswith(index_path + "."):
+                    continue  # the TTS cache index and its temporary files
+                partial = name.startswith("." + self.FILE_PREFIX) and name.endswith(".part")
+                audio = name.startswith(self.FILE_PREFIX) and os.path.splitext(name)[1] in AUDIO_MIME_TYPES
+                if not (partial or audio):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if partial:
+                    if now - st.st_mtime > self.PARTIAL_MAX_AGE:
+                        partials.append(path)
+                    continue
+                # Files written (or hard-linked) by another process are pinned like registered ones
+                found[path] = [st.st_size, st.st_mtime, max(st.st_atime, st.st_mtime), max(st.st_mtime, st.st_ctime) + self.min_retention]
+        return found, partials
+
+    def _select_victims(self):
+        now = time.time()
+        victims = []
+        if self.max_age > 0:
+            victims = [p for p, r in self.files.items() if now - r[1] > self.max_age and r[3] <= now]
+        remaining = self.total_bytes - sum(self.files[p][0] for p in victims)
+        if self.max_bytes > 0 and remaining > self.max_bytes:
+            chosen = set(victims)
+            for path, record in sorted(self.files.items(), key=lambda item: item[1][2]):
+                if remaining <= self.max_bytes:
+                    break
+                if path in chosen or record[3] > now:
+                    continue
+                victims.append(path)
+                remaining -= record[0]
+        return victims
+
+    async def collect(self):
+        """Run one garbage collection pass. Returns the number of files deleted."""
+        # Rescan on every pass: files written by other processes (or other workers) are only
+        # found on disk, and abandoned .part files appear long after startup.
+        started = time.time()
+        found, partials = await asyncio.to_thread(self._scan)
+        for path, record in found.items():
+            known = self.files.get(path)
+            if known is None:
+                self.files[path] = record
+                self.total_bytes += record[0]
+            else:
+                known[2] = max(known[2], record[2])
+                known[3] = max(known[3], record[3])
+        # Files removed behind our back; skip anything registered while the scan was running.
+        for path in [p for p, r in self.files.items() if p not in found and r[1] < started]:
+            self.forget(path)
+        if not self._scanned:
+            self._scanned = True
+            logger.info(f"Output store indexed {len(self.files)} files ({self.total_bytes} bytes) under {self.root}")
+        victims = self._select_victims()
+        # Unindex victims (and drop their cache entries) before deleting, so no request can
+        # be handed a file that is about to disappear.
+        sizes = {}
+        for path in victims:
+            sizes[path] = self.files[path][0]
+            self.forget(path)
+            if tts_cache is not None:
+                tts_cache.discard_path(path)
+        if tts_cache is not None and victims:
+            tts_cache.schedule_save()
+        deleted = await asyncio.to_thread(self._delete, victims + partials)
+        self.deleted_files += len(deleted)
+        self.deleted_bytes += sum(sizes.get(p, 0) for p in deleted)
+        self.last_gc = time.time()
+        if victims:
+            logger.info(f"Output store removed {len(deleted)} files; {self.total_bytes} bytes in {len(self.files)} files remain")
+        return len(deleted)
+
+    def _delete(self, paths):
+        """Delete files (blocking). Returns the paths that are gone."""
+        deleted = []
+        for path in paths:
+            try:
+                os.unlink(path)
+                deleted.append(path)
+            except FileNotFoundError:
+                deleted.append(path)
+            except OSError as e:
+                logger.warning(f"Failed to delete output file {path}: {e}")
+        return deleted
+
+    def remove_file(self, path):
+        """Delete a file evicted from the TTS cache (blocking)."""
+        unlink_quietly(path)
+
+    async def run(self, interval):
+        """Background loop: collect every `interval` seconds until cancelled."""
+        while True:
+            try:
+                await self.collect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Output store garbage collection failed: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "files": len(self.files),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age,
+            "min_retention_seconds": self.min_retention,
+            "deleted_files": self.deleted_files,
+            "deleted_bytes": self.deleted_bytes,
+            "last_gc": datetime.datetime.fromtimestamp(self.last_gc).isoformat() if self.last_gc else None,
+        }
+
+output_store_args = (default_output_dir(), OUTPUT_MAX_BYTES, OUTPUT_MAX_AGE, OUTPUT_MIN_RETENTION, OUTPUT_SHARD_DEPTH)
+# Replaced by a SharedOutputStore in init_resources() with shared state
+output_store = OutputStore(*output_store_args) if OUTPUT_GC_ENABLED else None
+
+# --- Shared state for multi-worker deployments ---
+class SharedState:
+    """
+    SQLite database shared by all worker processes (WAL mode, so readers do not block the writer).
+
+    Holds the TTS cache index, catalog snapshots, the upstream rate-limit bucket and the
+    last access and pin times of files in the managed output directory. Each
+    thread uses its own connection. Calls block, so request paths make them on the disk I/O pool.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tts_cache (
+            key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, duration REAL,
+            created_at TEXT, last_access REAL NOT NULL, codec TEXT
+        );
+        CREATE INDEX IF NOT EXISTS tts_cache_lru ON tts_cache (last_access);
+        CREATE INDEX IF NOT EXISTS tts_cache_path ON tts_cache (path);
+        CREATE TABLE IF NOT EXISTS catalog (
+            key TEXT PRIMARY KEY, data TEXT, fetched_at REAL NOT NULL DEFAULT 0,
+            invalidated_at REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS rate_bucket (
+            name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS output_files (
+            path TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL,
+            pinned_until REAL NOT NULL
+        );
+    """
+    CACHE_COLUMNS = ("key", "path", "size", "duration", "created_at", "last_access", "codec")
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self.connection()
+        conn.executescript(self.SCHEMA)
+        if "codec" not in {row[1] for row in conn.execute("PRAGMA table_info(tts_cache)")}:
+            conn.execute("ALTER TABLE tts_cache ADD COLUMN codec TEXT")  # databases from before output formats
+        logger.info(f"Using shared state database {path}")
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # TTS cache index
+    def cache_get(self, key):
+        row = self.connection().execute(f"SELECT {', '.join(self.CACHE_COLUMNS)} FROM tts_cache WHERE key = ?", (key,)).fetchone()
+        return dict(zip(self.CACHE_COLUMNS, row)) if row else None
+
+    def cache_touch(self, key, now):
+        self.connection().execute("UPDATE tts_cache SET last_access = ? WHERE key = ?", (now, key))
+
+    def cache_delete(self, key):
+        self.connection().execute("DELETE FROM tts_cache WHERE key = ?", (key,))
+
+    def cache_delete_path(self, path):
+        self.connection().execute("DELETE FROM tts_cache WHERE path = ?", (path,))
+
+    def cache_put(self, entry, max_bytes, max_entries):
+        """
+        Insert or replace an entry and evict least recently used entries beyond the limits.
+
+        Returns:
+            A tuple (paths_to_delete, entries, total_bytes).
+        """
+        with self.transaction() as conn:
+            old = conn.execute("SELECT path FROM tts_cache WHERE key = ?", (entry["key"],)).fetchone()
+            conn.execute(
+                f"INSERT OR REPLACE INTO tts_cache ({', '.join(self.CACHE_COLUMNS)}) VALUES ({', '.join('?' * len(self.CACHE_COLUMNS))})",
+                tuple(entry.get(c) for c in self.CACHE_COLUMNS)
+            )
+            victims = [old[0]] if old and old[0] != entry["path"] else []
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tts_cache").fetchone()
+            if count > max_entries or total > max_bytes:
+                evicted = []
+                for key, path, size in conn.execute("SELECT key, path, size FROM tts_cache WHERE key != ? ORDER BY last_access", (entry["key"],)):
+                    if count <= max_entries and total <= max_bytes:
+                        break
+                    evicted.append(key)
+                    victims.append(path)
+                    count -= 1
+                    total -= size
+                conn.executemany("DELETE FROM tts_cache WHERE key = ?", [(k,) for k in evicted])
+        return victims, count, total
+
+    def cache_entries(self):
+        """All entries, least recently used first."""
+        rows = self.connection().execute(f"SELECT {', '.join(self.CACHE_COLUMNS)} FROM tts_cache ORDER BY last_access").fetchall()
+        return [dict(zip(self.CACHE_COLUMNS, row)) for row in rows]
+
+    def cache_totals(self):
+        return tuple(self.connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tts_cache").fetchone())
+
+    # Catalog snapshots
+    def catalog_get(self, key):
+        """Return (raw JSON text, fetched_at, invalidated_at), or None."""
+        row = self.connection().execute("SELECT data, fetched_at, invalidated_at FROM catalog WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def catalog_put(self, key, raw, fetched_at):
+        """Store a catalog snapshot unless a newer one or a later invalidation is already recorded."""
+        self.connection().execute(
+            "INSERT INTO catalog (key, data, fetched_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, fetched_at = excluded.fetched_at "
+            "WHERE excluded.fetched_at > catalog.fetched_at AND excluded.fetched_at > catalog.invalidated_at",
+            (key, raw, fetched_at)
+        )
+
+    def catalog_invalidate(self, key, now):
+        self.connection().execute(
+            "INSERT INTO catalog (key, data, invalidated_at) VALUES (?, NULL, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = NULL, invalidated_at = excluded.invalidated_at",
+            (key, now)
+        )
+
+    # Rate limiting
+    def take_tokens(self, name, want, rate, burst):
+        """
+        Take up to `want` whole tokens from the shared token bucket `name`.
+
+        Returns:
+            A tuple (granted, seconds_until_next_token), the latter 0 when tokens were granted.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_bucket WHERE name = ?", (name,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            granted = min(want, int(tokens))
+            tokens -= granted
+            conn.execute("INSERT OR REPLACE INTO rate_bucket (name, tokens, updated_at) VALUES (?, ?, ?)", (name, tokens, now))
+        return granted, (0.0 if granted else (1.0 - tokens) / rate)
+
+    # Output directory pins
+    def output_touch(self, path, size, now, pinned_until):
+        """Record that a file was written or returned; pins only ever move forward."""
+        self.connection().execute(
+            "INSERT INTO output_files (path, size, last_access, pinned_until) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET last_access = MAX(last_access, excluded.last_access), "
+            "pinned_until = MAX(pinned_until, excluded.pinned_until)",
+            (path, size, now, pinned_until)
+        )
+
+    def output_files(self):
+        """Return {path: (last_access, pinned_until)} for every recorded file."""
+        return {row[0]: (row[1], row[2]) for row in self.connection().execute("SELECT path, last_access, pinned_until FROM output_files")}
+
+    def output_forget(self, paths):
+        self.connection().executemany("DELETE FROM output_files WHERE path = ?", [(p,) for p in paths])
+
+    def output_claim(self, paths, now):
+        """
+        Atomically take files for deletion: paths pinned by any worker are left alone.
+
+        Returns:
+            The paths that may be deleted; their rows are removed.
+        """
+        if not paths:
+            return []
+        with self.transaction() as conn:
+            pinned = set()
+            for i in range(0, len(paths), 500):
+                batch = paths[i:i + 500]
+                pinned.update(row[0] for row in conn.execute(
+                    f"SELECT path FROM output_files WHERE pinned_until > ? AND path IN ({', '.join('?' * len(batch))})",
+                    (now, *batch)
+                ))
+            claimed = [p for p in paths if p not in pinned]
+            conn.executemany("DELETE FROM output_files WHERE path = ?", [(p,) for p in claimed])
+        return claimed
+
+shared_state = None  # opened by init_resources() when MCP_SHARED_STATE_PATH is set
+
+class SharedOutputStore(OutputStore):
+    """
+    OutputStore whose pins and last access times live in the SharedState database, so the
+    collector (worker 0) sees files that every worker wrote or returned. Each pass merges the
+    shared records into the directory scan, and files are claimed in a transaction that skips
+    anything pinned before they are deleted. Pins are committed before touch() returns;
+    forget() only drops the local record, the shared row goes when the file is claimed.
+    """
+
+    def __init__(self, state, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.state = state
+
+    def register(self, path, size):
+        super().register(path, size)
+        record = self.files.get(path)
+        if record is not None:
+            submit_io(self.state.output_touch, path, size, record[2], record[3])
+
+    async def touch(self, path):
+        await super().touch(path)
+        now = time.time()
+        record = self.files.get(path)
+        await run_io(self.state.output_touch, path, record[0] if record else 0, now, now + self.min_retention)
+
+    def _scan(self):
+        started = time.time()
+        found, partials = super()._scan()
+        records = self.state.output_files()
+        for path, (last_access, pinned_until) in records.items():
+            record = found.get(path)
+            if record is not None:
+                record[2] = max(record[2], last_access)
+                record[3] = max(record[3], pinned_until)
+        # Rows of files that are gone; rows written during the walk may belong to new files
+        self.state.output_forget([p for p, (last_access, _) in records.items() if p not in found and last_access < started])
+        return found, partials
+
+    def _delete(self, paths):
+        claimed = set(self.state.output_claim([p for p in paths if not p.endswith(".part")], time.time()))
+        return super()._delete([p for p in paths if p in claimed or p.endswith(".part")])
+
+    def remove_file(self, path):
+        if self.state.output_claim([path], time.time()):
+            unlink_quietly(path)
+
+# --- TTS Result Cache ---
+def tts_cache_key(model, payload, variant=None):
+    """
+    Content-addressed key for a synthesis request.
+
+    The key is the SHA-256 of the canonical JSON of the model plus the full
+    get_speech payload, so any parameter change produces a different entry.
+    `variant` holds local processing options (e.g. long-form stitching) that
+    change the output without being part of the upstream payload.
+    """
+    key_data = {"model": model, "payload": payload}
+    if variant:
+        key_data["variant"] = variant
+    canonical = json.dumps(key_data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def in_default_output_dir(path):
+    """True if path is under the default output directory, the only place the TTS cache deletes files from."""
+    return os.path.abspath(path).startswith(os.path.abspath(default_output_dir()) + os.sep)
+
+def place_cached_file(path, save_dir):
+    """
+    Make a cached file available in save_dir: the cached path itself when it already lives
+    there, otherwise a hard link (or a copy across filesystems) under a new name, so a hit
+    never hands out a file in another caller's output_dir. Blocking; returns the path.
+    """
+    default = os.path.abspath(save_dir) == os.path.abspath(default_output_dir())
+    if in_default_output_dir(path) if default else os.path.dirname(os.path.abspath(path)) == os.path.abspath(save_dir):
+        return path
+    filename = f"tts_{uuid.uuid4().hex}{os.path.splitext(path)[1]}"
+    if output_store is not None and output_store.manages(save_dir):
+        file_path = output_store.path_for(filename)
+    else:
+        file_path = os.path.join(save_dir, filename)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    try:
+        os.link(path, file_path)
+    except OSError:
+        tmp_path = temp_path_for(file_path)
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            unlink_quietly(tmp_path)
+            raise
+    return file_path
+
+class TTSCache:
+    """
+    Persistent LRU index of synthesized audio files, bounded by total bytes and entry count.
+
+    Entries map a content key (see tts_cache_key) to the file written by ttsToWav and its
+    metadata. The index is stored as JSON next to the audio and reloaded on startup; entries
+    whose file has disappeared are dropped lazily. Evicting an entry deletes its file if it
+    is under the default output directory; files in a caller's output_dir are left alone.
+    """
+
+    def __init__(self, index_path, max_bytes, max_entries):
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> metadata dict, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._dirty = False
+        self._save_task = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load TTS cache index {self.index_path}, starting empty: {e}")
+            return
+        # Stored oldest-first, so insertion order restores the LRU order
+        for entry in raw.get("entries", []):
+            key = entry.get("key")
+            path = entry.get("path")
+            if not key or not path or not os.path.exists(path):
+                self._dirty = True
+                continue
+            self.entries[key] = entry
+            self.total_bytes += entry.get("size", 0)
+        logger.info(f"Loaded TTS cache index with {len(self.entries)} entries ({self.total_bytes} bytes)")
+        self._evict()
+
+    def save(self):
+        """Atomically write the index to disk if it changed since the last save (blocking)."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        if not self._write_index([dict(e) for e in self.entries.values()]):
+            self._dirty = True
+
+    def _write_index(self, entries):
+        tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            f = open(tmp_path, "w", encoding="utf-8")
+            try:
+                json.dump({"version": 1, "entries": entries}, f)
+            except BaseException:
+                f.close()
+                raise
+            finish_file(f, tmp_path, self.index_path)
+            return True
+        except OSError as e:
+            logger.warning(f"Failed to persist TTS cache index {self.index_path}: {e}")
+            unlink_quietly(tmp_path)
+            return False
+
+    def schedule_save(self):
+        """
+        Persist the index soon on the disk I/O pool. Changes within TTS_CACHE_SAVE_DELAY are
+        batched into one write; outside an event loop the index is saved immediately.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self):
+        while self._dirty:
+            await asyncio.sleep(TTS_CACHE_SAVE_DELAY)
+            self._dirty = False
+            if not await run_io(self._write_index, [dict(e) for e in self.entries.values()]):
+                self._dirty = True
+                return
+
+    async def lookup(self, key, count=True):
+        """
+        Return the entry for key and mark it most recently used, or None on a miss. The cached
+        file is checked on the disk I/O pool. Probes for alternative sources pass count=False
+        so hits and misses stay per request.
+        """
+        entry = self.entries.get(key)
+        if entry is not None and not await run_io(os.path.exists, entry["path"]):
+            logger.info(f"TTS cache entry {key} points to a missing file, dropping it")
+            self._remove(key, delete_file=False)
+            entry = None
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        entry["last_access"] = datetime.datetime.now().timestamp()
+        if count:
+            self.hits += 1
+        self._dirty = True
+        return entry
+
+    def put(self, key, path, size, duration, created_at, codec=None):
+        """Register a freshly written file, evict as needed and persist the index."""
+        if key in self.entries:
+            self._remove(key, delete_file=self.entries[key]["path"] != path)
+        self.entries[key] = {
+            "key": key,
+            "path": path,
+            "size": size,
+            "duration": duration,
+            "created_at": created_at,
+            "last_access": datetime.datetime.now().timestamp(),
+            "codec": codec,
+        }
+        self.total_bytes += size
+        self._dirty = True
+        self._evict()
+        self.schedule_save()
+
+    def discard_path(self, path):
+        """Drop every entry pointing at path without deleting the file."""
+        for key in [k for k, e in self.entries.items() if e["path"] == path]:
+            self._remove(key, delete_file=False)
+
+    def _remove(self, key, delete_file):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.get("size", 0)
+        self._dirty = True
+        if delete_file and not in_default_output_dir(entry["path"]):
+            return  # written to a caller's output_dir; only the index entry goes
+        if delete_file and output_store is not None and output_store.pinned(entry["path"]):
+            # Just returned to a client; the output store deletes it once the pin expires
+            return
+        if delete_file:
+            if output_store is not None:
+                output_store.forget(entry["path"])
+            submit_io(unlink_quietly, entry["path"])
+
+    def _evict(self):
+        while self.entries and (self.total_bytes > self.max_bytes or len(self.entries) > self.max_entries):
+            key = next(iter(self.entries))
+            logger.info(f"Evicting TTS cache entry {key} ({self.entries[key]['path']})")
+            self._remove(key, delete_file=True)
+            self.evictions += 1
+
+    def size(self):
+        """(entries, bytes) currently indexed."""
+        return len(self.entries), self.total_bytes
+
+    async def snapshot(self):
+        """Copies of all entries, least recently used first."""
+        return [dict(e) for e in self.entries.values()]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else None,
+            "index_path": self.index_path,
+        }
+
+class SharedTTSCache:
+    """
+    TTS cache index kept in the SharedState database, so a phrase synthesized by one worker
+    is a cache hit in all of them. Same interface as TTSCache.
+
+    Lookups run on the disk I/O pool. Writes (with LRU eviction) are queued there, and entries
+    still waiting to be written are served from memory. Hit/miss counters are per worker.
+    """
+
+    def __init__(self, state, max_bytes, max_entries):
+        self.state = state
+        self.index_path = state.path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pending = {}  # key -> entry not yet committed
+        self._totals = state.cache_totals()
+
+    def _lookup(self, key):
+        entry = self.state.cache_get(key)
+        if entry is not None and not os.path.exists(entry["path"]):
+            logger.info(f"TTS cache entry {key} points to a missing file, dropping it")
+            self.state.cache_delete(key)
+            return None
+        if entry is not None:
+            entry["last_access"] = time.time()
+            self.state.cache_touch(key, entry["last_access"])
+        return entry
+
+    def _count(self, entry):
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def lookup(self, key, count=True):
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = await run_io(self._lookup, key)
+        return self._count(entry) if count else entry
+
+    def put(self, key, path, size, duration, created_at, codec=None):
+        entry = {"key": key, "path": path, "size": size, "duration": duration, "created_at": created_at,
+                 "last_access": time.time(), "codec": codec}
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._put_done(key, entry, self.state.cache_put(entry, self.max_bytes, self.max_entries))
+            return
+        self._pending[key] = entry
+        future = get_io_executor().submit(self.state.cache_put, entry, self.max_bytes, self.max_entries)
+
+        def done(f):
+            try:
+                result = f.result()
+            except Exception as e:
+                logger.warning(f"Failed to store TTS cache entry {key} in {self.index_path}: {e}")
+                result = None
+            loop.call_soon_threadsafe(self._put_done, key, entry, result)
+
+        future.add_done_callback(done)
+
+    def _put_done(self, key, entry, result):
+        if self._pending.get(key) is entry:
+            del self._pending[key]
+        if result is None:
+            return
+        victims, count, total = result
+        self._totals = (count, total)
+        for path in victims:
+            self.evictions += 1
+            if not in_default_output_dir(path):
+                continue  # written to a caller's output_dir; only the index entry goes
+            if output_store is not None and output_store.pinned(path):
+                continue  # just returned to a client; the output store deletes it later
+            logger.info(f"Evicting TTS cache file {path}")
+            if output_store is not None:
+                output_store.forget(path)
+                submit_io(output_store.remove_file, path)
+            else:
+                submit_io(unlink_quietly, path)
+
+    def discard_path(self, path):
+        """Drop every entry pointing at path without deleting the file."""
+        for key in [k for k, e in self._pending.items() if e["path"] == path]:
+            del self._pending[key]
+        submit_io(self.state.cache_delete_path, path)
+
+    def save(self):
+        pass  # every change is committed to the database
+
+    def schedule_save(self):
+        pass
+
+    def size(self):
+        """(entries, bytes) as of this worker's last write."""
+        return self._totals
+
+    async def snapshot(self):
+        """Copies of all entries, including writes still queued."""
+        entries = await run_io(self.state.cache_entries)
+        stored = {e["key"] for e in entries}
+        return entries + [dict(e) for k, e in self._pending.items() if k not in stored]
+
+    def stats(self):
+        count, total = self._totals = self.state.cache_totals()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "backend": "sqlite",
+            "entries": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else None,
+            "index_path": self.index_path,
+        }
+
+tts_cache = None  # loaded by init_resources() when TTS_CACHE_ENABLED
+
+# --- Cache archives ---
+CACHE_ARCHIVE_MANIFEST = "manifest.json"
+CACHE_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+CACHE_ARCHIVE_PROBE_BYTES = 4096
+
+def write_cache_archive(archive_path, entries):
+    """
+    Write TTS cache entries and their audio to a tar archive (gzip-compressed for .gz/.tgz).
+    Blocking; run it on a worker thread. Returns (entries written, audio bytes).
+    """
+    import tarfile
+    mode = "w:gz" if archive_path.endswith((".gz", ".tgz")) else "w"
+    manifest = []
+    total = 0
+    with tarfile.open(archive_path, mode) as tar:
+        for entry in entries:
+            extension = os.path.splitext(entry["path"])[1]
+            name = f"audio/{entry['key']}{extension if extension in AUDIO_MIME_TYPES else '.wav'}"
+            try:
+                tar.add(entry["path"], arcname=name)
+            except FileNotFoundError:
+                continue  # evicted or collected since the snapshot
+            manifest.append({k: entry.get(k) for k in ("key", "size", "duration", "created_at", "codec")} | {"file": name})
+            total += entry["size"]
+        data = json.dumps({"version": 1, "entries": manifest}).encode("utf-8")
+        info = tarfile.TarInfo(CACHE_ARCHIVE_MANIFEST)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(data))
+    return len(manifest), total
+
+def read_cache_archive(archive_path, save_dir, skip_keys):
+    """
+    Extract the audio of a cache archive into save_dir, validating each file against the
+    manifest. Blocking; run it on a worker thread.
+
+    Returns:
+        A tuple (entries, skipped, rejected): metadata dicts with the extracted "path" for
+        entries not in skip_keys, the number skipped and the number of invalid entries.
+    """
+    import tarfile
+    extracted = []
+    skipped = rejected = 0
+    with tarfile.open(archive_path, "r:*") as tar:
+        try:
+            manifest = json.load(tar.extractfile(CACHE_ARCHIVE_MANIFEST))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{archive_path} is not a TTS cache archive: {e}")
+        for item in manifest.get("entries", []):
+            key = item.get("key")
+            if not isinstance(key, str) or not CACHE_KEY_PATTERN.match(key):
+                rejected += 1
+                continue
+            if key in skip_keys:
+                skipped += 1
+                continue
+            try:
+                member = tar.getmember(item.get("file"))
+            except KeyError:
+                member = None
+            if member is None or not member.isfile() or member.size != item.get("size"):
+                logger.warning(f"Skipping cache archive entry {key}: audio missing or size mismatch")
+                rejected += 1
+                continue
+            source = tar.extractfile(member)
+            head = source.read(CACHE_ARCHIVE_PROBE_BYTES)
+            try:
+                codec = probe_audio_header(head)
+            except AudioValidationError as e:
+                logger.warning(f"Skipping cache archive entry {key}: {e}")
+                rejected += 1
+                continue
+            extension = ".flac" if codec == "flac" else ".wav"
+            if os.path.splitext(member.name)[1] != extension or item.get("codec") not in (None, codec):
+                logger.warning(f"Skipping cache archive entry {key}: {codec} audio does not match the manifest")
+                rejected += 1
+                continue
+            filename = f"tts_{uuid.uuid4().hex}{extension}"
+            file_path = output_store.path_for(filename) if output_store is not None and output_store.manages(save_dir) else os.path.join(save_dir, filename)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = temp_path_for(file_path)
+            f = open(tmp_path, "wb")
+            try:
+                f.write(head)
+                shutil.copyfileobj(source, f, DISK_WRITE_BUFFER)
+            except BaseException:
+                f.close()
+                unlink_quietly(tmp_path)
+                raise
+            finish_file(f, tmp_path, file_path)
+            extracted.append(dict(item, path=file_path, codec=codec))
+    return extracted, skipped, rejected
+
+async def export_tts_cache(archive_path, paths=None):
+    """Export the TTS cache (or only the entries for the given files) to archive_path."""
+    entries = await tts_cache.snapshot()
+    if paths is not None:
+        wanted = set(paths)
+        entries = [e for e in entries if e["path"] in wanted]
+    return await run_io(write_cache_archive, archive_path, entries)
+
+async def import_tts_cache(archive_path):
+    """
+    Import a cache archive written by export_tts_cache, so a new node starts warm without
+    calling the API. Entries already cached are kept. Returns (imported, skipped, rejected).
+    """
+    existing = {e["key"] for e in await tts_cache.snapshot()}
+    save_dir = default_output_dir()
+    entries, skipped, rejected = await run_io(read_cache_archive, archive_path, save_dir, existing)
+    for entry in entries:
+        tts_cache.put(entry["key"], entry["path"], entry["size"], entry.get("duration"), entry.get("created_at"), codec=entry["codec"])
+        if output_store is not None:
+            output_store.register(entry["path"], entry["size"])
+    return len(entries), skipped, rejected
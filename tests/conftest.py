@@ -0,0 +1,50 @@
+"""Shared fixtures: a mock Waves API in place of the real upstream, and an isolated output directory."""
+import io
+import wave
+
+import httpx
+import numpy as np
+import pytest
+
+import admission
+import config
+import storage
+import waves
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    Route Waves API calls to a handler. Call the fixture with a function taking an
+    httpx.Request and returning an httpx.Response (sync or async); the circuit breaker and
+    admission scheduler are replaced with fresh ones and hedging is turned off.
+    """
+    def install(handler, max_concurrency=8):
+        monkeypatch.setattr(waves, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(waves, "circuit_breaker", waves.CircuitBreaker(5, 30))
+        monkeypatch.setattr(admission, "waves_scheduler", admission.WavesScheduler(max_concurrency, 100, 0, 1))
+        monkeypatch.setattr(waves, "WAVES_HEDGE_DELAY", 0)
+        monkeypatch.setattr(waves, "WAVES_RETRY_BASE_DELAY", 0.001)
+    return install
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Point the default output directory at tmp_path, with a fresh output store and TTS cache."""
+    index_path = str(tmp_path / ".tts_cache_index.json")
+    monkeypatch.setattr(config, "MCP_BASE_PATH", str(tmp_path))
+    monkeypatch.setattr(storage, "TTS_CACHE_INDEX_PATH", index_path)
+    monkeypatch.setattr(storage, "output_store", storage.OutputStore(str(tmp_path), 0, 0, 600, 2))
+    monkeypatch.setattr(storage, "tts_cache", storage.TTSCache(index_path, 10**9, 1000))
+    return tmp_path
+
+@pytest.fixture
+def make_wav():
+    """Build a 16-bit mono PCM WAV file: make_wav(n_frames, rate) -> bytes."""
+    def build(n_frames=2400, rate=24000):
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes((np.sin(np.arange(n_frames) / 10.0) * 8000).astype("<i2").tobytes())
+        return buf.getvalue()
+    return build
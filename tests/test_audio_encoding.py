@@ -0,0 +1,177 @@
+"""FLAC and G.711 encoders: FLAC streams are decoded bit by bit and checked against the input and its MD5."""
+import hashlib
+import struct
+
+import numpy as np
+import pytest
+
+import audio
+
+# --- Minimal FLAC decoder (the subset encode_flac writes: STREAMINFO, fixed predictors, Rice residuals) ---
+FIXED_COEFFICIENTS = {0: [], 1: [1], 2: [2, -1], 3: [3, -3, 1], 4: [4, -6, 4, -1]}
+
+class BitReader:
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.pos = offset * 8
+
+    def unsigned(self, n):
+        value = 0
+        for _ in range(n):
+            value = (value << 1) | ((self.data[self.pos >> 3] >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def signed(self, n):
+        value = self.unsigned(n)
+        return value - (1 << n) if n and value >> (n - 1) else value
+
+    def unary(self):
+        count = 0
+        while self.unsigned(1) == 0:
+            count += 1
+        return count
+
+    def align(self):
+        self.pos = (self.pos + 7) & ~7
+
+def decode_subframe(r, bps, block_size):
+    assert r.unsigned(1) == 0
+    kind = r.unsigned(6)
+    assert r.unsigned(1) == 0  # no wasted bits
+    if kind == 0:
+        return [r.signed(bps)] * block_size
+    if kind == 1:
+        return [r.signed(bps) for _ in range(block_size)]
+    assert 8 <= kind <= 12, f"unexpected subframe type {kind}"
+    order = kind - 8
+    samples = [r.signed(bps) for _ in range(order)]
+    assert r.unsigned(2) == 1  # Rice coding with 5-bit parameters
+    partition_order = r.unsigned(4)
+    residual = []
+    for partition in range(1 << partition_order):
+        k = r.unsigned(5)
+        for _ in range((block_size >> partition_order) - (order if partition == 0 else 0)):
+            folded = (r.unary() << k) | r.unsigned(k)
+            residual.append((folded >> 1) ^ -(folded & 1))
+    coefficients = FIXED_COEFFICIENTS[order]
+    for e in residual:
+        samples.append(e + sum(c * samples[-1 - i] for i, c in enumerate(coefficients)))
+    return samples
+
+def decode_flac(data):
+    """Decode a FLAC stream, checking frame CRCs and the STREAMINFO MD5. Returns (sample_rate, bps, frames)."""
+    assert data[:4] == b"fLaC"
+    r = BitReader(data, 4)
+    assert r.unsigned(1) == 1 and r.unsigned(7) == 0 and r.unsigned(24) == 34  # last block, STREAMINFO
+    r.unsigned(16), r.unsigned(16), r.unsigned(24), r.unsigned(24)
+    sample_rate = r.unsigned(20)
+    channels = r.unsigned(3) + 1
+    bps = r.unsigned(5) + 1
+    total = r.unsigned(36)
+    md5 = bytes(r.unsigned(8) for _ in range(16))
+    blocks = []
+    while r.pos // 8 < len(data):
+        start = r.pos // 8
+        assert r.unsigned(14) == 0x3FFE
+        r.unsigned(2)
+        size_code = r.unsigned(4)
+        r.unsigned(4), r.unsigned(4), r.unsigned(3), r.unsigned(1)
+        lead = r.unsigned(8)
+        length = 0
+        while (lead << length) & 0x80:
+            length += 1
+        for _ in range(max(0, length - 1)):
+            r.unsigned(8)
+        if size_code == 0b1100:
+            block_size = 4096
+        else:
+            assert size_code == 0b0111
+            block_size = r.unsigned(16) + 1
+        assert r.unsigned(8) == audio.flac_crc8(data[start:r.pos // 8 - 1])
+        block = [decode_subframe(r, bps, block_size) for _ in range(channels)]
+        r.align()
+        assert r.unsigned(16) == audio.flac_crc16(data[start:r.pos // 8 - 2])
+        blocks.append(np.array(block, dtype=np.int64).T)
+    frames = np.concatenate(blocks)
+    assert len(frames) == total
+    assert hashlib.md5(frames.astype("<i1" if bps == 8 else "<i2").tobytes()).digest() == md5
+    return sample_rate, bps, frames
+
+def speech_like(n_frames, channels, seed=0):
+    """Sum of tones with noise, 16-bit, shaped (n_frames, channels)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_frames)[:, None] / 24000.0
+    signal = 8000 * np.sin(2 * np.pi * 220 * t) + 3000 * np.sin(2 * np.pi * 1870 * t + np.arange(channels))
+    return np.clip(signal + rng.normal(0, 500, (n_frames, channels)), -32768, 32767).astype(np.int16)
+
+@pytest.mark.parametrize("n_frames,channels", [(10000, 1), (4096, 2), (5, 1), (4097, 1)])
+def test_flac_round_trip_16_bit(n_frames, channels):
+    frames = speech_like(n_frames, channels)
+    sample_rate, bps, decoded = decode_flac(audio.encode_flac(frames, 24000, 16))
+    assert (sample_rate, bps) == (24000, 16)
+    np.testing.assert_array_equal(decoded, frames)
+
+def test_flac_round_trip_edge_signals():
+    rng = np.random.default_rng(1)
+    frames = np.concatenate([
+        np.zeros((4096, 1)),                                 # constant subframe
+        rng.integers(-32768, 32768, (4096, 1)),              # white noise at full scale
+        np.tile([[32767], [-32768]], (2048, 1)),             # largest residuals
+    ]).astype(np.int16)
+    _, _, decoded = decode_flac(audio.encode_flac(frames, 8000, 16))
+    np.testing.assert_array_equal(decoded, frames)
+
+def test_flac_through_encode_audio_8_bit():
+    frames = (speech_like(3000, 1).astype(np.int64) // 256 + 128).astype(np.uint8)
+    data = audio.encode_audio(frames, 16000, 1, "flac")
+    assert audio.probe_audio_header(data[:64]) == "flac"
+    _, bps, decoded = decode_flac(data)
+    assert bps == 8
+    np.testing.assert_array_equal(decoded, frames.astype(np.int64) - 128)
+
+def test_flac_rejects_24_bit():
+    with pytest.raises(audio.AudioValidationError):
+        audio.encode_audio(np.zeros((10, 1), dtype=np.int32), 24000, 3, "flac")
+
+# --- G.711 ---
+# Reference codes from the ITU-T G.711 reference coder (as in CPython's audioop)
+G711_LINEAR = [0, 1, -1, 8, -8, 100, -100, 1000, -1000, 4096, -4096, 8031, -8031, 16384, -16384, 32767, -32768]
+MULAW_CODES = [0xFF, 0xFF, 0x7E, 0xFE, 0x7E, 0xF2, 0x72, 0xCE, 0x4E, 0xAF, 0x2F, 0xA0, 0x20, 0x8F, 0x0F, 0x80, 0x00]
+ALAW_CODES = [0xD5, 0xD5, 0x55, 0xD5, 0x55, 0xD3, 0x53, 0xFA, 0x7A, 0x85, 0x1A, 0x8A, 0x0A, 0xA5, 0x3A, 0xAA, 0x2A]
+
+def decode_mulaw(code):
+    code = ~code & 0xFF
+    magnitude = ((((code & 0x0F) << 3) + 0x84) << ((code & 0x70) >> 4)) - 0x84
+    return -magnitude if code & 0x80 else magnitude
+
+def decode_alaw(code):
+    code ^= 0x55
+    segment = (code & 0x70) >> 4
+    magnitude = (code & 0x0F) << 4
+    magnitude = magnitude + 8 if segment == 0 else (magnitude + 0x108) << (segment - 1)
+    return magnitude if code & 0x80 else -magnitude
+
+def test_g711_known_values():
+    linear = np.array(G711_LINEAR, dtype=np.int64)
+    assert audio.encode_mulaw(linear).tolist() == MULAW_CODES
+    assert audio.encode_alaw(linear).tolist() == ALAW_CODES
+
+@pytest.mark.parametrize("encode,decode", [(audio.encode_mulaw, decode_mulaw), (audio.encode_alaw, decode_alaw)])
+def test_g711_quantization_error(encode, decode):
+    linear = np.arange(-32768, 32768, dtype=np.int64)
+    decoded = np.array([decode(c) for c in encode(linear).tolist()])
+    assert np.all(np.diff(decoded) >= 0)  # monotonic
+    inside = np.abs(linear) < 30000  # mu-law clips just above 32000
+    error = np.abs(decoded - linear)[inside]
+    assert np.all(error <= np.maximum(np.abs(linear[inside]) // 16, 32))
+
+def test_g711_wav_header():
+    frames = speech_like(800, 1)
+    data = audio.encode_audio(frames, 8000, 2, "mulaw")
+    assert audio.probe_audio_header(data[:64]) == "mulaw"
+    tag, channels, rate, byte_rate, align, bits = struct.unpack("<HHIIHH", data[20:36])
+    assert (tag, channels, rate, byte_rate, align, bits) == (7, 1, 8000, 8000, 1, 8)
+    assert data[38:42] == b"fact" and struct.unpack("<I", data[46:50])[0] == 800
+    assert data[50:54] == b"data" and struct.unpack("<I", data[54:58])[0] == 800
+    assert data[58:] == audio.encode_mulaw(frames.astype(np.int64)).tobytes()
@@ -0,0 +1,80 @@
+"""/audio: conditional requests, byte ranges, HEAD, and refusing anything outside the output directory."""
+import os
+
+import pytest
+from starlette.testclient import TestClient
+
+import config
+import server
+
+@pytest.mark.parametrize("header,expected", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", W/"abc" , "y"', True),
+    ('"abcd"', False),
+    ('abc', False),
+])
+def test_etag_matches(header, expected):
+    assert server.etag_matches(header, '"abc"') is expected
+
+def test_weak_etags_compare_weakly():
+    assert server.etag_matches('"abc"', 'W/"abc"')
+
+@pytest.fixture
+def client(workdir):
+    audio = workdir / "tts_sample.wav"
+    audio.write_bytes(bytes(range(256)) * 4)
+    client = TestClient(server.app)
+    client.audio = audio
+    return client
+
+def test_full_download_is_cacheable(client):
+    resp = client.get("/audio/tts_sample.wav")
+    assert resp.status_code == 200
+    assert resp.content == client.audio.read_bytes()
+    assert resp.headers["content-type"] == "audio/wav"
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert resp.headers["cache-control"] == f"public, max-age={config.AUDIO_CACHE_MAX_AGE}, immutable"
+    assert resp.headers["etag"]
+
+def test_revalidation_gets_304(client):
+    etag = client.get("/audio/tts_sample.wav").headers["etag"]
+    resp = client.get("/audio/tts_sample.wav", headers={"If-None-Match": f'"other", {etag}'})
+    assert resp.status_code == 304 and resp.content == b""
+    assert resp.headers["etag"] == etag and "immutable" in resp.headers["cache-control"]
+    assert client.get("/audio/tts_sample.wav", headers={"If-None-Match": '"other"'}).status_code == 200
+
+@pytest.mark.parametrize("header,start,end", [("bytes=0-9", 0, 9), ("bytes=1000-", 1000, 1023), ("bytes=-4", 1020, 1023)])
+def test_byte_ranges(client, header, start, end):
+    resp = client.get("/audio/tts_sample.wav", headers={"Range": header})
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == f"bytes {start}-{end}/1024"
+    assert resp.content == client.audio.read_bytes()[start:end + 1]
+
+def test_unsatisfiable_range(client):
+    assert client.get("/audio/tts_sample.wav", headers={"Range": "bytes=5000-"}).status_code == 416
+
+def test_head_sends_headers_only(client):
+    resp = client.head("/audio/tts_sample.wav")
+    assert resp.status_code == 200 and resp.content == b""
+    assert resp.headers["content-length"] == "1024"
+
+@pytest.mark.parametrize("path", [
+    "/audio/tts_missing.wav",
+    "/audio/notes.wav",  # not written by this server
+    "/audio/..%2Fsecret%2Ftts_secret.wav",
+    "/audio/%2E%2E/secret/tts_secret.wav",
+    "/audio/tts_link.wav",  # a symlink pointing outside the directory
+])
+def test_only_generated_files_inside_the_directory_are_served(client, workdir, path):
+    (workdir / "notes.wav").write_bytes(b"private")
+    secret_dir = workdir.parent / "secret"
+    secret_dir.mkdir(exist_ok=True)
+    (secret_dir / "tts_secret.wav").write_bytes(b"private")
+    os.symlink(secret_dir / "tts_secret.wav", workdir / "tts_link.wav")
+    resp = client.get(path)
+    assert resp.status_code == 404
+    assert b"private" not in resp.content
@@ -0,0 +1,78 @@
+"""ttsBatch: identical items synthesized once, per-item errors, bounded concurrency and progress."""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import server
+
+@pytest.fixture
+def speech(upstream, workdir, make_wav):
+    calls = []
+    active = []
+    peak = [0]
+
+    async def handler(request):
+        body = json.loads(request.content)
+        calls.append(body)
+        active.append(body)
+        peak[0] = max(peak[0], len(active))
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            active.remove(body)
+        if body["voice_id"] == "bad":
+            return httpx.Response(400, json={"error": "unknown voice"})
+        return httpx.Response(200, content=make_wav())
+
+    upstream(handler)
+    speech.calls, speech.peak = calls, peak
+    return speech
+
+def test_identical_items_are_synthesized_once(speech):
+    items = [{"text": "hi", "voiceId": "v1"}, {"text": "bye", "voiceId": "v1"}, {"voiceId": "v1", "text": "hi"}]
+    result = asyncio.run(server.ttsBatch(items))
+    assert len(speech.calls) == 2
+    assert [entry["index"] for entry in result["content"]] == [0, 1, 2]
+    uris = [entry["resource"]["uri"] for entry in result["content"]]
+    assert uris[0] == uris[2] != uris[1]
+    assert result["meta"] == {"total": 3, "succeeded": 3, "failed": 0, "deduplicated": 1}
+
+def test_failures_stay_with_their_items(speech):
+    items = [{"text": "a", "voiceId": "v1"}, {"text": "b", "voiceId": "bad"}, "not a dict",
+             {"text": "c", "voiceId": "v1", "colour": "blue"}, {"text": "d", "voiceId": "v1"}]
+    result = asyncio.run(server.ttsBatch(items))
+    types = [entry["type"] for entry in result["content"]]
+    assert types == ["resource", "error", "error", "error", "resource"]
+    assert "Invalid batch item" in result["content"][2]["message"]
+    assert "colour" in result["content"][3]["message"]
+    assert len(speech.calls) == 3  # invalid items never reach the API
+    assert result["meta"]["succeeded"] == 2 and result["meta"]["failed"] == 3
+
+def test_concurrency_is_bounded(speech):
+    items = [{"text": str(i), "voiceId": "v1", "use_cache": False} for i in range(6)]
+    asyncio.run(server.ttsBatch(items, max_concurrency=2))
+    assert len(speech.calls) == 6 and speech.peak[0] == 2
+
+def test_progress_is_reported_per_finished_item(speech):
+    class Context:
+        reports = []
+
+        async def report_progress(self, progress, total):
+            self.reports.append((progress, total))
+
+    ctx = Context()
+    items = [{"text": "a", "voiceId": "v1"}, {"text": "a", "voiceId": "v1"}, {"text": "b", "voiceId": "v1"}, 7]
+    asyncio.run(server.ttsBatch(items, progress=True, ctx=ctx))
+    assert len(ctx.reports) == 2 and ctx.reports[-1] == (4, 4)  # one report per unique request
+
+@pytest.mark.parametrize("items", [[], "text", None])
+def test_items_must_be_a_non_empty_list(items):
+    result = asyncio.run(server.ttsBatch(items))
+    assert result["content"][0]["type"] == "error"
+
+def test_batch_size_is_limited(monkeypatch):
+    monkeypatch.setattr(server, "TTS_BATCH_MAX_ITEMS", 2)
+    result = asyncio.run(server.ttsBatch([{"text": "a", "voiceId": "v1"}] * 3))
+    assert "Batch too large" in result["content"][0]["message"]
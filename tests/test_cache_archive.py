@@ -0,0 +1,118 @@
+"""TTS cache archives: export/import round trips, and rejecting entries that do not match their manifest."""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+import config
+import storage
+
+def key(name):
+    return hashlib.sha256(name.encode()).hexdigest()
+
+@pytest.fixture
+def node(workdir, monkeypatch, tmp_path_factory):
+    """Switch the module to a fresh output directory and cache, as if on a second node."""
+    def switch():
+        root = tmp_path_factory.mktemp("node")
+        index_path = str(root / ".tts_cache_index.json")
+        monkeypatch.setattr(config, "MCP_BASE_PATH", str(root))
+        monkeypatch.setattr(storage, "output_store", storage.OutputStore(str(root), 0, 0, 600, 2))
+        monkeypatch.setattr(storage, "tts_cache", storage.TTSCache(index_path, 10**9, 1000))
+        return root
+    return switch
+
+def cache_file(directory, name, data):
+    path = os.path.join(str(directory), name)
+    with open(path, "wb") as f:
+        f.write(data)
+    storage.tts_cache.put(key(name), path, len(data), 0.1, "2026-01-01T00:00:00", codec="pcm")
+    return path
+
+def test_round_trip_to_a_new_node(workdir, node, make_wav, tmp_path_factory):
+    wavs = {"a": make_wav(2400), "b": make_wav(4800)}
+    for name, data in wavs.items():
+        cache_file(workdir, f"tts_{name}.wav", data)
+    archive = str(tmp_path_factory.mktemp("out") / "cache.tar.gz")
+    assert asyncio.run(storage.export_tts_cache(archive)) == (2, sum(map(len, wavs.values())))
+
+    root = node()
+    assert asyncio.run(storage.import_tts_cache(archive)) == (2, 0, 0)
+    for name, data in wavs.items():
+        entry = asyncio.run(storage.tts_cache.lookup(key(f"tts_{name}.wav")))
+        assert entry["path"].startswith(str(root)) and entry["codec"] == "pcm" and entry["duration"] == 0.1
+        with open(entry["path"], "rb") as f:
+            assert f.read() == data
+    assert asyncio.run(storage.import_tts_cache(archive)) == (0, 2, 0)  # already cached
+
+def test_export_of_selected_paths(workdir, make_wav, tmp_path_factory):
+    keep = cache_file(workdir, "tts_keep.wav", make_wav())
+    cache_file(workdir, "tts_skip.wav", make_wav())
+    archive = str(tmp_path_factory.mktemp("out") / "cache.tar")
+    assert asyncio.run(storage.export_tts_cache(archive, paths=[keep]))[0] == 1
+    with tarfile.open(archive) as tar:
+        assert sorted(tar.getnames()) == [f"audio/{key('tts_keep.wav')}.wav", "manifest.json"]
+
+def write_archive(path, entries, members):
+    with tarfile.open(path, "w") as tar:
+        for info, data in members:
+            tar.addfile(info, io.BytesIO(data) if data is not None else None)
+        manifest = json.dumps({"version": 1, "entries": entries}).encode()
+        info = tarfile.TarInfo("manifest.json")
+        info.size = len(manifest)
+        tar.addfile(info, io.BytesIO(manifest))
+
+def member(name, data=b"", kind=tarfile.REGTYPE, target=""):
+    info = tarfile.TarInfo(name)
+    info.type, info.linkname, info.size = kind, target, len(data) if kind == tarfile.REGTYPE else 0
+    return info, data if kind == tarfile.REGTYPE else None
+
+def test_unsafe_and_mismatched_entries_are_rejected(node, make_wav, tmp_path_factory):
+    wav = make_wav()
+    good = {"key": key("good"), "file": "audio/good.wav", "size": len(wav)}
+    entries = [
+        good,
+        {"key": key("up"), "file": "../escape.wav", "size": len(wav)},
+        {"key": key("abs"), "file": "/tmp/absolute.wav", "size": len(wav)},
+        {"key": key("link"), "file": "audio/link.wav", "size": len(wav)},
+        {"key": key("hard"), "file": "audio/hard.wav", "size": len(wav)},
+        {"key": "../../not-a-key", "file": "audio/good.wav", "size": len(wav)},
+        {"key": key("size"), "file": "audio/good.wav", "size": 1},
+        {"key": key("text"), "file": "audio/text.wav", "size": 4},
+        {"key": key("ext"), "file": "audio/ext.flac", "size": len(wav)},
+        {"key": key("codec"), "file": "audio/good.wav", "size": len(wav), "codec": "flac"},
+        {"key": key("missing"), "file": "audio/missing.wav", "size": len(wav)},
+    ]
+    members = [
+        member("audio/good.wav", wav),
+        member("../escape.wav", wav),
+        member("/tmp/absolute.wav", wav),
+        member("audio/link.wav", kind=tarfile.SYMTYPE, target="/etc/passwd"),
+        member("audio/hard.wav", kind=tarfile.LNKTYPE, target="audio/good.wav"),
+        member("audio/text.wav", b"text"),
+        member("audio/ext.flac", wav),
+    ]
+    archive = str(tmp_path_factory.mktemp("in") / "evil.tar")
+    write_archive(archive, entries, members)
+    root = node()
+    imported, skipped, rejected = asyncio.run(storage.import_tts_cache(archive))
+    # Members that are regular files are copied under fresh names in the output directory,
+    # whatever path they claim; links and anything not matching its manifest entry are refused
+    assert (imported, skipped, rejected) == (3, 0, 8)
+    assert set(storage.tts_cache.entries) == {key("good"), key("up"), key("abs")}
+    assert all(e["path"].startswith(str(root) + os.sep) for e in storage.tts_cache.entries.values())
+    assert not os.path.exists(os.path.join(str(root), "..", "escape.wav"))
+    assert not os.path.exists("/tmp/absolute.wav")
+
+def test_archives_without_a_manifest_are_refused(node, tmp_path):
+    archive = str(tmp_path / "plain.tar")
+    with tarfile.open(archive, "w") as tar:
+        info, data = member("audio/x.wav", b"RIFF")
+        tar.addfile(info, io.BytesIO(data))
+    node()
+    with pytest.raises(ValueError, match="not a TTS cache archive"):
+        asyncio.run(storage.import_tts_cache(archive))
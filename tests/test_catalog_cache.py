@@ -0,0 +1,105 @@
+"""CatalogCache: fresh hits, stale-while-revalidate, inline refetch and invalidation."""
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import config
+from catalog import CatalogCache
+
+URL = config.ENDPOINT_MODEL_GET_VOICES.format(model="lightning")
+
+@pytest.fixture
+def catalog(upstream):
+    """Each upstream fetch answers with its sequence number; set catalog.fail to answer 503."""
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        if catalog.fail:
+            return httpx.Response(503, text="unavailable")
+        return httpx.Response(200, text=f'{{"voices": [], "version": {len(calls)}}}')
+
+    upstream(handler)
+    catalog.calls, catalog.fail = calls, False
+    return catalog
+
+def age(cache, key, seconds):
+    cache._entries[key]["fetched_at"] = time.time() - seconds
+
+def version(entry):
+    return json.loads(entry["raw"])["version"]
+
+def test_fresh_entries_are_served_from_memory(catalog):
+    cache = CatalogCache(60, 60)
+
+    async def main():
+        first = await cache.get("lightning", URL)
+        second = await cache.get("lightning", URL)
+        assert second is first
+
+    asyncio.run(main())
+    assert len(catalog.calls) == 1 and (cache.hits, cache.misses) == (1, 1)
+
+def test_stale_entry_is_served_while_one_refresh_runs(catalog):
+    cache = CatalogCache(60, 60)
+
+    async def main():
+        await cache.get("lightning", URL)
+        age(cache, "lightning", 90)
+        stale = await asyncio.gather(*(cache.get("lightning", URL) for _ in range(3)))
+        assert [version(e) for e in stale] == [1, 1, 1]
+        await asyncio.sleep(0.05)
+        assert version(await cache.get("lightning", URL)) == 2
+
+    asyncio.run(main())
+    assert len(catalog.calls) == 2 and cache.stale_hits == 3
+
+def test_expired_entry_is_fetched_inline(catalog):
+    cache = CatalogCache(60, 60)
+
+    async def main():
+        await cache.get("lightning", URL)
+        age(cache, "lightning", 150)
+        assert version(await cache.get("lightning", URL)) == 2
+
+    asyncio.run(main())
+    assert cache.misses == 2 and cache.stale_hits == 0
+
+def test_failed_refresh_keeps_serving_stale_data(catalog):
+    cache = CatalogCache(60, 60)
+
+    async def main():
+        await cache.get("lightning", URL)
+        age(cache, "lightning", 90)
+        catalog.fail = True
+        await cache.get("lightning", URL)
+        await asyncio.sleep(0.1)
+        assert version(await cache.get("lightning", URL)) == 1
+
+    asyncio.run(main())
+    assert cache.refresh_errors == 1
+
+def test_invalidate_forces_a_refetch_and_drops_a_racing_refresh(catalog):
+    cache = CatalogCache(60, 60)
+
+    async def main():
+        await cache.get("lightning", URL)
+        age(cache, "lightning", 90)
+        await cache.get("lightning", URL)  # starts a background refresh
+        await asyncio.sleep(0)
+        cache.invalidate("lightning")  # e.g. a clone was created meanwhile
+        await asyncio.sleep(0.05)
+        assert "lightning" not in cache._entries  # the refresh predates the invalidation
+        assert version(await cache.get("lightning", URL)) == 3
+
+    asyncio.run(main())
+    assert len(catalog.calls) == 3
+
+def test_index_is_built_once_per_entry(catalog):
+    cache = CatalogCache(60, 60)
+    entry = asyncio.run(cache.get("lightning", URL))
+    assert cache.index(entry) is cache.index(entry)
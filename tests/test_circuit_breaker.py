@@ -0,0 +1,78 @@
+"""The Waves circuit breaker and the verdicts waves_api reports to it."""
+import asyncio
+
+import httpx
+import pytest
+
+import config
+import errors
+import waves
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = waves.CircuitBreaker(3, 60)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()  # resets the count
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats() == {"state": "open", "consecutive_failures": 3, "times_opened": 1, "rejected_calls": 1}
+
+def test_breaker_half_open_probe_success_closes():
+    breaker = waves.CircuitBreaker(1, 60)
+    breaker.record_failure()
+    breaker.opened_at -= 61
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.consecutive_failures == 0
+    assert breaker.allow() and breaker.allow()
+
+def test_breaker_half_open_probe_failure_reopens():
+    breaker = waves.CircuitBreaker(5, 60)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.opened_at -= 61
+    assert breaker.allow()
+    breaker.record_failure()  # a single failed probe is enough
+    assert breaker.state == "open" and breaker.times_opened == 2
+    assert not breaker.allow()
+
+def test_breaker_released_probe_lets_another_through():
+    breaker = waves.CircuitBreaker(1, 60)
+    breaker.record_failure()
+    breaker.opened_at -= 61
+    assert breaker.allow()
+    breaker.release_probe()  # the probe ended without a verdict (e.g. a client error)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+def half_open_call(upstream, handler):
+    """Call waves_api through a breaker that is due for its half-open probe; returns the breaker."""
+    upstream(handler)
+    breaker = waves.circuit_breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout + 1
+    with pytest.raises(errors.WavesApiError):
+        asyncio.run(waves.waves_api(config.ENDPOINT_MODEL_GET_VOICES.format(model="lightning")))
+    return breaker
+
+def test_client_error_from_upstream_closes_the_breaker(upstream):
+    breaker = half_open_call(upstream, lambda request: httpx.Response(404, text="no such model"))
+    assert breaker.state == "closed"
+
+def test_local_error_gives_no_verdict(upstream):
+    def broken(request):
+        raise ValueError("bug in request handling")
+    breaker = half_open_call(upstream, broken)
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # the probe slot was released for the next call
+
+def test_upstream_failure_reopens_the_breaker(upstream):
+    breaker = half_open_call(upstream, lambda request: httpx.Response(503))
+    assert breaker.state == "open"
@@ -0,0 +1,75 @@
+"""Clone sample upload: on-demand base64 decoding, sample validation and the streamed multipart body."""
+import asyncio
+import base64
+import io
+
+import httpx
+import pytest
+
+import audio
+import server
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 4, 100, 101, 102])
+def test_reader_matches_a_full_decode(length):
+    raw = bytes(range(256)) * 2
+    raw = raw[:length]
+    reader = audio.Base64Reader(base64.b64encode(raw).decode())
+    assert reader.seek(0, io.SEEK_END) == length
+    reader.seek(0)
+    chunks = []
+    while chunk := reader.read(7):
+        chunks.append(chunk)
+    assert b"".join(chunks) == raw
+
+def test_reader_seeks_and_reads_into_buffers():
+    raw = bytes(range(200))
+    reader = audio.Base64Reader(base64.b64encode(raw).decode())
+    reader.seek(50)
+    assert reader.read(5) == raw[50:55]
+    assert reader.seek(-10, io.SEEK_END) == 190 and reader.read() == raw[190:]
+    assert reader.read(1) == b""
+    reader.seek(-3, io.SEEK_CUR)
+    buffer = bytearray(10)
+    assert reader.readinto(buffer) == 3 and bytes(buffer[:3]) == raw[197:]
+    assert reader.seek(1000) == 200 and reader.seek(-1000) == 0
+
+def test_sample_is_validated_without_a_full_decode(make_wav):
+    wav = make_wav()
+    encoded = base64.b64encode(wav).decode()
+    wrapped = "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    reader, size = audio.open_clone_sample(wrapped)
+    assert isinstance(reader, audio.Base64Reader) and size == len(wav)
+    assert reader.read() == wav
+    reader, size = audio.open_clone_sample(wav)
+    assert size == len(wav) and reader.tell() == 0
+
+@pytest.mark.parametrize("content,message", [
+    ("not base64!", "Invalid base64"),
+    ("abc", "Invalid base64"),
+    (base64.b64encode(b"ID3 mp3 data here").decode(), "Invalid WAV"),
+    (b"RIFF\x24\x00\x00\x00WAVEfmt ", "missing fmt or data"),
+    (12345, "Unsupported file content type"),
+])
+def test_bad_samples_are_rejected(content, message):
+    with pytest.raises(ValueError, match=message):
+        audio.open_clone_sample(content)
+
+def test_size_limit_is_checked_before_decoding(monkeypatch, make_wav):
+    monkeypatch.setattr(audio, "CLONE_MAX_UPLOAD_BYTES", 100)
+    with pytest.raises(ValueError, match="File too large"):
+        audio.open_clone_sample(base64.b64encode(make_wav()).decode())
+
+def test_create_clone_streams_the_decoded_sample(upstream, make_wav):
+    wav = make_wav()
+    seen = {}
+
+    def handler(request):
+        seen["length"] = request.headers.get("content-length")
+        seen["body"] = request.read()
+        return httpx.Response(200, text='{"voiceId": "clone-1"}')
+
+    upstream(handler)
+    result = asyncio.run(server.createClone("lightning-large", "Me", {"content": base64.b64encode(wav).decode()}))
+    assert result["content"][0]["resource"]["text"] == '{"voiceId": "clone-1"}'
+    assert wav in seen["body"] and b'name="displayName"' in seen["body"]
+    assert seen["length"] == str(len(seen["body"]))  # sized up front, not chunked
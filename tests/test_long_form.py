@@ -0,0 +1,106 @@
+"""Long-form synthesis: text splitting, crossfades, and stitching chunks in order."""
+import asyncio
+import gc
+import io
+import json
+import wave
+
+import httpx
+import numpy as np
+import pytest
+
+import audio
+import config
+
+URL = config.ENDPOINT_LIGHTNING_GET_SPEECH
+
+def words(chunks):
+    return " ".join(chunks).split()
+
+def test_short_and_empty_text():
+    assert audio.split_text_for_synthesis("  Hello there.  ", 100) == ["Hello there."]
+    assert audio.split_text_for_synthesis(" \n ", 100) == []
+
+def test_sentences_are_packed_greedily():
+    text = "One two. Three four! Five six? Seven eight."
+    assert audio.split_text_for_synthesis(text, 20) == ["One two. Three four!", "Five six?", "Seven eight."]
+    assert audio.split_text_for_synthesis(text, 22) == ["One two. Three four!", "Five six? Seven eight."]
+
+def test_long_sentences_split_at_clauses_then_words():
+    text = "alpha beta gamma, delta epsilon zeta; eta theta iota kappa lambda mu nu xi omicron"
+    chunks = audio.split_text_for_synthesis(text, 20)
+    assert chunks[:2] == ["alpha beta gamma,", "delta epsilon zeta;"]
+    assert all(len(c) <= 20 for c in chunks)
+    assert words(chunks) == text.split()
+
+def test_unbreakable_runs_are_cut_at_the_limit():
+    assert audio.split_text_for_synthesis("a" * 25, 10) == ["a" * 10, "a" * 10, "a" * 5]
+
+@pytest.mark.parametrize("max_chars", [1, 7, 40, 500])
+def test_chunks_respect_the_limit_and_keep_every_word(max_chars):
+    text = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. Sed do eiusmod tempor.\n\nUt enim ad minim veniam!"
+    chunks = audio.split_text_for_synthesis(text, max_chars)
+    assert all(0 < len(c) <= max_chars for c in chunks)
+    assert "".join(words(chunks)) == "".join(text.split())
+
+def test_crossfade_ramps_from_tail_to_head():
+    tail = np.full((4, 2), 1000, dtype=np.int16)
+    head = np.full((4, 2), -1000, dtype=np.int16)
+    mixed = audio.crossfade_frames(tail, head)
+    assert mixed.dtype == np.int16
+    assert mixed[:, 0].tolist() == [1000, 500, 0, -500]
+
+def chunk_wav(value, n_frames=800, rate=8000):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(np.full(n_frames, value, dtype="<i2").tobytes())
+    return buf.getvalue()
+
+@pytest.fixture
+def chunk_server(upstream):
+    """Each chunk "N" is answered with N * 100 in every sample; earlier chunks answer last."""
+    def install(rates=None):
+        async def handler(request):
+            index = int(json.loads(request.content)["text"])
+            await asyncio.sleep(0.01 * (5 - index))
+            return httpx.Response(200, content=chunk_wav(index * 100, rate=(rates or {}).get(index, 8000)))
+        upstream(handler)
+    return install
+
+def stitch(tmp_path, chunks, **kwargs):
+    path = str(tmp_path / "long.wav")
+    size, duration = asyncio.run(audio.synthesize_long_form(URL, {"voice_id": "v1"}, chunks, path, 4, **kwargs))
+    with wave.open(path) as w:
+        samples = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2")
+    return duration, samples
+
+def test_chunks_are_stitched_in_order(chunk_server, tmp_path):
+    chunk_server()
+    duration, samples = stitch(tmp_path, ["1", "2", "3"])
+    assert duration == 0.3
+    assert samples[::800].tolist() == [100, 200, 300]
+
+def test_pause_inserts_silence(chunk_server, tmp_path):
+    chunk_server()
+    duration, samples = stitch(tmp_path, ["1", "2"], pause_ms=50)
+    assert duration == 0.25
+    assert samples[800:1200].tolist() == [0] * 400 and samples[1200] == 200
+
+def test_crossfade_overlaps_neighbours(chunk_server, tmp_path):
+    chunk_server()
+    duration, samples = stitch(tmp_path, ["1", "2", "3"], crossfade_ms=10)
+    assert duration == pytest.approx(0.28)  # two 80-frame overlaps
+    assert samples[719] == 100 and samples[800] == 200 and samples[-1] == 300
+    fade = samples[720:800]
+    assert np.all(np.diff(fade) >= 0) and 100 <= fade[0] < fade[-1] <= 200
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning")
+def test_mismatched_chunk_formats_fail_and_leave_no_file(chunk_server, tmp_path):
+    chunk_server(rates={2: 16000})
+    with pytest.raises(audio.AudioValidationError, match="chunk 2"):
+        stitch(tmp_path, ["1", "2"])
+    gc.collect()  # an unclosed wave writer would fail writing its header here
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,70 @@
+"""Stateless streamable-HTTP transport at MCP_HTTP_PATH: single and batch JSON-RPC, notifications, errors."""
+import json
+
+import pytest
+from mcp.types import INVALID_PARAMS, METHOD_NOT_FOUND
+from starlette.testclient import TestClient
+
+import config
+import server
+
+INITIALIZE = {"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+    "protocolVersion": "2025-03-26", "capabilities": {}, "clientInfo": {"name": "test", "version": "0"}}}
+CALL_STATS = {"jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {"name": "ttsCacheStats", "arguments": {}}}
+
+@pytest.fixture
+def post(workdir):
+    client = TestClient(server.app)
+
+    def send(payload, **kwargs):
+        body = payload if isinstance(payload, (bytes, str)) else json.dumps(payload)
+        headers = {"content-type": "application/json", "accept": "application/json, text/event-stream"}
+        return client.post(config.MCP_HTTP_PATH, content=body, headers=headers, **kwargs)
+    return send
+
+def test_initialize(post):
+    resp = post(INITIALIZE)
+    assert resp.status_code == 200
+    reply = resp.json()
+    assert reply["id"] == 1
+    assert reply["result"]["serverInfo"]["name"] == server.mcp.name
+
+def test_tools_call_without_initialize(post):
+    reply = post(CALL_STATS).json()
+    assert reply["id"] == 2
+    assert reply["result"]["isError"] is False
+    assert "hits" in reply["result"]["content"][0]["text"]
+
+def test_batch_answers_every_request_in_one_array(post):
+    unknown = {"jsonrpc": "2.0", "id": 3, "method": "no/such/method"}
+    notification = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+    replies = post([INITIALIZE, CALL_STATS, notification, unknown]).json()
+    by_id = {r["id"]: r for r in replies}
+    assert sorted(by_id) == [1, 2, 3]
+    assert "result" in by_id[1] and "result" in by_id[2]
+    assert by_id[3]["error"]["code"] == METHOD_NOT_FOUND
+
+def test_invalid_params_are_rejected(post):
+    reply = post({"jsonrpc": "2.0", "id": 4, "method": "tools/call", "params": {"arguments": {}}}).json()
+    assert reply["id"] == 4 and reply["error"]["code"] == INVALID_PARAMS
+
+def test_notifications_alone_are_accepted(post):
+    resp = post({"jsonrpc": "2.0", "method": "notifications/initialized"})
+    assert resp.status_code == 202 and resp.content == b""
+
+@pytest.mark.parametrize("body", [b"{not json", b'{"jsonrpc": "2.0"}', b'[{"id": 1}]'])
+def test_bad_json_is_a_parse_error(post, body):
+    resp = post(body)
+    assert resp.status_code == 400
+    assert resp.json()["error"]["code"] == -32700
+
+def test_only_json_posts_are_served(workdir):
+    client = TestClient(server.app)
+    assert client.get(config.MCP_HTTP_PATH).status_code == 405
+    resp = client.post(config.MCP_HTTP_PATH, content=b"{}", headers={"content-type": "text/plain"})
+    assert resp.status_code == 415
+
+def test_empty_batch_is_an_invalid_request(post):
+    resp = post(b"[]")
+    assert resp.status_code == 400
+    assert resp.json()["error"]["code"] == -32600
@@ -0,0 +1,29 @@
+"""Metrics: Waves API traffic is counted only while METRICS_ENABLED is set."""
+import asyncio
+
+import httpx
+import pytest
+
+import config
+import metrics
+import waves
+
+URL = config.ENDPOINT_MODEL_GET_VOICES.format(model="lightning")
+
+@pytest.fixture
+def counters(upstream, monkeypatch):
+    upstream(lambda request: httpx.Response(200, json={"voices": []}))
+    for counter in (metrics.waves_requests, metrics.waves_bytes):
+        monkeypatch.setattr(counter, "values", {})
+    return metrics.waves_requests, metrics.waves_bytes
+
+def test_requests_and_bytes_are_counted(counters):
+    requests, received = counters
+    asyncio.run(waves.waves_api(URL))
+    assert sum(requests.values.values()) == 1
+    assert sum(received.values.values()) == len(b'{"voices":[]}')
+
+def test_nothing_is_counted_when_metrics_are_disabled(counters, monkeypatch):
+    monkeypatch.setattr(waves, "METRICS_ENABLED", False)
+    asyncio.run(waves.waves_api(URL))
+    assert all(counter.values == {} for counter in counters)
@@ -0,0 +1,89 @@
+"""OutputStore: what the directory scan picks up, age and quota collection, and pins."""
+import asyncio
+import os
+import time
+
+import pytest
+
+import diskio
+import storage
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "tts_cache", None)
+    monkeypatch.setattr(storage, "TTS_CACHE_INDEX_PATH", str(tmp_path / ".tts_cache_index.json"))
+    return storage.OutputStore(str(tmp_path), 0, 0, 0, 0)
+
+def write(directory, name, size=10, age=0):
+    path = os.path.join(str(directory), name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    if age:
+        os.utime(path, (time.time() - age,) * 2)
+    return path
+
+def test_scan_only_picks_up_audio_and_partials(store, tmp_path):
+    audio = [write(tmp_path, "tts_a.wav"), write(tmp_path, "tts_b.flac")]
+    partial = write(tmp_path, ".tts_c.wav.1234.part", age=2 * store.PARTIAL_MAX_AGE)
+    write(tmp_path, ".tts_cache_index.json")
+    write(tmp_path, ".tts_cache_index.json.abcd.tmp")
+    write(tmp_path, ".shared_state.sqlite3")
+    write(tmp_path, "tts_notes.txt")
+    write(tmp_path, "user.wav")
+    found, partials = store._scan()
+    assert sorted(found) == sorted(audio)
+    assert partials == [partial]
+
+def test_index_path_is_skipped_wherever_it_is_named(store, tmp_path, monkeypatch):
+    index = write(tmp_path, "tts_index.wav")  # pathological, but must never be collected
+    monkeypatch.setattr(storage, "TTS_CACHE_INDEX_PATH", index)
+    found, _ = store._scan()
+    assert index not in found
+
+def test_every_pass_rescans_the_directory(store, tmp_path):
+    async def main():
+        await store.collect()
+        late = write(tmp_path, "tts_late.wav")
+        fresh_partial = write(tmp_path, ".tts_x.wav.1.part")
+        stale_partial = write(tmp_path, ".tts_y.wav.2.part", age=2 * store.PARTIAL_MAX_AGE)
+        await store.collect()
+        assert late in store.files and store.total_bytes == 10
+        assert os.path.exists(fresh_partial) and not os.path.exists(stale_partial)
+        os.unlink(late)
+        await store.collect()
+        assert store.files == {} and store.total_bytes == 0
+
+    asyncio.run(main())
+
+def test_age_and_quota_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "tts_cache", None)
+    store = storage.OutputStore(str(tmp_path), 25, 3600, 0, 0)
+    old = write(tmp_path, "tts_old.wav", age=7200)
+    lru = [write(tmp_path, f"tts_{i}.wav", age=100 - i) for i in range(3)]
+    deleted = asyncio.run(store.collect())
+    assert deleted == 2
+    assert not os.path.exists(old) and not os.path.exists(lru[0])  # expired, then least recently used
+    assert os.path.exists(lru[1]) and os.path.exists(lru[2])
+    assert store.total_bytes == 20
+
+def test_pinned_files_survive_collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "tts_cache", None)
+    store = storage.OutputStore(str(tmp_path), 5, 0, 0.2, 0)
+    path = write(tmp_path, "tts_pinned.wav", age=7200)
+    store.register(path, 10)
+    asyncio.run(store.collect())
+    assert os.path.exists(path)
+    time.sleep(0.3)  # the pin from register() and the one from the file's change time expire
+    asyncio.run(store.collect())
+    assert not os.path.exists(path)
+
+def test_background_shared_writes_log_their_failures(tmp_path, monkeypatch, caplog):
+    class BrokenState:
+        def output_touch(self, *args):
+            raise OSError("database is locked")
+
+    monkeypatch.setattr(storage, "tts_cache", None)
+    store = storage.SharedOutputStore(BrokenState(), str(tmp_path), 0, 0, 600, 0)
+    store.register(write(tmp_path, "tts_a.wav"), 10)
+    diskio.shutdown_io_executor()  # waits for the queued write
+    assert "output_touch failed: database is locked" in caplog.text
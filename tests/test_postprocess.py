@@ -0,0 +1,79 @@
+"""Post-processing stages: resampler accuracy, silence trim, loudness normalization, peak limiting."""
+import wave
+
+import numpy as np
+import pytest
+
+import audio
+
+def tone(frequency, rate, seconds, channels=1, phase=0.0):
+    t = np.arange(int(rate * seconds))[:, None] / rate
+    return 0.5 * np.sin(2 * np.pi * frequency * t + phase + np.arange(channels))
+
+def rms_db(samples):
+    return 20 * np.log10(np.sqrt(np.mean(np.square(samples))) + 1e-20)
+
+@pytest.mark.parametrize("source_rate,target_rate", [(24000, 16000), (44100, 48000), (48000, 44100), (24000, 8000), (16000, 22050)])
+def test_passband_tone_is_preserved(source_rate, target_rate):
+    samples = tone(440.0, source_rate, 0.5, channels=2)
+    out = audio.resample_poly(samples, source_rate, target_rate)
+    assert out.shape == (-(-len(samples) * target_rate // source_rate), 2)
+    expected = tone(440.0, target_rate, len(out) / target_rate, channels=2)[:len(out)]
+    edge = target_rate // 50  # filter warm-up at both ends
+    error = out[edge:-edge] - expected[edge:-edge]
+    assert rms_db(error) < -60  # about 0.1% of full scale
+
+def test_content_above_new_nyquist_is_attenuated():
+    # 6 kHz is above the 4 kHz Nyquist frequency of 8 kHz output and would alias to 2 kHz
+    out = audio.resample_poly(tone(6000.0, 24000, 0.5), 24000, 8000)
+    assert rms_db(out[200:-200]) - rms_db(tone(6000.0, 24000, 0.5)) < -60
+
+def test_same_rate_and_empty_input_pass_through():
+    samples = tone(440.0, 16000, 0.01)
+    assert audio.resample_poly(samples, 16000, 16000) is samples
+    empty = np.zeros((0, 1))
+    assert audio.resample_poly(empty, 24000, 16000) is empty
+
+def test_block_boundaries_do_not_change_output():
+    samples = tone(1000.0, 24000, 0.2, channels=1)
+    whole = audio.resample_poly(samples, 24000, 16000, block=1 << 20)
+    blocked = audio.resample_poly(samples, 24000, 16000, block=97)
+    np.testing.assert_allclose(blocked, whole, atol=1e-12)
+
+def test_trim_keeps_padding_around_speech():
+    rate = 16000
+    speech = tone(440.0, rate, 0.2)
+    samples = np.concatenate([np.zeros((rate // 2, 1)), speech, np.zeros((rate // 2, 1))])
+    out = audio.trim_silence_frames(samples, rate, -50.0, pad_ms=20.0)
+    pad = rate * 20 // 1000
+    assert abs(len(out) - (len(speech) + 2 * pad)) <= rate // 100  # within one analysis window
+    silence = np.zeros((rate, 1))
+    assert audio.trim_silence_frames(silence, rate, -50.0, 20.0) is silence
+
+def test_normalize_ignores_pauses():
+    rate = 16000
+    speech = tone(440.0, rate, 0.8) * 0.1  # two whole 400 ms measurement blocks
+    samples = np.concatenate([speech, np.zeros((rate * 2, 1)), speech])
+    out = audio.normalize_loudness(samples, rate, -20.0)
+    assert abs(rms_db(out[:len(speech)]) - -20.0) < 0.1
+
+def test_limiter_holds_the_ceiling_and_leaves_quiet_audio_alone():
+    rate = 16000
+    quiet = tone(440.0, rate, 0.1) * 0.2
+    assert audio.limit_peaks(quiet, rate, -1.0) is quiet
+    loud = tone(440.0, rate, 0.5, channels=2) * 2.0
+    out = audio.limit_peaks(loud, rate, -1.0)
+    assert np.abs(out).max() <= 10 ** (-1.0 / 20) + 1e-12
+    assert np.abs(out).max() > 0.8  # limited, not muted
+
+def test_process_audio_file_runs_every_stage(tmp_path, make_wav):
+    source = tmp_path / "in.wav"
+    source.write_bytes(make_wav(24000, rate=24000))
+    spec = {"trim_silence": {"threshold_db": -60.0, "pad_ms": 10.0}, "resample_rate": 16000,
+            "normalize_db": -18.0, "peak_limit_db": -1.0}
+    size, duration = audio.process_audio_file(str(source), str(tmp_path / "out.wav"), spec=spec)
+    with wave.open(str(tmp_path / "out.wav")) as w:
+        assert (w.getframerate(), w.getsampwidth(), w.getnchannels()) == (16000, 2, 1)
+        assert w.getnframes() == 16000
+    assert size == (tmp_path / "out.wav").stat().st_size and duration == 1.0
+    assert not list(tmp_path.glob("*.part"))
@@ -0,0 +1,182 @@
+"""Admission control: WavesScheduler limits, fair queuing and how waves_api holds its slots."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import admission
+import config
+import waves
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def hold(scheduler, tenant, order, priority="interactive", duration=0.01):
+    """Take a slot, note the tenant, keep the slot for `duration` seconds."""
+    async with scheduler.slot(tenant, priority):
+        order.append(tenant)
+        await asyncio.sleep(duration)
+
+def test_concurrency_limit_is_never_exceeded():
+    scheduler = admission.WavesScheduler(3, 100, 0, 1)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with scheduler.slot("t"):
+            peak = max(peak, scheduler.active)
+            await asyncio.sleep(0.005)
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(20)))
+
+    run(main())
+    assert peak == 3
+    assert scheduler.active == 0 and scheduler.queued == 0
+    assert scheduler.stats()["admitted"] == 20
+
+def test_full_queue_rejects_immediately():
+    scheduler = admission.WavesScheduler(1, 2, 0, 1)
+
+    async def main():
+        tasks = [asyncio.create_task(hold(scheduler, "t", [], duration=0.05)) for _ in range(3)]
+        await asyncio.sleep(0)  # one active, two queued
+        with pytest.raises(admission.AdmissionRejected) as info:
+            await scheduler.acquire("t")
+        await asyncio.gather(*tasks)
+        return info.value
+
+    error = run(main())
+    assert error.status_code == 429
+    assert scheduler.stats()["rejected"] == 1
+
+def test_rate_limit_spaces_requests():
+    scheduler = admission.WavesScheduler(10, 100, 50, 1)  # one token, refilled every 20 ms
+    starts = []
+
+    async def request():
+        async with scheduler.slot("t"):
+            starts.append(time.monotonic())
+
+    async def main():
+        await asyncio.gather(*(request() for _ in range(6)))
+
+    run(main())
+    elapsed = starts[-1] - starts[0]
+    assert 0.09 <= elapsed < 0.5  # five refills of 20 ms after the burst token
+
+def test_busy_tenant_cannot_starve_others():
+    scheduler = admission.WavesScheduler(1, 100, 0, 1)
+    order = []
+
+    async def main():
+        tasks = [asyncio.create_task(hold(scheduler, "A", order)) for _ in range(6)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(hold(scheduler, "B", order)) for _ in range(2)]
+        await asyncio.gather(*tasks)
+
+    run(main())
+    # A's first request took the free slot; afterwards the two tenants alternate
+    assert order[:5] == ["A", "A", "B", "A", "B"]
+
+def test_tenant_weights_share_slots_proportionally():
+    scheduler = admission.WavesScheduler(1, 100, 0, 1, tenant_weights={"heavy": 3})
+    order = []
+
+    async def main():
+        await scheduler.acquire("warmup")
+        tasks = [asyncio.create_task(hold(scheduler, t, order)) for t in ["heavy"] * 6 + ["light"] * 6]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    run(main())
+    assert order[:8].count("heavy") == 6
+
+def test_interactive_requests_go_before_batch():
+    scheduler = admission.WavesScheduler(1, 100, 0, 1)
+    order = []
+
+    async def main():
+        await scheduler.acquire("warmup")
+        tasks = [asyncio.create_task(hold(scheduler, "batch", order, "batch")) for _ in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(hold(scheduler, "interactive", order)) for _ in range(2)]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    run(main())
+    assert order == ["interactive", "interactive", "batch", "batch", "batch"]
+
+def test_cancelled_waiter_gives_up_its_place():
+    scheduler = admission.WavesScheduler(1, 100, 0, 1)
+
+    async def main():
+        await scheduler.acquire("t")
+        waiter = asyncio.create_task(scheduler.acquire("t"))
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.queued == 0
+        scheduler.release()
+        await asyncio.wait_for(scheduler.acquire("t"), 1)
+        scheduler.release()
+
+    run(main())
+    assert scheduler.active == 0
+
+def test_try_acquire_only_takes_a_free_slot():
+    scheduler = admission.WavesScheduler(1, 100, 0, 1)
+
+    async def main():
+        assert scheduler.try_acquire()
+        assert not scheduler.try_acquire()  # no slot
+        waiter = asyncio.create_task(scheduler.acquire("t"))
+        await asyncio.sleep(0)
+        scheduler.release()  # hands the slot to the waiter
+        await waiter
+        assert not scheduler.try_acquire()
+        scheduler.release()
+        assert scheduler.try_acquire()
+        scheduler.release()
+
+    run(main())
+    limited = admission.WavesScheduler(5, 100, 1, 1)
+    assert limited.try_acquire()
+    assert not limited.try_acquire()  # slots free, but no rate token
+
+def test_streamed_bodies_hold_their_admission_slot(upstream):
+    downloading = peak = 0
+
+    async def slow_body():
+        nonlocal downloading, peak
+        downloading += 1
+        peak = max(peak, downloading)
+        try:
+            for _ in range(3):
+                await asyncio.sleep(0.01)
+                yield b"x" * 100
+        finally:
+            downloading -= 1
+
+    upstream(lambda request: httpx.Response(200, content=slow_body()), max_concurrency=2)
+    in_flight = waves.http_in_flight
+
+    async def download():
+        resp = await waves.waves_api(config.ENDPOINT_LIGHTNING_GET_SPEECH, "POST", json_payload={}, stream=True)
+        try:
+            return len(await resp.aread())
+        finally:
+            await resp.aclose()
+
+    async def main():
+        return await asyncio.gather(*(download() for _ in range(6)))
+
+    assert run(main()) == [300] * 6
+    assert peak == 2
+    assert admission.waves_scheduler.active == 0
+    assert waves.http_in_flight == in_flight
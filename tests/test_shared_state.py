@@ -0,0 +1,116 @@
+"""SharedState: the TTS cache, catalogs, rate limit and output pins seen by two workers through one database."""
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import catalog
+import config
+import diskio
+import storage
+
+@pytest.fixture
+def workers(workdir, monkeypatch):
+    """Two SharedState handles on one database, as two worker processes would open it."""
+    monkeypatch.setattr(storage, "output_store", None)
+    path = str(workdir / ".shared_state.sqlite3")
+    return storage.SharedState(path), storage.SharedState(path)
+
+def audio(directory, name, size=10):
+    path = os.path.join(str(directory), name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+def test_cache_entries_are_hits_in_every_worker(workers, workdir):
+    a, b = (storage.SharedTTSCache(state, 10**6, 10) for state in workers)
+    path = audio(workdir, "tts_a.wav")
+    a.put("k", path, 10, 1.0, "now", codec="pcm")
+    entry = asyncio.run(b.lookup("k"))
+    assert entry["path"] == path and entry["codec"] == "pcm"
+    assert (b.hits, b.misses) == (1, 0)
+    assert b.stats()["entries"] == 1 and b.stats()["bytes"] == 10
+
+def test_eviction_follows_access_across_workers(workers, workdir):
+    a, b = (storage.SharedTTSCache(state, 10**6, 2) for state in workers)
+    paths = {key: audio(workdir, f"tts_{key}.wav") for key in "xyz"}
+    a.put("x", paths["x"], 10, 1.0, "now")
+    a.put("y", paths["y"], 10, 1.0, "now")
+    asyncio.run(b.lookup("x"))  # another worker used x, so y is now least recently used
+    a.put("z", paths["z"], 10, 1.0, "now")
+    diskio.shutdown_io_executor()  # waits for the queued unlink
+    assert [e["key"] for e in workers[1].cache_entries()] == ["x", "z"]
+    assert not os.path.exists(paths["y"]) and a.evictions == 1
+
+def test_pending_writes_are_served_from_memory(workers, workdir):
+    cache = storage.SharedTTSCache(workers[0], 10**6, 10)
+    path = audio(workdir, "tts_a.wav")
+
+    async def main():
+        cache.put("k", path, 10, 1.0, "now")
+        assert (await cache.lookup("k"))["path"] == path  # before the write has committed
+        await asyncio.sleep(0.05)
+        assert cache._pending == {}
+
+    asyncio.run(main())
+    assert workers[1].cache_get("k")["path"] == path
+
+def test_entries_without_a_file_are_dropped(workers, workdir):
+    a, b = (storage.SharedTTSCache(state, 10**6, 10) for state in workers)
+    path = audio(workdir, "tts_a.wav")
+    a.put("k", path, 10, 1.0, "now")
+    os.unlink(path)
+    assert asyncio.run(b.lookup("k")) is None
+    assert workers[0].cache_get("k") is None
+
+def test_catalogs_are_shared_and_invalidated_across_workers(workers, upstream):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, text=f'{{"version": {len(calls)}}}')
+
+    upstream(handler)
+    url = config.ENDPOINT_MODEL_GET_VOICES.format(model="lightning")
+    a, b = (catalog.CatalogCache(60, 60, shared=state) for state in workers)
+
+    async def main():
+        await a.get("lightning", url)
+        diskio.shutdown_io_executor()  # the snapshot is published in the background
+        assert (await b.get("lightning", url))["raw"] == '{"version": 1}'
+        a.invalidate("lightning")
+        diskio.shutdown_io_executor()
+        assert (await b.get("lightning", url))["raw"] == '{"version": 2}'
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+def test_catalog_snapshots_older_than_an_invalidation_are_ignored(workers):
+    a, b = workers
+    a.catalog_invalidate("k", 100.0)
+    b.catalog_put("k", "old", 99.0)
+    assert a.catalog_get("k") == (None, 0, 100.0)
+    b.catalog_put("k", "new", 101.0)
+    b.catalog_put("k", "older", 100.5)
+    assert a.catalog_get("k")[0] == "new"
+
+def test_rate_limit_bucket_is_shared(workers):
+    a, b = workers
+    assert a.take_tokens("waves", 2, 1.0, 3) == (2, 0.0)
+    granted, _ = b.take_tokens("waves", 2, 1.0, 3)
+    assert granted == 1
+    granted, wait = a.take_tokens("waves", 1, 1.0, 3)
+    assert granted == 0 and 0 < wait <= 1.0
+
+def test_a_pin_from_one_worker_protects_the_file_from_the_collector(workers, workdir):
+    collector = storage.SharedOutputStore(workers[0], str(workdir), 1, 0, 0, 0)
+    other = storage.SharedOutputStore(workers[1], str(workdir), 1, 0, 600, 0)
+    pinned, loose = audio(workdir, "tts_pinned.wav"), audio(workdir, "tts_loose.wav")
+
+    async def main():
+        await other.touch(pinned)
+        await collector.collect()
+
+    asyncio.run(main())
+    assert os.path.exists(pinned) and not os.path.exists(loose)
@@ -0,0 +1,108 @@
+"""SingleFlight: concurrent identical calls share one operation, and waiters can leave safely."""
+import asyncio
+import gc
+
+import httpx
+import pytest
+
+import config
+import waves
+
+def test_concurrent_calls_share_one_operation():
+    flight = waves.SingleFlight()
+    runs = []
+
+    async def fetch():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "body"
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        assert [r for r, _ in results] == ["body"] * 5
+        assert sorted(c for _, c in results) == [False] + [True] * 4
+        await flight.do("k", fetch)  # finished keys are not cached
+
+    asyncio.run(main())
+    assert len(runs) == 2
+    assert flight.stats() == {"in_flight": 0, "started": 2, "coalesced": 4}
+
+def test_different_keys_run_separately():
+    flight = waves.SingleFlight()
+
+    async def main():
+        return await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0, "a")), flight.do("b", lambda: asyncio.sleep(0, "b")))
+
+    assert [r for r, _ in asyncio.run(main())] == ["a", "b"]
+    assert flight.coalesced == 0
+
+def test_errors_reach_every_waiter():
+    flight = waves.SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(main())] == ["upstream down"] * 3
+    assert flight.stats()["in_flight"] == 0
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flight = waves.SingleFlight()
+    release = None
+
+    async def fetch():
+        await release.wait()
+        return "body"
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.create_task(flight.do("k", fetch))
+        second = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == ("body", True)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+
+def test_abandoned_failure_is_not_reported_as_unretrieved(caplog):
+    flight = waves.SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("nobody is listening")
+
+    async def main():
+        waiter = asyncio.create_task(flight.do("k", fail))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    gc.collect()
+    assert flight.stats()["in_flight"] == 0
+    assert "never retrieved" not in caplog.text
+
+def test_catalog_gets_share_one_request(upstream):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, text='{"voices": []}')
+
+    upstream(handler)
+    url = config.ENDPOINT_MODEL_GET_VOICES.format(model="lightning")
+
+    async def main():
+        return await asyncio.gather(*(waves.waves_get_text(url) for _ in range(4)))
+
+    assert asyncio.run(main()) == ['{"voices": []}'] * 4
+    assert len(calls) == 1
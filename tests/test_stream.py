@@ -0,0 +1,69 @@
+"""Live streaming: the /stream/tts route and the URLs ttsStreamUrl hands out."""
+import asyncio
+import json
+import struct
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+import server
+
+@pytest.fixture
+def client(upstream, workdir, make_wav):
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        return httpx.Response(200, content=make_wav(4800), headers={"content-type": "audio/wav"})
+
+    upstream(handler)
+    client = TestClient(server.app)
+    client.calls = calls
+    return client
+
+def test_stream_relays_wav_and_caches_it(client, make_wav):
+    resp = client.get("/stream/tts", params={"text": "hello", "voiceId": "v1"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "audio/wav"
+    assert resp.headers["cache-control"] == "no-store"
+    body = resp.content
+    assert body[:4] == b"RIFF" and body[8:12] == b"WAVE"
+    assert struct.unpack("<I", body[24:28])[0] == 24000
+    assert body.endswith(make_wav(4800)[44:])  # the PCM data, unchanged
+
+    again = client.post("/stream/tts", json={"text": "hello", "voiceId": "v1"})
+    assert again.status_code == 200 and again.headers["content-type"] == "audio/wav"
+    assert len(client.calls) == 1  # served from the cache
+    assert client.calls[0]["output_format"] == "wav"
+
+@pytest.mark.parametrize("params", [
+    {"voiceId": "v1"},
+    {"text": "hi", "voiceId": "v1", "speed": "fast"},
+    {"text": "hi", "voiceId": "v1", "colour": "blue"},
+    {"text": "hi", "voiceId": "v1", "outputFormat": "mp3"},
+])
+def test_stream_rejects_bad_parameters(client, params):
+    resp = client.get("/stream/tts", params=params)
+    assert resp.status_code == 400
+    assert "error" in resp.json()
+    assert client.calls == []
+
+def test_stream_reports_upstream_errors(upstream, workdir):
+    upstream(lambda request: httpx.Response(401, text="bad key"))
+    resp = TestClient(server.app).get("/stream/tts", params={"text": "hi", "voiceId": "v1"})
+    assert resp.status_code == 502
+    assert resp.json()["status"] == 401
+
+def test_stream_url_round_trips_parameters():
+    result = asyncio.run(server.ttsStreamUrl("hello there", "v1", speed=1.5))
+    resource = result["content"][0]["resource"]
+    url = httpx.URL(resource["uri"])
+    assert url.path == "/stream/tts"
+    assert url.params["text"] == "hello there" and url.params["speed"] == "1.5"
+    assert resource["mimeType"] == "audio/wav"
+
+def test_stream_url_refuses_text_too_long_for_a_url():
+    result = asyncio.run(server.ttsStreamUrl("word " * 3000, "v1"))
+    assert result["content"][0]["type"] == "error"
+    assert "ttsToWav" in result["content"][0]["message"]
@@ -0,0 +1,95 @@
+"""TTSCache: LRU eviction by entries and bytes, index persistence, and where hits are placed."""
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+
+import diskio
+import server
+import storage
+
+@pytest.fixture
+def cache(workdir, monkeypatch):
+    monkeypatch.setattr(storage, "output_store", None)
+    return storage.TTSCache(str(workdir / ".tts_cache_index.json"), 100, 3)
+
+def audio(directory, name, size=10):
+    path = os.path.join(str(directory), name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+def put(cache, directory, key, size=10):
+    path = audio(directory, f"tts_{key}.wav", size)
+    cache.put(key, path, size, 1.0, 0.0)
+    return path
+
+def test_least_recently_used_entry_is_evicted_with_its_file(cache, workdir):
+    paths = {key: put(cache, workdir, key) for key in "abc"}
+    assert asyncio.run(cache.lookup("a")) is not None  # a is now the most recently used
+    put(cache, workdir, "d")
+    diskio.shutdown_io_executor()  # waits for the queued unlink
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert not os.path.exists(paths["b"]) and os.path.exists(paths["a"])
+    assert cache.evictions == 1
+
+def test_byte_bound(cache, workdir):
+    put(cache, workdir, "a", size=60)
+    put(cache, workdir, "b", size=50)
+    assert list(cache.entries) == ["b"] and cache.total_bytes == 50
+
+def test_files_outside_the_default_directory_are_kept_on_eviction(cache, workdir, tmp_path_factory):
+    elsewhere = tmp_path_factory.mktemp("caller")
+    kept = put(cache, elsewhere, "a")
+    for key in "bcd":
+        put(cache, workdir, key)
+    diskio.shutdown_io_executor()
+    assert "a" not in cache.entries and os.path.exists(kept)
+
+def test_missing_file_is_a_miss_and_drops_the_entry(cache, workdir):
+    os.unlink(put(cache, workdir, "a"))
+    assert asyncio.run(cache.lookup("a")) is None
+    assert "a" not in cache.entries
+    assert (cache.hits, cache.misses) == (0, 1)
+
+def test_index_round_trips_in_lru_order(cache, workdir):
+    for key in "abc":
+        put(cache, workdir, key)
+    asyncio.run(cache.lookup("a"))
+    cache.save()
+    os.unlink(cache.entries["b"]["path"])
+    reloaded = storage.TTSCache(cache.index_path, 100, 3)
+    assert list(reloaded.entries) == ["c", "a"]  # b's file is gone
+    assert reloaded.total_bytes == 20
+    with open(cache.index_path, encoding="utf-8") as f:
+        assert json.load(f)["version"] == 1
+
+def test_hit_in_the_default_directory_is_served_in_place(cache, workdir):
+    path = put(cache, workdir, "a")
+    assert storage.place_cached_file(path, str(workdir)) == path
+
+def test_hit_for_another_directory_gets_its_own_file(cache, workdir, tmp_path_factory):
+    path = put(cache, workdir, "a")
+    caller = tmp_path_factory.mktemp("caller")
+    placed = storage.place_cached_file(path, str(caller))
+    assert os.path.dirname(placed) == str(caller) and placed != path
+    with open(placed, "rb") as f:
+        assert f.read() == b"x" * 10
+    assert os.path.exists(path)
+
+def test_tts_to_wav_serves_repeats_from_the_cache(upstream, workdir, make_wav):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, content=make_wav())
+
+    upstream(handler)
+    first = asyncio.run(server.ttsToWav("hello", "v1"))
+    second = asyncio.run(server.ttsToWav("hello", "v1"))
+    assert first["meta"]["cached"] is False and second["meta"]["cached"] is True
+    assert second["content"][0]["resource"]["uri"] == first["content"][0]["resource"]["uri"]
+    assert len(calls) == 1
+    assert asyncio.run(server.ttsToWav("hello", "v1", speed=1.5))["meta"]["cached"] is False  # a different key
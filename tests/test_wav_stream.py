@@ -0,0 +1,70 @@
+"""Streaming WAV download: incremental header parsing at any chunk boundary, and stream_wav_to_file."""
+import asyncio
+import os
+import struct
+
+import httpx
+import pytest
+
+import audio
+
+def with_chunk_before_data(wav, chunk_id=b"LIST", body=b"abc"):
+    """Insert an odd-sized chunk (padded to an even length) between 'fmt ' and 'data'."""
+    chunk = chunk_id + struct.pack("<I", len(body)) + body + b"\0" * (len(body) & 1)
+    out = wav[:36] + chunk + wav[36:]
+    return out[:4] + struct.pack("<I", len(out) - 8) + out[8:]
+
+def parse(data, step):
+    header = audio.WavHeaderParser()
+    for i in range(0, len(data), step):
+        header.feed(data[i:i + step])
+    return header
+
+@pytest.mark.parametrize("step", [1, 3, 7, 44, 45, 4096])
+def test_header_is_parsed_at_any_chunk_boundary(make_wav, step):
+    wav = with_chunk_before_data(make_wav(2400, rate=16000))
+    header = parse(wav, step)
+    assert header.done
+    assert (header.audio_format, header.channels, header.sample_rate, header.sample_width) == (1, 1, 16000, 2)
+    assert header.data_offset == 56 and header.data_size == 4800
+    assert header.duration(len(wav)) == 0.15
+
+def test_placeholder_data_size_uses_the_stream_length(make_wav):
+    wav = bytearray(make_wav(2400))
+    struct.pack_into("<I", wav, 40, 0xFFFFFFFF)
+    assert parse(bytes(wav), 100).duration(len(wav)) == 0.1
+
+@pytest.mark.parametrize("data", [b"X", b"RIFX\0\0\0\0WAVE", b"RIFF\0\0\0\0WAVX"])
+def test_non_riff_streams_are_rejected_early(data):
+    with pytest.raises(audio.AudioValidationError):
+        parse(data, 1)
+
+def test_header_search_gives_up_without_a_data_chunk(make_wav):
+    header = audio.WavHeaderParser()
+    header.feed(make_wav()[:36] + b"junk" + struct.pack("<I", 1 << 20))
+    header.feed(b"\0" * audio.WavHeaderParser.MAX_HEADER_BYTES)
+    assert header.done and header.data_offset is None and header.duration(1 << 20) is None
+
+def response(data, step):
+    async def chunks():
+        for i in range(0, len(data), step):
+            yield data[i:i + step]
+    return httpx.Response(200, content=chunks(), request=httpx.Request("POST", "http://waves.test/get_speech"))
+
+@pytest.mark.parametrize("step", [1, 5, 1000])
+def test_stream_to_file(tmp_path, make_wav, monkeypatch, step):
+    monkeypatch.setattr(audio, "TTS_STREAM_CHUNK_SIZE", 7)
+    wav = make_wav(4800)
+    path = str(tmp_path / "tts_out.wav")
+    size, duration = asyncio.run(audio.stream_wav_to_file(response(wav, step), path))
+    assert (size, duration) == (len(wav), 0.2)
+    with open(path, "rb") as f:
+        assert f.read() == wav
+    assert os.listdir(tmp_path) == ["tts_out.wav"]
+
+@pytest.mark.parametrize("data", [b"", b"RIFF", b"<html>not audio</html>"])
+def test_bad_streams_leave_no_file(tmp_path, data):
+    path = str(tmp_path / "tts_out.wav")
+    with pytest.raises(audio.AudioValidationError):
+        asyncio.run(audio.stream_wav_to_file(response(data, 3), path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,83 @@
+"""Stateless MCP streamable-HTTP transport: one server session per POST, over in-memory streams."""
+from mcp.server.session import ServerSession, InitializationState
+from mcp.types import JSONRPCMessage, JSONRPCResponse, JSONRPCError, ErrorData, ClientRequest, INTERNAL_ERROR
+from starlette.responses import JSONResponse
+import asyncio
+import anyio
+import functools
+import typing
+
+from config import STREAMABLE_HTTP_BUFFER
+
+# --- Streamable HTTP transport ---
+class StatelessServerSession(ServerSession):
+    """
+    ServerSession for a single streamable-HTTP request. Stateless servers keep nothing
+    between requests, so every request is handled as coming from an initialized client,
+    including requests batched after an initialize.
+
+    Relies on ServerSession internals (_initialization_state, _received_request) and, in
+    exchange_stateless, on Server._handle_message; the /mcp route in server.py passes
+    FastMCP._mcp_server. mcp is pinned to an exact version for that reason.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._initialization_state = InitializationState.Initialized
+
+    async def _received_request(self, responder):
+        await super()._received_request(responder)
+        self._initialization_state = InitializationState.Initialized
+
+@functools.cache
+def jsonrpc_batch_adapter():
+    """Validator for a JSON-RPC batch, built on the first batch request rather than at import."""
+    from pydantic import TypeAdapter
+    return TypeAdapter(list[JSONRPCMessage])
+
+CLIENT_REQUEST_METHODS = {
+    typing.get_args(t.model_fields["method"].annotation)[0]
+    for t in typing.get_args(ClientRequest.model_fields["root"].annotation)
+}
+
+def jsonrpc_error_message(request_id, code, message):
+    return JSONRPCMessage(JSONRPCError(jsonrpc="2.0", id=request_id, error=ErrorData(code=code, message=message)))
+
+def jsonrpc_error_response(code, message, status_code):
+    return JSONResponse({"jsonrpc": "2.0", "id": None, "error": {"code": code, "message": message}}, status_code=status_code)
+
+async def exchange_stateless(server, messages, request_ids):
+    """
+    Run one session of the low-level MCP server over in-memory streams for the given client
+    messages and yield every message it sends until each request in request_ids has been
+    answered (with an internal error for any request the session ends without answering).
+    """
+    read_writer, read_stream = anyio.create_memory_object_stream(len(messages))
+    write_stream, write_reader = anyio.create_memory_object_stream(STREAMABLE_HTTP_BUFFER)
+
+    async def run_session():
+        async with server.lifespan(server) as lifespan_context:
+            async with StatelessServerSession(read_stream, write_stream, server.create_initialization_options()) as session:
+                async with anyio.create_task_group() as tg:
+                    async for message in session.incoming_messages:
+                        tg.start_soon(server._handle_message, message, session, lifespan_context, False)
+
+    session_task = asyncio.create_task(run_session())
+    pending = set(request_ids)
+    try:
+        for message in messages:
+            read_writer.send_nowait(message)
+        async with write_reader:
+            async for message in write_reader:
+                yield message
+                if isinstance(message.root, (JSONRPCResponse, JSONRPCError)):
+                    pending.discard(message.root.id)
+                    if not pending:
+                        break
+        for request_id in request_ids:
+            if request_id in pending:
+                yield jsonrpc_error_message(request_id, INTERNAL_ERROR, "Request was not answered")
+    finally:
+        read_writer.close()
+        session_task.cancel()
+        await asyncio.gather(session_task, return_exceptions=True)
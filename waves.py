@@ -0,0 +1,485 @@
+"""Waves API client: the shared HTTP client, retries, hedging, the circuit breaker and single-flight GETs."""
+import logging
+import httpx
+import datetime
+import asyncio
+import importlib.util
+import random
+import time
+import email.utils
+
+import admission
+from config import (
+    METRICS_ENABLED, WAVES_API_KEY, WAVES_BREAKER_FAILURE_THRESHOLD, WAVES_BREAKER_RESET_TIMEOUT,
+    WAVES_CONNECT_TIMEOUT, WAVES_HEDGE_DELAY, WAVES_HTTP2, WAVES_HTTP_KEEPALIVE_EXPIRY,
+    WAVES_HTTP_MAX_CONNECTIONS, WAVES_HTTP_MAX_KEEPALIVE, WAVES_POOL_TIMEOUT, WAVES_READ_TIMEOUT,
+    WAVES_RETRY_BASE_DELAY, WAVES_RETRY_MAX_ATTEMPTS, WAVES_RETRY_MAX_DELAY, WAVES_RETRY_STATUSES,
+    WAVES_SPEECH_READ_TIMEOUT, WAVES_UPLOAD_WRITE_TIMEOUT, WAVES_WRITE_TIMEOUT
+)
+from errors import WavesApiError
+from metrics import endpoint_label, waves_bytes, waves_duration, waves_requests
+from admission import AdmissionRejected, current_tenant, waves_priority, waves_timings
+
+logger = logging.getLogger(__name__)
+
+# --- Waves HTTP client ---
+# A single httpx client is shared by all tools. It is created in the app lifespan
+# (see `lifespan` in server.py) and closed on shutdown; get_http_client() creates it lazily
+# when the tools are used outside the ASGI app.
+http_client = None
+http_in_flight = 0
+http_in_flight_peak = 0
+
+def create_http_client():
+    """Build the shared Waves client from the WAVES_HTTP_* / WAVES_*_TIMEOUT settings."""
+    http2 = WAVES_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("WAVES_HTTP2 is enabled but the 'h2' package is not installed (pip install 'httpx[http2]'); using HTTP/1.1")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=WAVES_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=WAVES_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=WAVES_HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=WAVES_CONNECT_TIMEOUT,
+        read=WAVES_READ_TIMEOUT,
+        write=WAVES_WRITE_TIMEOUT,
+        pool=WAVES_POOL_TIMEOUT,
+    )
+    logger.info(f"Creating Waves HTTP client (http2={http2}, max_connections={WAVES_HTTP_MAX_CONNECTIONS}, max_keepalive={WAVES_HTTP_MAX_KEEPALIVE})")
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+def get_http_client():
+    """Return the shared Waves client, creating it on first use."""
+    global http_client
+    if http_client is None:
+        http_client = create_http_client()
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        client, http_client = http_client, None
+        await client.aclose()
+
+def endpoint_timeout(url):
+    """Per-endpoint timeout: long reads for get_speech, long writes for add_voice uploads."""
+    if url.endswith("/get_speech"):
+        return httpx.Timeout(connect=WAVES_CONNECT_TIMEOUT, read=WAVES_SPEECH_READ_TIMEOUT, write=WAVES_WRITE_TIMEOUT, pool=WAVES_POOL_TIMEOUT)
+    if url.endswith("/add_voice"):
+        return httpx.Timeout(connect=WAVES_CONNECT_TIMEOUT, read=WAVES_READ_TIMEOUT, write=WAVES_UPLOAD_WRITE_TIMEOUT, pool=WAVES_POOL_TIMEOUT)
+    return None  # client default
+
+def http_pool_stats():
+    """Snapshot of the shared client's connection pool and in-flight Waves requests."""
+    stats = {
+        "http2": None,
+        "max_connections": WAVES_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": WAVES_HTTP_MAX_KEEPALIVE,
+        "in_flight_requests": http_in_flight,
+        "in_flight_requests_peak": http_in_flight_peak,
+        "connections": None,
+        "idle_connections": None,
+    }
+    # httpx does not expose pool state publicly; read it from the httpcore pool when available
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if pool is not None:
+        stats["http2"] = getattr(pool, "_http2", None)
+    if connections is not None:
+        stats["connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        stats["pool_utilization"] = len(connections) / WAVES_HTTP_MAX_CONNECTIONS if WAVES_HTTP_MAX_CONNECTIONS else None
+    return stats
+
+# --- Resilience: retries, hedging and circuit breaker ---
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for the Waves upstream.
+
+    After `failure_threshold` consecutive upstream failures (network errors, 429 and 5xx)
+    the circuit opens and calls fail fast for `reset_timeout` seconds. Then a single probe
+    call is let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def allow(self):
+        """Return True if a call may proceed; in half-open state only one probe is allowed at a time."""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+            logger.info("Waves circuit breaker half-open, sending a probe request")
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("Waves circuit breaker closed")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+            logger.warning(f"Waves circuit breaker opened after {self.consecutive_failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected,
+        }
+
+circuit_breaker = CircuitBreaker(WAVES_BREAKER_FAILURE_THRESHOLD, WAVES_BREAKER_RESET_TIMEOUT)
+retry_count = 0
+hedge_count = 0
+hedge_wins = 0
+hedge_skipped = 0
+
+def resilience_stats():
+    return {
+        "retries": retry_count,
+        "hedged_requests": hedge_count,
+        "hedge_wins": hedge_wins,
+        "hedges_skipped": hedge_skipped,
+        "circuit_breaker": circuit_breaker.stats(),
+    }
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+def is_upstream_failure(err):
+    """True for errors that indicate an unhealthy upstream (and are worth retrying)."""
+    return err.status_code in WAVES_RETRY_STATUSES or isinstance(err.__cause__, httpx.RequestError)
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff for the given 0-based attempt, honoring Retry-After when present."""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(WAVES_RETRY_MAX_DELAY, WAVES_RETRY_BASE_DELAY * (2 ** attempt)))
+
+def on_close(resp, callback):
+    """
+    Call callback() once when a streamed response is closed, so whatever was held for the
+    request (admission slot, in-flight count, timings) covers the body download too.
+    """
+    aclose = resp.aclose
+    called = False
+
+    async def aclose_then_callback():
+        nonlocal called
+        try:
+            await aclose()
+        finally:
+            if not called:
+                called = True
+                callback()
+
+    resp.aclose = aclose_then_callback
+    return resp
+
+async def _send_once(method, url, headers, json_payload, data, files, stream):
+    """
+    Send a single request to the Waves API, raising WavesApiError on HTTP or network errors.
+    A streamed response counts as in flight until the caller closes it.
+    """
+    global http_in_flight, http_in_flight_peak
+    client = get_http_client()
+    timeout = endpoint_timeout(url) or httpx.USE_CLIENT_DEFAULT
+    http_in_flight += 1
+    http_in_flight_peak = max(http_in_flight_peak, http_in_flight)
+    endpoint = endpoint_label(url)
+    status = "error"
+    started = time.perf_counter()
+    held = False
+
+    def finish():
+        global http_in_flight
+        http_in_flight -= 1
+        if METRICS_ENABLED:
+            waves_requests.inc(endpoint=endpoint, method=method, status=status)
+            waves_duration.observe(time.perf_counter() - started, endpoint=endpoint, method=method)
+
+    try:
+        if stream:
+            request = client.build_request(method, url, headers=headers, json=json_payload, data=data, files=files, timeout=timeout)
+            resp = await client.send(request, stream=True)
+        else:
+            resp = await client.request(method, url, headers=headers, json=json_payload, data=data, files=files, timeout=timeout)
+        logger.debug(f"Received response: {resp.status_code}")
+        status = resp.status_code
+        if METRICS_ENABLED and not stream:
+            waves_bytes.inc(len(resp.content), endpoint=endpoint, direction="received")
+
+        if not resp.is_success:
+            try:
+                error_text = await resp.aread()
+                error_text = error_text.decode('utf-8', errors='replace')
+            except Exception as decode_err:
+                error_text = f"[Could not decode error body: {decode_err}]"
+            finally:
+                await resp.aclose()
+            # Log the detailed error before raising
+            logger.error(f"Waves API Error: Status={resp.status_code}, Reason={resp.reason_phrase}, URL={url}, Response Text={error_text}")
+            raise WavesApiError(
+                f"Waves API request failed to {url}",
+                status_code=resp.status_code,
+                reason=resp.reason_phrase,
+                text=error_text,
+                retry_after=parse_retry_after(resp.headers.get("Retry-After"))
+            )
+        if stream:
+            held = True
+            return on_close(resp, finish)
+        return resp
+    except WavesApiError:
+        raise
+    except httpx.RequestError as exc:
+        logger.error(f"HTTPX RequestError while calling {url}: {exc}")
+        raise WavesApiError(f"Network error calling Waves API at {url}: {exc}") from exc
+    except Exception as exc:
+        # Catch unexpected errors during the request process
+        logger.exception(f"Unexpected error during Waves API call to {url}: {exc}")
+        raise WavesApiError(f"Unexpected error during API call to {url}") from exc
+    finally:
+        if not held:
+            finish()
+
+async def _send_hedged(send, hedge_delay, scheduler):
+    """
+    Run send() and, if it has not completed after hedge_delay seconds, a second identical
+    send(). The first successful response wins; the other request is cancelled and any
+    response it produced is closed. Fails only if both attempts fail.
+
+    The hedge needs its own admission slot and rate token from scheduler; when none is free
+    right away it is skipped, so hedging never exceeds the configured limits.
+    """
+    global hedge_count, hedge_wins, hedge_skipped
+    primary = asyncio.create_task(send())
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+    if done:
+        return primary.result()
+    if not scheduler.try_acquire():
+        hedge_skipped += 1
+        logger.debug(f"Waves request still pending after {hedge_delay}s, no admission slot free for a hedge")
+        return await primary
+    hedge_count += 1
+    logger.debug(f"Waves request still pending after {hedge_delay}s, sending hedged request")
+    hedge = asyncio.create_task(send())
+    hedge.add_done_callback(lambda _: scheduler.release())
+    pending = {primary, hedge}
+    winner = None
+    error = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and winner is None:
+                    winner = task
+                elif task.exception() is not None and error is None:
+                    error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+        for task in pending:
+            try:
+                loser = await task
+            except BaseException:
+                continue
+            await loser.aclose()
+    if winner is None:
+        raise error
+    if winner is hedge:
+        hedge_wins += 1
+    return winner.result()
+
+async def waves_api(path, method="GET", headers=None, json_payload=None, data=None, files=None, stream=False, idempotent=None):
+    """
+    Asynchronous wrapper for all Waves API calls.
+    Uses defined constants for base URL and Authorization header.
+
+    With stream=True the response body is not read: the caller iterates it
+    (e.g. resp.aiter_bytes()) and must close it with `await resp.aclose()`. The admission
+    slot is held until then, so WAVES_MAX_CONCURRENCY bounds body downloads as well.
+    Error responses are always read and closed before WavesApiError is raised.
+
+    Idempotent calls (GET and get_speech by default; override with `idempotent`) are
+    retried on network errors, 408, 429 and 5xx with jittered exponential backoff that
+    honors Retry-After. get_speech calls may be hedged (WAVES_HEDGE_DELAY). All calls go
+    through a circuit breaker that fails fast while the upstream is unhealthy.
+
+    Each attempt is admitted by waves_scheduler first (global concurrency, token-bucket
+    rate limit, per-tenant fair queuing by priority class). If the caller installed a
+    waves_timings dict, queue wait and upstream time are accumulated into it separately.
+    """
+    global retry_count
+    headers = headers.copy() if headers else {}
+    headers['Authorization'] = f'Bearer {WAVES_API_KEY}'
+    # Use path directly as it should now contain the full URL from constants
+    url = path # Assuming path is now a full URL like ENDPOINT_LIGHTNING_GET_SPEECH
+    logger.debug(f"Calling Waves API: {method} {url}")
+    if idempotent is None:
+        idempotent = method.upper() in ("GET", "HEAD") or url.endswith("/get_speech")
+    attempts = max(1, WAVES_RETRY_MAX_ATTEMPTS) if idempotent else 1
+    hedge = WAVES_HEDGE_DELAY > 0 and url.endswith("/get_speech")
+
+    async def send():
+        return await _send_once(method, url, headers, json_payload, data, files, stream)
+
+    tenant = current_tenant()
+    priority = waves_priority.get()
+    timings = waves_timings.get()
+    for attempt in range(attempts):
+        if not circuit_breaker.allow():
+            logger.warning(f"Waves circuit breaker open, failing fast for {url}")
+            raise WavesApiError(
+                f"Waves API circuit breaker is open; not calling {url}",
+                status_code=503,
+                reason="Circuit Open",
+                text="The Waves API is failing; requests are paused until it recovers.",
+                retry_after=WAVES_BREAKER_RESET_TIMEOUT
+            )
+        scheduler = admission.waves_scheduler
+        try:
+            queue_wait = await scheduler.acquire(tenant, priority)
+        except BaseException as exc:
+            circuit_breaker.release_probe()
+            if isinstance(exc, AdmissionRejected):
+                logger.warning(f"Rejected {method} {url} for tenant {tenant}: outbound queue full")
+            raise
+        upstream_start = time.monotonic()
+
+        def finish():
+            scheduler.release()
+            if timings is not None:
+                timings["queue_wait"] = timings.get("queue_wait", 0.0) + queue_wait
+                timings["upstream"] = timings.get("upstream", 0.0) + time.monotonic() - upstream_start
+
+        try:
+            held = False
+            try:
+                resp = await (_send_hedged(send, WAVES_HEDGE_DELAY, scheduler) if hedge else send())
+                if stream:
+                    # Keep the slot until the caller has read and closed the body
+                    held = True
+                    on_close(resp, finish)
+            finally:
+                if not held:
+                    finish()
+        except WavesApiError as err:
+            if not is_upstream_failure(err):
+                if err.status_code is not None:
+                    # The upstream answered (e.g. 4xx): it is healthy, the request is not
+                    circuit_breaker.record_success()
+                else:
+                    # A local error, not an answer from Waves: no verdict on its health
+                    circuit_breaker.release_probe()
+                raise
+            circuit_breaker.record_failure()
+            if attempt + 1 >= attempts:
+                raise
+            delay = backoff_delay(attempt, err.retry_after)
+            if delay > WAVES_RETRY_MAX_DELAY:
+                logger.warning(f"Retry-After of {delay:.1f}s for {url} exceeds WAVES_RETRY_MAX_DELAY, not retrying")
+                raise
+            retry_count += 1
+            logger.warning(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt + 2}/{attempts}) after: {err}")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancellation: release a half-open probe slot without judging upstream health
+            circuit_breaker.release_probe()
+            raise
+        circuit_breaker.record_success()
+        return resp
+
+# --- Single-flight request coalescing ---
+class SingleFlight:
+    """
+    Coalesces concurrent identical operations into one.
+
+    The first caller for a key starts the operation as an independent task; callers arriving
+    while it is in flight await the same task. Each waiter is shielded, so cancelling one
+    waiter never cancels the shared operation for the others. The key is forgotten as soon
+    as the operation finishes, so results are not cached beyond the in-flight window.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """Run fn() once per in-flight key. Returns (result, coalesced)."""
+        task = self._calls.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task), coalesced
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved even if every waiter went away
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "started": self.started, "coalesced": self.coalesced}
+
+single_flight = SingleFlight()
+
+async def waves_get_text(url):
+    """
+    GET a Waves JSON endpoint and return the body text undecoded, sharing one request among
+    concurrent callers. Tools forward it as is; parse it only where the structure is needed.
+    """
+    async def fetch():
+        resp = await waves_api(url)
+        return resp.text
+    result, coalesced = await single_flight.do(("GET", url, None), fetch)
+    if coalesced:
+        logger.debug(f"Coalesced GET {url} with an in-flight request")
+    return result
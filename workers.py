@@ -0,0 +1,201 @@
+"""Multi-worker mode: a router that runs server:app in several uvicorn processes and proxies requests to them."""
+import logging
+import os
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+import httpx
+import re
+import asyncio
+import sys
+import tempfile
+import shutil
+import time
+import itertools
+
+from config import WAVES_HTTP_MAX_KEEPALIVE, default_output_dir
+from audio import AudioStreamResponse
+from storage import SharedState
+
+logger = logging.getLogger(__name__)
+
+# --- Multi-worker mode ---
+class WorkerRouter:
+    """
+    Front-end ASGI app for multi-worker mode (MCP_WORKERS > 1).
+
+    Starts MCP_WORKERS copies of server:app as uvicorn processes on Unix sockets and proxies
+    HTTP to them. MCP SSE sessions are sticky: the worker that opened a session's SSE stream
+    receives all of that session's message posts (the session id is read from the stream's
+    endpoint event before it is relayed). New SSE streams go to the worker with the fewest
+    open streams, everything else round-robin. Crashed workers are restarted.
+    """
+    HOP_BY_HOP = {b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization", b"te", b"trailers", b"transfer-encoding", b"upgrade", b"host"}
+    _SESSION_ID = re.compile(rb"session_id=([0-9a-fA-F]+)")
+
+    def __init__(self, count, run_dir, sse_path, message_path):
+        self.count = count
+        self.sse_path = sse_path
+        self.message_path = message_path
+        self.sockets = [os.path.join(run_dir, f"worker-{i}.sock") for i in range(count)]
+        self.processes = [None] * count
+        self.clients = []
+        self.sessions = {}  # session id -> worker index
+        self.streams = [0] * count  # open SSE streams per worker
+        self._next = itertools.count()
+        self._supervisor = None
+
+    def spawn(self, index):
+        try:
+            os.unlink(self.sockets[index])
+        except FileNotFoundError:
+            pass
+        import subprocess
+        self.processes[index] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--uds", self.sockets[index], "--log-level", "info"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=dict(os.environ, MCP_WORKER_ID=str(index)),
+        )
+        logger.info(f"Started worker {index} (pid {self.processes[index].pid})")
+
+    async def wait_ready(self, index, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.processes[index].poll() is not None:
+                break
+            try:
+                await self.clients[index].get("/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f"Worker {index} did not start")
+
+    async def supervise(self):
+        while True:
+            await asyncio.sleep(1.0)
+            for index, process in enumerate(self.processes):
+                if process.poll() is None:
+                    continue
+                logger.error(f"Worker {index} exited with status {process.returncode}, restarting it")
+                for session_id in [s for s, i in self.sessions.items() if i == index]:
+                    del self.sessions[session_id]
+                self.spawn(index)
+                try:
+                    await self.wait_ready(index)
+                except RuntimeError as e:
+                    logger.error(str(e))
+
+    async def startup(self):
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=WAVES_HTTP_MAX_KEEPALIVE)
+        self.clients = [
+            httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path, limits=limits), base_url="http://worker", timeout=None)
+            for path in self.sockets
+        ]
+        for index in range(self.count):
+            self.spawn(index)
+        await asyncio.gather(*(self.wait_ready(index) for index in range(self.count)))
+        self._supervisor = asyncio.create_task(self.supervise())
+        logger.info(f"All {self.count} workers ready")
+
+    async def shutdown(self):
+        import subprocess
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                await asyncio.to_thread(process.wait, 10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for client in self.clients:
+            await client.aclose()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    try:
+                        await self.startup()
+                    except Exception as e:
+                        await send({"type": "lifespan.startup.failed", "message": str(e)})
+                        return
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await self.shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        request = Request(scope, receive)
+        sse = scope["path"] == self.sse_path
+        if sse:
+            index = min(range(self.count), key=lambda i: self.streams[i])
+        elif scope["path"].startswith(self.message_path):
+            index = self.sessions.get(request.query_params.get("session_id"))
+            if index is None:
+                await PlainTextResponse("Could not find session", status_code=404)(scope, receive, send)
+                return
+        else:
+            index = next(self._next) % self.count
+        response = await self.forward(index, request, sse)
+        await response(scope, receive, send)
+
+    async def forward(self, index, request, sse):
+        target = request.scope.get("raw_path", request.scope["path"].encode()).decode("latin-1")
+        if request.scope["query_string"]:
+            target += "?" + request.scope["query_string"].decode("latin-1")
+        headers = [(k, v) for k, v in request.headers.raw if k.lower() not in self.HOP_BY_HOP]
+        content = request.stream() if request.method not in ("GET", "HEAD") else None
+        try:
+            upstream = await self.clients[index].send(
+                self.clients[index].build_request(request.method, target, headers=headers, content=content),
+                stream=True
+            )
+        except httpx.TransportError as e:
+            logger.error(f"Worker {index} unavailable for {request.method} {request.url.path}: {e}")
+            return PlainTextResponse("Worker unavailable", status_code=502)
+        response = AudioStreamResponse(self.relay(index, upstream, sse), status_code=upstream.status_code)
+        response.raw_headers = [(k, v) for k, v in upstream.headers.raw if k.lower() not in self.HOP_BY_HOP]
+        return response
+
+    async def relay(self, index, upstream, sse):
+        """Relay the worker's response body; for SSE streams, record the session id first."""
+        session_id = None
+        head = b""
+        if sse:
+            self.streams[index] += 1
+        try:
+            async for chunk in upstream.aiter_raw():
+                if sse and session_id is None:
+                    head += chunk
+                    match = self._SESSION_ID.search(head)
+                    if match:
+                        session_id = match.group(1).decode()
+                        self.sessions[session_id] = index
+                        head = b""
+                yield chunk
+        finally:
+            await upstream.aclose()
+            if sse:
+                self.streams[index] -= 1
+                if session_id is not None:
+                    self.sessions.pop(session_id, None)
+
+def run_workers(count, host, port, sse_path, message_path):
+    """
+    Serve the app with `count` worker processes behind a WorkerRouter sharing one SQLite state
+    file. sse_path and message_path are the app's MCP SSE routes, which sessions stick to.
+    """
+    import uvicorn
+    os.environ.setdefault("MCP_SHARED_STATE_PATH", os.path.join(default_output_dir(), ".shared_state.sqlite3"))
+    SharedState(os.environ["MCP_SHARED_STATE_PATH"])  # create the schema once, before workers race to
+    run_dir = tempfile.mkdtemp(prefix="smallest-mcp-")
+    try:
+        uvicorn.run(WorkerRouter(count, run_dir, sse_path, message_path), host=host, port=port, log_level="info")
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)